@@ -4,19 +4,42 @@ import datetime
 import random
 import string
 import logging
-import sys
 import re
-from functools import wraps
+import json
+import base64
+import binascii
+import itertools
+from functools import wraps, partial
 from contextlib import contextmanager
 
-from flask import Flask, request, jsonify, session, send_from_directory, make_response
+import click
+from flask import Flask, Response, request, jsonify, session, send_from_directory, make_response, stream_with_context
 from flask_cors import CORS
 from flask_mail import Mail
-from ldap3 import Server, Connection, ALL, MODIFY_ADD, MODIFY_DELETE, MODIFY_REPLACE
-from ldap3.core.exceptions import LDAPException, LDAPBindError
+from ldap3 import Connection, MODIFY_REPLACE
+from ldap3.core.exceptions import LDAPException, LDAPBindError, LDAPCommunicationError
 from ldap3.utils.conv import escape_filter_chars
 from dotenv import load_dotenv
 
+from ldap_pool import LdapConnectionPool
+from ldap_servers import DomainControllerPool, parse_server_list
+from ldap_schema import SchemaSnapshot
+from search_cache import SearchCache, normalize_query
+from single_flight import FlightAbandoned, SingleFlight, SingleFlightTimeout
+from directory_index import DirectoryIndex
+from user_provisioning import (
+    NEW_USER_FIELDS,
+    add_user_with_unique_login,
+    build_user_attributes,
+    parse_new_user,
+    parse_user_batch
+)
+from notifications import DIGEST_KIND, NotificationQueue
+from group_membership import GroupMembershipWriter
+from token_cache import TokenDenylist, VerifiedTokenCache, token_digest
+from login_guard import LoginThrottle, UnknownUserCache
+from rate_limit import SqliteWindowStore
+
 # Import des fonctions d'envoi de mail et PDF (supposées déjà présentes)
 from mail_utils import (
     send_creation_email,
@@ -24,8 +47,15 @@ from mail_utils import (
     send_deferred_deletion_email,
     send_modification_email,
     send_support_email,
-    get_cn_from_dn
+    send_digest_email,
+    digest_event,
+    get_cn_from_dn,
+    MailDispatcher
 )
+from pdf_utils import get_credential_template
+from metrics import metrics, init_app as init_metrics
+from logging_setup import configure_logging, parse_levels, init_app as init_request_ids
+from group_labels import GroupLabelResolver, set_resolver
 
 # Chargement des variables d'environnement
 dotenv_path = os.getenv("DOTENV_PATH", "./.env")
@@ -37,6 +67,14 @@ CORS(app, resources={r"/*": {"origins": os.getenv("CORS_ORIGINS", "*")}}, suppor
 app.secret_key = os.getenv('SECRET_KEY', 'changeme')
 app.config['SECRET_KEY'] = app.secret_key
 
+# Mesures (durées des routes, opérations LDAP, envois SMTP, PDF) exposées sur /metrics,
+# réservée aux adresses de METRICS_ALLOWED_IPS (liste vide : toutes) ; METRICS_TRACE ajoute
+# l'en-tête Server-Timing avec le détail de chaque requête
+metrics.enabled = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+metrics.tracing = os.getenv('METRICS_TRACE', 'false').lower() == 'true'
+init_metrics(app, allowed_ips={ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+                               if ip.strip()})
+
 # Configuration Flask-Mail
 app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER')
 app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
@@ -45,16 +83,19 @@ app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER')
 mail = Mail(app)
+# Session SMTP partagée par tous les envois, fermée après inactivité
+mail_dispatcher = MailDispatcher(mail, idle_timeout=int(os.getenv('MAIL_IDLE_TIMEOUT', 30)))
 
-# Configuration du logger
-logging.basicConfig(level=logging.INFO)
+# Configuration des journaux : écriture par un thread dédié (file d'attente), format JSON
+# ou texte, secrets masqués, niveau par module (LOG_LEVELS="ldap3=WARNING,mail_utils=DEBUG")
+configure_logging(
+    level=os.getenv('LOG_LEVEL', 'INFO'),
+    json_format=os.getenv('LOG_FORMAT', 'json').lower() == 'json',
+    log_file=os.getenv('LOG_FILE') or None,
+    module_levels=parse_levels(os.getenv('LOG_LEVELS'))
+)
+init_request_ids(app)
 logger = logging.getLogger(__name__)
-handler = logging.StreamHandler(sys.stdout)
-handler.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
-logger.propagate = False
 
 # Variables d'environnement LDAP
 LDAP_SERVER = os.getenv('SERVER_IP')
@@ -64,47 +105,91 @@ LDAP_PASSWORD = os.getenv('PASSWORD')
 BASE_DN = os.getenv('BASE_DN')
 MAIL_RECIPIENT = os.getenv('MAIL_RECIPIENT')
 MAIL_SUPPORT_RECIPIENT = os.getenv('MAIL_SUPPORT_RECIPIENT')
+# Groupe requis pour se connecter (appartenance directe ou imbriquée), lu une seule fois
+LDAP_REQUIRED_GROUP_DN = os.getenv('LDAP_REQUIRED_GROUP_DN', '').strip()
+# Règle LDAP_MATCHING_RULE_IN_CHAIN de l'AD : appartenance transitive aux groupes
+LDAP_MATCHING_RULE_IN_CHAIN = '1.2.840.113556.1.4.1941'
 
 # ------------------ GESTIONNAIRES DE CONTEXTE LDAP ------------------
 
-def connect_ldap_admin():
-    try:
-        ldap_server = Server(LDAP_SERVER, port=LDAP_PORT, use_ssl=True, get_info=ALL)
-        connection = Connection(ldap_server, user=LDAP_USER, password=LDAP_PASSWORD, auto_bind=True)
-        if connection.bound:
-            logger.info("Connexion LDAP admin réussie.")
-            return connection
-        else:
-            logger.error("Échec de la connexion LDAP admin.")
-            return None
-    except LDAPException as e:
-        logger.exception(f"Erreur de connexion LDAP admin : {e}")
-        return None
+# Contrôleurs de domaine : LDAP_SERVERS (liste "hôte[:port]" séparée par des virgules), à défaut SERVER_IP.
+# Les connexions sont ouvertes sur le contrôleur disponible le plus rapide (latence mesurée)
+LDAP_RECEIVE_TIMEOUT = int(os.getenv('LDAP_RECEIVE_TIMEOUT', 30)) or None
+domain_controllers = DomainControllerPool(
+    parse_server_list(os.getenv('LDAP_SERVERS') or LDAP_SERVER, LDAP_PORT),
+    user=LDAP_USER,
+    password=LDAP_PASSWORD,
+    connect_timeout=int(os.getenv('LDAP_CONNECT_TIMEOUT', 5)),
+    receive_timeout=LDAP_RECEIVE_TIMEOUT,
+    probe_interval=int(os.getenv('LDAP_PROBE_INTERVAL', 30)),
+    alpha=float(os.getenv('LDAP_LATENCY_EWMA_ALPHA', 0.3))
+)
+domain_controllers.start()
+
+# Schéma et Root DSE lus une seule fois, conservés dans un fichier local et rafraîchis
+# en arrière-plan : les connexions ne les téléchargent plus (get_info=NONE)
+ldap_schema = SchemaSnapshot(
+    os.getenv('LDAP_SCHEMA_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ldap_schema.json')),
+    domain_controllers,
+    refresh_interval=int(os.getenv('LDAP_SCHEMA_REFRESH_INTERVAL', 86400))
+)
+ldap_schema.start()
+
+# Pool de connexions admin : objets Server partagés, connexions réutilisées
+admin_ldap_pool = LdapConnectionPool(
+    domain_controllers,
+    user=LDAP_USER,
+    password=LDAP_PASSWORD,
+    size=int(os.getenv('LDAP_POOL_SIZE', 5)),
+    idle_timeout=int(os.getenv('LDAP_POOL_IDLE_TIMEOUT', 300)),
+    check_interval=int(os.getenv('LDAP_POOL_CHECK_INTERVAL', 60)),
+    acquire_timeout=int(os.getenv('LDAP_POOL_ACQUIRE_TIMEOUT', 10)),
+    receive_timeout=LDAP_RECEIVE_TIMEOUT
+)
+
+# Pool dédié à la vérification des mots de passe à la connexion : chaque vérification
+# est un nouveau bind sur une connexion TLS déjà ouverte (mêmes contrôleurs de domaine)
+login_ldap_pool = LdapConnectionPool(
+    domain_controllers,
+    user=LDAP_USER,
+    password=LDAP_PASSWORD,
+    size=int(os.getenv('LDAP_LOGIN_POOL_SIZE', 3)),
+    idle_timeout=int(os.getenv('LDAP_POOL_IDLE_TIMEOUT', 300)),
+    check_interval=int(os.getenv('LDAP_POOL_CHECK_INTERVAL', 60)),
+    acquire_timeout=int(os.getenv('LDAP_POOL_ACQUIRE_TIMEOUT', 10)),
+    receive_timeout=LDAP_RECEIVE_TIMEOUT,
+    require_bound=False
+)
 
 def connect_user_ldap(user_email, user_password):
     try:
-        ldap_server = Server(LDAP_SERVER, port=LDAP_PORT, use_ssl=True, get_info=ALL)
-        connection = Connection(ldap_server, user=user_email, password=user_password, auto_bind=True)
+        connection = Connection(domain_controllers.server_pool(), user=user_email, password=user_password,
+                                auto_bind=True, receive_timeout=LDAP_RECEIVE_TIMEOUT)
         if connection.bound:
-            logger.info(f"Connexion LDAP réussie pour {user_email}.")
+            logger.info("Connexion LDAP réussie pour %s.", user_email)
             return connection
         else:
-            logger.error(f"Connexion LDAP échouée pour {user_email}.")
+            logger.error("Connexion LDAP échouée pour %s.", user_email)
             return None
     except LDAPException as e:
-        logger.error(f"Erreur lors de la connexion LDAP : {e}")
+        logger.error("Erreur lors de la connexion LDAP : %s", e)
         return None
 
 @contextmanager
 def ldap_admin_connection_context():
-    connection = connect_ldap_admin()
     try:
-        if connection is None:
-            raise Exception("Impossible d'établir une connexion LDAP admin")
+        connection = admin_ldap_pool.acquire()
+    except LDAPException as e:
+        logger.exception("Erreur de connexion LDAP admin : %s", e)
+        raise Exception("Impossible d'établir une connexion LDAP admin")
+    discard = False
+    try:
         yield connection
+    except LDAPCommunicationError:
+        discard = True
+        raise
     finally:
-        if connection:
-            connection.unbind()
+        admin_ldap_pool.release(connection, discard=discard)
 
 @contextmanager
 def ldap_user_connection_context(user_email, user_password):
@@ -117,6 +202,148 @@ def ldap_user_connection_context(user_email, user_password):
         if connection:
             connection.unbind()
 
+# ------------------ RECHERCHES D'AUTOCOMPLÉTION ------------------
+
+# Cache partagé des recherches /search_user, /search_manager et /search_group
+search_cache = SearchCache(
+    max_entries=int(os.getenv('SEARCH_CACHE_SIZE', 512)),
+    ttl=int(os.getenv('SEARCH_CACHE_TTL', 60))
+)
+
+SEARCH_ATTRIBUTES = ['cn']
+SEARCH_SIZE_LIMIT = int(os.getenv('SEARCH_SIZE_LIMIT', 200))
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 100))
+
+# Restriction par route : personnes pour les utilisateurs et managers, groupes pour les groupes
+SEARCH_CATEGORIES = {
+    'search_user': 'person',
+    'search_manager': 'person',
+    'search_group': 'group',
+}
+
+# Recherches identiques simultanées regroupées en une seule requête LDAP
+# (SEARCH_COALESCE_TIMEOUT : attente maximale du résultat d'une recherche en cours)
+search_flights = SingleFlight(timeout=int(os.getenv('SEARCH_COALESCE_TIMEOUT', 30)))
+
+# Index annuaire en mémoire (optionnel) : les recherches sont servies localement tant qu'il est à jour
+directory_index = None
+if os.getenv('DIRECTORY_INDEX_ENABLED', 'false').lower() == 'true':
+    directory_index = DirectoryIndex(
+        admin_ldap_pool.connection,
+        BASE_DN,
+        page_size=int(os.getenv('DIRECTORY_INDEX_PAGE_SIZE', 500)),
+        sync_interval=int(os.getenv('DIRECTORY_INDEX_SYNC_INTERVAL', 60)),
+        full_reload_interval=int(os.getenv('DIRECTORY_INDEX_FULL_RELOAD_INTERVAL', 3600)),
+        max_staleness=int(os.getenv('DIRECTORY_INDEX_MAX_STALENESS', 300))
+    )
+    directory_index.start()
+
+# Libellés des groupes affichés dans les mails, lus dans l'annuaire et mis en cache
+# (GROUP_LABELS_OVERRIDES_PATH : fichier JSON {DN: libellé} prioritaire sur l'annuaire)
+set_resolver(GroupLabelResolver(
+    admin_ldap_pool.connection if os.getenv('GROUP_LABELS_FROM_LDAP', 'true').lower() == 'true' else None,
+    os.getenv('GROUP_LABELS_BASE_DN') or BASE_DN,
+    ttl=int(os.getenv('GROUP_LABELS_TTL', 3600)),
+    overrides_path=os.getenv('GROUP_LABELS_OVERRIDES_PATH') or None
+))
+
+def _paged_directory_search(ldap_connection, endpoint, query):
+    """
+    Recherche paginée (contrôle Simple Paged Results) limitée à SEARCH_SIZE_LIMIT entrées ;
+    génère les enregistrements {'dn', 'cn'} au fil des pages reçues, dans l'ordre renvoyé
+    par le serveur (le générateur paged_search de ldap3 inverse chaque page, ce qui rendrait
+    les curseurs limit/cursor incohérents d'une page à l'autre).
+    """
+    escaped_query = escape_filter_chars(query)
+    search_filter = f"(&(objectCategory={SEARCH_CATEGORIES[endpoint]})(cn=*{escaped_query}*))"
+    cookie = None
+    while True:
+        ldap_connection.search(
+            BASE_DN,
+            search_filter,
+            attributes=SEARCH_ATTRIBUTES,
+            size_limit=SEARCH_SIZE_LIMIT,
+            paged_size=SEARCH_PAGE_SIZE,
+            paged_cookie=cookie
+        )
+        for item in list(ldap_connection.response or ()):
+            if item.get('type') != 'searchResEntry':
+                continue
+            cn = item['attributes'].get('cn', '')
+            if isinstance(cn, list):
+                cn = cn[0] if cn else ''
+            yield {'dn': item['dn'], 'cn': str(cn)}
+        controls = ldap_connection.result.get('controls') or {}
+        cookie = controls.get('1.2.840.113556.1.4.319', {}).get('value', {}).get('cookie')
+        if not cookie:
+            return
+
+def iter_directory(endpoint, query, outcome):
+    """
+    Génère les enregistrements {'dn', 'cn'} correspondant à `(cn=*query*)` : depuis l'index
+    en mémoire s'il est à jour, sinon depuis le cache partagé, sinon page par page depuis LDAP
+    (les recherches identiques simultanées partagent une seule requête LDAP).
+    Une fois la génération terminée, outcome['truncated'] indique si la limite de taille a été atteinte.
+    """
+    if directory_index is not None:
+        records = directory_index.search(query, SEARCH_CATEGORIES[endpoint])
+        if records is not None:
+            size_limit = SEARCH_SIZE_LIMIT or len(records)
+            outcome['truncated'] = len(records) > size_limit
+            yield from records[:size_limit]
+            return
+    cached = search_cache.get(endpoint, query, SEARCH_ATTRIBUTES)
+    if cached is not None:
+        records, outcome['truncated'] = cached
+        yield from records
+        return
+    # Une recherche identique déjà en cours dans ce processus : on attend son résultat
+    key = (endpoint, normalize_query(query))
+    flight, leader = search_flights.begin(key)
+    if not leader:
+        try:
+            records, outcome['truncated'] = search_flights.wait(flight)
+        except FlightAbandoned:
+            yield from iter_directory(endpoint, query, outcome)
+            return
+        yield from records
+        return
+    records = []
+    try:
+        with ldap_admin_connection_context() as ldap_connection:
+            for record in _paged_directory_search(ldap_connection, endpoint, query):
+                records.append(record)
+                yield record
+            # Code 4 = sizeLimitExceeded : résultat partiel, inutilisable pour l'affinage local
+            truncated = ldap_connection.result.get('result') == 4 or 0 < SEARCH_SIZE_LIMIT <= len(records)
+    except BaseException as e:
+        search_flights.fail(key, flight, e)
+        raise
+    search_cache.put(endpoint, query, SEARCH_ATTRIBUTES, records, truncated=truncated)
+    search_flights.complete(key, flight, (records, truncated))
+    outcome['truncated'] = truncated
+
+def search_directory(endpoint, query):
+    """
+    Variante non streamée de iter_directory : renvoie (enregistrements, tronqué).
+    """
+    outcome = {}
+    records = list(iter_directory(endpoint, query, outcome))
+    return records, outcome['truncated']
+
+def notify_directory_change(dn=None, cn=None, deleted=False):
+    """
+    Appelée après chaque écriture dans l'annuaire (création, suppression, modification)
+    pour invalider les résultats de recherche qui pourraient contenir l'objet modifié.
+    """
+    search_cache.invalidate(cn or (get_cn_from_dn(dn) if dn else None))
+    if not deleted:
+        unknown_users.clear()
+    if directory_index is not None:
+        if deleted and dn:
+            directory_index.remove(dn)
+        directory_index.request_sync()
+
 # ------------------ AUTHENTIFICATION & JWT ------------------
 
 def create_jwt_token(username):
@@ -126,19 +353,44 @@ def create_jwt_token(username):
     }
     return jwt.encode(payload, app.config['SECRET_KEY'], algorithm="HS256")
 
+# Jetons déjà vérifiés (évite une vérification HMAC complète à chaque requête)
+# et jetons révoqués par /logout (JWT_DENYLIST_PATH : liste partagée entre processus)
+token_cache = VerifiedTokenCache(max_entries=int(os.getenv('JWT_CACHE_SIZE', 1024)))
+token_denylist = TokenDenylist(
+    path=os.getenv('JWT_DENYLIST_PATH') or None,
+    sync_interval=int(os.getenv('JWT_DENYLIST_SYNC_INTERVAL', 2))
+) if os.getenv('JWT_REVOCATION_ENABLED', 'true').lower() == 'true' else None
+
+# Limitation des tentatives de connexion, appliquée avant tout échange LDAP
+# (LOGIN_RATE_LIMIT_PATH : compteurs partagés entre processus)
+login_throttle = LoginThrottle(
+    per_user=int(os.getenv('LOGIN_MAX_ATTEMPTS_PER_USER', 5)),
+    per_ip=int(os.getenv('LOGIN_MAX_ATTEMPTS_PER_IP', 30)),
+    window=int(os.getenv('LOGIN_RATE_WINDOW', 300)),
+    store=SqliteWindowStore(os.getenv('LOGIN_RATE_LIMIT_PATH')) if os.getenv('LOGIN_RATE_LIMIT_PATH') else None
+)
+# Identifiants absents de l'annuaire, refusés sans requête LDAP pendant LOGIN_UNKNOWN_USER_TTL secondes
+unknown_users = UnknownUserCache(ttl=int(os.getenv('LOGIN_UNKNOWN_USER_TTL', 60)))
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         token = request.cookies.get('authToken')
         if not token:
             return jsonify({"error": "Accès refusé, token manquant"}), 401
-        try:
-            decoded_token = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            request.user = decoded_token["sub"]
-        except jwt.ExpiredSignatureError:
-            return jsonify({"error": "Token expiré"}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({"error": "Token invalide"}), 401
+        digest = token_digest(token)
+        decoded_token = token_cache.get(digest)
+        if decoded_token is None:
+            try:
+                decoded_token = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+            except jwt.ExpiredSignatureError:
+                return jsonify({"error": "Token expiré"}), 401
+            except jwt.InvalidTokenError:
+                return jsonify({"error": "Token invalide"}), 401
+            token_cache.put(digest, decoded_token)
+        if token_denylist is not None and token_denylist.is_revoked(digest):
+            return jsonify({"error": "Token révoqué"}), 401
+        request.user = decoded_token["sub"]
         return f(*args, **kwargs)
     return decorated
 
@@ -163,8 +415,190 @@ def generate_password(length=12):
     random.shuffle(password_chars)
     return "".join(password_chars)
 
+# ------------------ CRÉATION DE COMPTES ------------------
+
+DEFAULT_GROUPS = [
+    os.getenv("DEFAULT_GROUP_1", ""),
+    os.getenv("DEFAULT_GROUP_2", "")
+]
+
+# Envois de mails hors du thread de la requête, journalisés dans un spool SQLite
+notification_queue = NotificationQueue(
+    app,
+    os.getenv('NOTIFICATION_SPOOL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'notifications_spool.sqlite3')),
+    workers=int(os.getenv('NOTIFICATION_WORKERS', 2)),
+    max_attempts=int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', 5)),
+    retry_base_delay=int(os.getenv('NOTIFICATION_RETRY_BASE_DELAY', 30)),
+    failed_retention=int(os.getenv('NOTIFICATION_FAILED_RETENTION', 7 * 86400))
+)
+
+# Mode récapitulatif : les événements listés sont regroupés par destinataire pendant
+# NOTIFICATION_DIGEST_WINDOW secondes puis envoyés en un seul mail (0 = un mail par événement)
+NOTIFICATION_DIGEST_WINDOW = int(os.getenv('NOTIFICATION_DIGEST_WINDOW', 0))
+NOTIFICATION_DIGEST_KINDS = {
+    kind.strip()
+    for kind in os.getenv('NOTIFICATION_DIGEST_KINDS', 'user_deleted,user_deletion_scheduled,user_modified').split(',')
+    if kind.strip()
+}
+
+def create_directory_user(ldap_connection, user, taken=None):
+    """
+    Crée le compte décrit par `user` (voir parse_new_user) sur la connexion fournie,
+    sans toucher aux groupes. `taken` réserve les identifiants déjà attribués dans un lot.
+    Renvoie (user_info, dn, mot de passe, groupes) ou None si l'ajout a échoué
+    (détail dans ldap_connection.result).
+    """
+    password = generate_password(12)
+    new_dn = f"CN={user['fullName']},OU={user['new_ou']},{BASE_DN}"
+
+    def build_attributes(login):
+        return build_user_attributes(
+            user['fullName'], user['firstName'], user['lastName'], login, user['domain'], password,
+            description=user['newDescription'],
+            office=user['newOffice'],
+            phone_number=user['newPhoneNumber'],
+            manager_dn=user['managerDn']
+        )
+
+    success, login_name = add_user_with_unique_login(
+        ldap_connection, BASE_DN, new_dn, user['firstName'], user['lastName'], user['loginName'],
+        build_attributes, taken=taken
+    )
+    if not success:
+        return None
+    user_info = {field: user[field] for field in NEW_USER_FIELDS}
+    user_info['loginName'] = login_name
+    all_groups = {group_dn for group_dn in user['memberOf'] + DEFAULT_GROUPS if group_dn}
+    return user_info, new_dn, password, all_groups
+
+def notify_user_created(user_info, password, all_groups):
+    """Mail de création (avec PDF des identifiants) puis mail au support."""
+    pdf_bytes = send_creation_email(mail_dispatcher, MAIL_RECIPIENT, user_info, password, all_groups)
+    send_support_email(mail_dispatcher, MAIL_SUPPORT_RECIPIENT, user_info['loginName'], pdf_bytes)
+
+def notify(kind, urgent=False, **payload):
+    """
+    Met en file le mail d'un événement, ou l'ajoute au récapitulatif de son destinataire
+    si le mode récapitulatif est actif pour ce type d'événement et que l'envoi n'est pas urgent.
+    """
+    if NOTIFICATION_DIGEST_WINDOW > 0 and not urgent and kind in NOTIFICATION_DIGEST_KINDS:
+        recipient = payload.pop('recipient')
+        notification_queue.add_to_digest(recipient, digest_event(kind, **payload), NOTIFICATION_DIGEST_WINDOW)
+    else:
+        notification_queue.submit(kind, **payload)
+
+def send_notification_digest(recipient):
+    """Envoie en un seul mail les événements accumulés pour ce destinataire."""
+    event_ids, events = notification_queue.digest_events(recipient)
+    if events:
+        send_digest_email(mail_dispatcher, recipient, events)
+    notification_queue.discard_digest_events(event_ids)
+
+notification_queue.register('user_created', notify_user_created)
+notification_queue.register('user_deleted', partial(send_deletion_email, mail_dispatcher))
+notification_queue.register('user_deletion_scheduled', partial(send_deferred_deletion_email, mail_dispatcher))
+notification_queue.register('user_modified', partial(send_modification_email, mail_dispatcher))
+notification_queue.register(DIGEST_KIND, send_notification_digest)
+notification_queue.start()
+
+def _group_report(created_rows, outcomes):
+    """Résultat des ajouts aux groupes pour chaque ligne créée : {"row", "dn", "groups": {groupe: état}}."""
+    states = {}
+    for group_dn, outcome in outcomes.items():
+        for state in ("added", "already_member", "failed"):
+            for member_dn in outcome[state]:
+                states.setdefault(member_dn.lower(), {})[group_dn] = state
+    for row_number, new_dn, all_groups in created_rows:
+        groups = states.get(new_dn.lower(), {})
+        failed = sorted(group_dn for group_dn, state in groups.items() if state == "failed")
+        yield {"row": row_number, "status": "groups_failed" if failed else "groups_ok", "dn": new_dn,
+               "groups": {group_dn: groups.get(group_dn, "failed") for group_dn in sorted(all_groups)}}
+
+def provision_users(rows):
+    """
+    Crée un lot de comptes sur une seule connexion du pool et génère un résultat par ligne.
+    Les identifiants sont dédoublonnés à l'échelle du lot, les ajouts aux groupes sont
+    regroupés en une modification par groupe en fin de lot, et les mails sont mis en file.
+
+    Les ajouts aux groupes sont appliqués même si le lot s'interrompt (erreur sur une ligne,
+    client déconnecté pendant le flux) : les comptes déjà créés ne restent pas sans groupes.
+    Le rapport se termine par une ligne par compte créé (état de chacun de ses groupes),
+    puis une ligne par groupe.
+    """
+    taken = set()
+    group_writer = GroupMembershipWriter(BASE_DN)
+    created_rows = []
+    completed = False
+    with ldap_admin_connection_context() as ldap_connection:
+        try:
+            for row_number, row in enumerate(rows, start=1):
+                try:
+                    user = parse_new_user(row)
+                except ValueError as e:
+                    yield {"row": row_number, "status": "error", "error": str(e)}
+                    continue
+                created = create_directory_user(ldap_connection, user, taken=taken)
+                if created is None:
+                    yield {"row": row_number, "status": "error", "error": "Échec de la création de l'utilisateur",
+                           "details": ldap_connection.result}
+                    continue
+                user_info, new_dn, password, all_groups = created
+                for group_dn in all_groups:
+                    group_writer.add(group_dn, new_dn)
+                created_rows.append((row_number, new_dn, all_groups))
+                notify_directory_change(new_dn, user_info['fullName'])
+                notification_queue.submit('user_created', user_info=user_info, password=password,
+                                          all_groups=sorted(all_groups))
+                yield {"row": row_number, "status": "created", "dn": new_dn,
+                       "loginName": user_info['loginName'], "password": password}
+            completed = True
+        finally:
+            if completed:
+                outcomes = group_writer.flush(ldap_connection)
+            else:
+                # Lot interrompu : pas de rapport possible (générateur fermé ou exception en
+                # cours), mais les comptes déjà créés rejoignent leurs groupes
+                outcomes = {}
+                try:
+                    outcomes = group_writer.flush(ldap_connection)
+                except Exception:
+                    logger.exception("Échec des ajouts aux groupes après interruption du lot")
+                for report in _group_report(created_rows, outcomes):
+                    if report["status"] != "groups_ok":
+                        logger.error("Lot interrompu : groupes non appliqués pour %s : %s",
+                                     report["dn"], report["groups"])
+                logger.warning("Lot interrompu après %s compte(s) créé(s), ajouts aux groupes appliqués.",
+                               len(created_rows))
+
+    yield from _group_report(created_rows, outcomes)
+    for group_dn, outcome in outcomes.items():
+        yield {"group": group_dn, **outcome}
+
 # ------------------ ROUTES FLASK ------------------
 
+def lookup_login_principal(user_principal_name):
+    """
+    Recherche le compte qui se connecte et contrôle le groupe requis (imbrication comprise)
+    en une seule requête. Renvoie (DN ou None si le compte est inconnu, autorisé).
+    """
+    upn_filter = f"(userPrincipalName={escape_filter_chars(user_principal_name)})"
+    with ldap_admin_connection_context() as ldap_connection_admin:
+        search_filter = upn_filter
+        if LDAP_REQUIRED_GROUP_DN:
+            search_filter = (f"(&{upn_filter}(memberOf:{LDAP_MATCHING_RULE_IN_CHAIN}:="
+                             f"{escape_filter_chars(LDAP_REQUIRED_GROUP_DN)}))")
+        ldap_connection_admin.search(BASE_DN, search_filter, attributes=['distinguishedName'])
+        authorized = len(ldap_connection_admin.entries) > 0
+        if not authorized and LDAP_REQUIRED_GROUP_DN:
+            # Utilisateur inconnu ou hors du groupe : on distingue les deux cas
+            ldap_connection_admin.search(BASE_DN, upn_filter, attributes=['distinguishedName'])
+        if len(ldap_connection_admin.entries) < 1:
+            return None, False
+        return str(ldap_connection_admin.entries[0].distinguishedName), authorized
+
+# Recherches de connexion simultanées pour le même identifiant regroupées en une seule
+login_flights = SingleFlight(timeout=int(os.getenv('LOGIN_COALESCE_TIMEOUT', 10)))
+
 @app.route('/login', methods=['POST'])
 def login():
     try:
@@ -174,31 +608,35 @@ def login():
         if not user_principal_name or not user_password:
             return jsonify({"error": "Nom d'utilisateur et mot de passe requis"}), 400
 
-        with ldap_admin_connection_context() as ldap_connection_admin:
-            upn_escaped = escape_filter_chars(user_principal_name)
-            search_filter = f"(userPrincipalName={upn_escaped})"
-            ldap_connection_admin.search(
-                BASE_DN,
-                search_filter,
-                attributes=['distinguishedName', 'memberof']
+        retry_after, attempt = login_throttle.acquire(user_principal_name, request.remote_addr)
+        if retry_after:
+            response = make_response(jsonify({"error": "Trop de tentatives de connexion, réessayez plus tard"}), 429)
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+        if unknown_users.contains(user_principal_name):
+            return jsonify({"error": "Identifiants invalides"}), 401
+
+        try:
+            user_dn, authorized = login_flights.do(
+                user_principal_name.lower(), partial(lookup_login_principal, user_principal_name)
             )
-            if len(ldap_connection_admin.entries) < 1:
-                return jsonify({"error": "Identifiants invalides"}), 401
-            user_entry = ldap_connection_admin.entries[0]
-            user_dn = str(user_entry.distinguishedName)
-            memberof_values = user_entry['memberof'].values if 'memberof' in user_entry else []
+        except SingleFlightTimeout:
+            logger.warning("Délai dépassé en attente de la recherche du compte %s", user_principal_name)
+            return jsonify({"error": SEARCH_TIMEOUT_MESSAGE}), 504
+        if user_dn is None:
+            unknown_users.add(user_principal_name)
+            return jsonify({"error": "Identifiants invalides"}), 401
 
         try:
-            with Connection(Server(LDAP_SERVER, use_ssl=True),
-                            user=user_dn, password=user_password, auto_bind=True):
-                pass
+            if not login_ldap_pool.verify_credentials(user_dn, user_password):
+                return jsonify({"error": "Identifiants invalides"}), 401
         except LDAPBindError:
             return jsonify({"error": "Identifiants invalides"}), 401
 
-        required_group_dn = os.getenv('LDAP_REQUIRED_GROUP_DN', '').lower().strip()
-        if required_group_dn and required_group_dn not in [g.lower().strip() for g in memberof_values]:
+        if not authorized:
             return jsonify({"error": "Vous n'êtes pas autorisé à rentrer sur cette page"}), 403
 
+        login_throttle.succeeded(user_principal_name, request.remote_addr, attempt)
         token = create_jwt_token(user_principal_name)
         response = make_response(jsonify({"message": "Connexion réussie"}))
         response.set_cookie('authToken', token, httponly=True, secure=True, samesite='Lax')
@@ -210,6 +648,16 @@ def login():
 
 @app.route('/logout', methods=['POST'])
 def logout():
+    token = request.cookies.get('authToken')
+    if token and token_denylist is not None:
+        try:
+            decoded_token = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+        except jwt.InvalidTokenError:
+            decoded_token = None
+        if decoded_token is not None:
+            digest = token_digest(token)
+            token_denylist.revoke(digest, decoded_token['exp'])
+            token_cache.discard(digest)
     response = make_response(jsonify({"message": "Déconnexion réussie"}))
     response.set_cookie('authToken', '', httponly=True, secure=True, samesite='Lax',
                         expires=0, max_age=0)
@@ -220,6 +668,69 @@ def logout():
 def check_auth():
     return jsonify({"authenticated": True, "user": request.user}), 200
 
+def _encode_cursor(offset):
+    return base64.urlsafe_b64encode(str(offset).encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor):
+    if not cursor:
+        return 0
+    offset = int(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+    if offset < 0:
+        raise ValueError("curseur négatif")
+    return offset
+
+SEARCH_TIMEOUT_MESSAGE = "L'annuaire ne répond pas, réessayez dans quelques instants"
+
+def directory_search_response(endpoint, query, formatter, wrap_key=None):
+    """
+    Construit la réponse d'une route d'autocomplétion.
+
+    Paramètres de requête optionnels :
+    - limit / cursor : pagination côté client ; le curseur suivant est renvoyé
+      dans l'en-tête X-Next-Cursor ;
+    - stream=1 : réponse NDJSON (un objet par ligne) émise au fil des pages LDAP.
+    L'en-tête X-Result-Truncated vaut "true" si SEARCH_SIZE_LIMIT a été atteint.
+    Si la recherche identique déjà en cours n'aboutit pas à temps, la réponse est une 504.
+    """
+    try:
+        limit = request.args.get('limit', type=int)
+        offset = _decode_cursor(request.args.get('cursor', ''))
+    except (ValueError, binascii.Error):
+        return jsonify({"error": "Paramètres 'limit' ou 'cursor' invalides"}), 400
+    if limit is not None and limit < 1:
+        return jsonify({"error": "Paramètres 'limit' ou 'cursor' invalides"}), 400
+    stop = offset + limit if limit is not None else None
+
+    if request.args.get('stream', '').lower() in ('1', 'true'):
+        def generate():
+            outcome = {}
+            try:
+                for record in itertools.islice(iter_directory(endpoint, query, outcome), offset, stop):
+                    yield json.dumps(formatter(record), ensure_ascii=False) + "\n"
+            except SingleFlightTimeout:
+                logger.warning("Délai dépassé en attente d'une recherche identique (%s, %r)", endpoint, query)
+                yield json.dumps({"error": SEARCH_TIMEOUT_MESSAGE}, ensure_ascii=False) + "\n"
+            except Exception as e:
+                logger.exception("Erreur lors de la recherche LDAP en streaming : %s", e)
+                yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    try:
+        records, truncated = search_directory(endpoint, query)
+    except SingleFlightTimeout:
+        # La recherche identique en cours n'a pas abouti dans SEARCH_COALESCE_TIMEOUT secondes
+        logger.warning("Délai dépassé en attente d'une recherche identique (%s, %r)", endpoint, query)
+        body = {"error": SEARCH_TIMEOUT_MESSAGE}
+        if wrap_key:
+            body[wrap_key] = []
+        return jsonify(body), 504
+    page = [formatter(record) for record in records[offset:stop]]
+    response = make_response(jsonify({wrap_key: page} if wrap_key else page), 200)
+    if stop is not None and stop < len(records):
+        response.headers['X-Next-Cursor'] = _encode_cursor(stop)
+    response.headers['X-Result-Truncated'] = 'true' if truncated else 'false'
+    return response
+
 @app.route('/search_user')
 @token_required
 def search_user():
@@ -227,18 +738,9 @@ def search_user():
     if not query:
         return jsonify([]), 200
     try:
-        with ldap_admin_connection_context() as ldap_connection:
-            escaped_query = escape_filter_chars(query)
-            search_filter = f"(cn=*{escaped_query}*)"
-            ldap_connection.search(
-                BASE_DN,
-                search_filter,
-                attributes=['distinguishedName']
-            )
-            users = [{'dn': str(entry.distinguishedName)} for entry in ldap_connection.entries]
-            return jsonify(users), 200
+        return directory_search_response('search_user', query, lambda record: {'dn': record['dn']})
     except LDAPException as e:
-        logger.exception(f"Erreur lors de la recherche LDAP : {e}")
+        logger.exception("Erreur lors de la recherche LDAP : %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/search_manager')
@@ -248,16 +750,8 @@ def search_manager():
     if not query:
         return jsonify({"managers": []}), 200
     try:
-        with ldap_admin_connection_context() as ldap_connection:
-            escaped_query = escape_filter_chars(query)
-            search_filter = f"(cn=*{escaped_query}*)"
-            ldap_connection.search(
-                BASE_DN,
-                search_filter,
-                attributes=['distinguishedName', 'cn']
-            )
-            managers = [{'dn': str(entry.distinguishedName), 'cn': str(entry.cn)} for entry in ldap_connection.entries]
-            return jsonify({"managers": managers}), 200
+        return directory_search_response('search_manager', query,
+                                         lambda record: {'dn': record['dn'], 'cn': record['cn']}, 'managers')
     except Exception as e:
         return jsonify({"error": str(e), "managers": []}), 500
 
@@ -268,131 +762,111 @@ def search_group():
     if not query:
         return jsonify({"groups": []}), 200
     try:
-        with ldap_admin_connection_context() as ldap_connection:
-            escaped_query = escape_filter_chars(query)
-            search_filter = f"(cn=*{escaped_query}*)"
-            ldap_connection.search(
-                BASE_DN,
-                search_filter,
-                attributes=['distinguishedName', 'cn']
-            )
-            groups = [{'dn': str(entry.distinguishedName), 'cn': str(entry.cn)} for entry in ldap_connection.entries]
-            return jsonify({"groups": groups}), 200
+        return directory_search_response('search_group', query,
+                                         lambda record: {'dn': record['dn'], 'cn': record['cn']}, 'groups')
     except Exception as e:
         return jsonify({"error": str(e), "groups": []}), 500
 
+@app.route('/notifications/status')
+@token_required
+def notifications_status():
+    return jsonify(notification_queue.status()), 200
+
+@app.route('/ldap_status')
+@token_required
+def ldap_status():
+    return jsonify({
+        "domain_controllers": domain_controllers.stats(),
+        "schema": ldap_schema.stats(),
+        "coalescing": {"search": search_flights.stats(), "login": login_flights.stats()},
+        "admin_pool": admin_ldap_pool.stats(),
+        "login_pool": login_ldap_pool.stats(),
+    }), 200
+
+@app.route('/search_cache_stats')
+@token_required
+def search_cache_stats():
+    stats = search_cache.stats()
+    if directory_index is not None:
+        stats["directory_index"] = directory_index.stats()
+    return jsonify(stats), 200
+
 @app.route('/create_user', methods=['POST'])
 @token_required
 def create_user():
     try:
         data = request.get_json()
-        fullName = data.get('fullName', '').strip()
-        firstName = data.get('firstName', '').strip()
-        lastName = data.get('lastName', '').strip()
-        new_ou = data.get('new_ou', '').strip()
-        newDescription = data.get('newDescription', '').strip()
-        newOffice = data.get('newOffice', '').strip()
-        newPhoneNumber = data.get('newPhoneNumber', '').strip()
-        loginName = data.get('loginName', '').strip()
-        domain = data.get('domain', '').strip()
-        managerDn = data.get('managerDn', '').strip()
-        memberOf = data.get('memberOf', [])
-
-        if not fullName or not firstName or not lastName or not new_ou:
-            return jsonify({"error": "Les champs fullName, firstName, lastName et new_ou sont obligatoires."}), 400
-
-        if not loginName:
-            loginName = firstName[0].lower() + lastName.lower()
-
-        with ldap_admin_connection_context() as ldap_connection:
-            i = 1
-            unique_login = loginName
-            while True:
-                escaped_login = escape_filter_chars(unique_login)
-                ldap_connection.search(
-                    BASE_DN,
-                    f"(sAMAccountName={escaped_login})",
-                    attributes=['sAMAccountName']
-                )
-                if not ldap_connection.entries:
-                    break
-                i += 1
-                if i <= len(firstName):
-                    unique_login = firstName[:i].lower() + lastName.lower()
-                else:
-                    unique_login = firstName.lower() + lastName.lower() + str(random.randint(0, 9))
-            loginName = unique_login
-
-        password = generate_password(12)
-        new_dn = f"CN={fullName},OU={new_ou},{BASE_DN}"
-
-        attributes = {
-            "objectClass": ["top", "person", "organizationalPerson", "user"],
-            "cn": fullName,
-            "sn": lastName,
-            "givenName": firstName,
-            "displayName": fullName,
-            "userPrincipalName": loginName + domain,
-            "sAMAccountName": loginName,
-            "mail": loginName + domain,
-            "unicodePwd": f'"{password}"'.encode('utf-16-le'),
-            "userAccountControl": 512
-        }
-        if newDescription:
-            attributes["description"] = newDescription
-        if newOffice:
-            attributes["physicalDeliveryOfficeName"] = newOffice
-        if newPhoneNumber:
-            attributes["telephoneNumber"] = newPhoneNumber
-            attributes["homePhone"] = newPhoneNumber
-        if managerDn:
-            attributes["manager"] = managerDn
-
-        default_groups = [
-            os.getenv("DEFAULT_GROUP_1", ""),
-            os.getenv("DEFAULT_GROUP_2", "")
-        ]
-        memberOf_dns = [g["dn"] if isinstance(g, dict) else g for g in memberOf]
-        all_groups = set(memberOf_dns + default_groups)
+        try:
+            user = parse_new_user(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
+        # Une seule connexion pour la vérification de l'identifiant, l'ajout et les groupes
         with ldap_admin_connection_context() as ldap_connection:
-            success = ldap_connection.add(new_dn, attributes=attributes)
-            if not success:
+            created = create_directory_user(ldap_connection, user)
+            if created is None:
                 error_details = ldap_connection.result
                 return jsonify({"error": "Échec de la création de l'utilisateur", "details": error_details}), 500
+            user_info, new_dn, password, all_groups = created
+            group_writer = GroupMembershipWriter(BASE_DN)
             for group_dn in all_groups:
-                if group_dn:
-                    ldap_connection.modify(group_dn, {'member': [(MODIFY_ADD, [new_dn])]})
+                group_writer.add(group_dn, new_dn)
+            group_outcomes = group_writer.flush(ldap_connection)
+        notify_directory_change(new_dn, user_info['fullName'])
 
-        recipient = MAIL_RECIPIENT
-        user_info = {
-            'fullName': fullName,
-            'firstName': firstName,
-            'lastName': lastName,
-            'new_ou': new_ou,
-            'newDescription': newDescription,
-            'newOffice': newOffice,
-            'newPhoneNumber': newPhoneNumber,
-            'loginName': loginName,
-            'domain': domain,
-            'managerDn': managerDn
-        }
-        output_pdf = send_creation_email(mail, recipient, user_info, password, all_groups)
-        support_recipient = MAIL_SUPPORT_RECIPIENT
-        send_support_email(mail, support_recipient, loginName, output_pdf)
-        if os.path.exists(output_pdf):
-            os.remove(output_pdf)
+        notification_queue.submit('user_created', user_info=user_info, password=password,
+                                  all_groups=sorted(all_groups))
 
+        # Le compte existe même si des ajouts aux groupes ont échoué : le résultat par
+        # groupe est renvoyé (comme pour /apply_changes) pour que l'échec soit visible
+        failed_groups = sorted(group_dn for group_dn, outcome in group_outcomes.items()
+                               if outcome["status"] != "ok")
+        if failed_groups:
+            logger.warning("Utilisateur %s créé, ajout aux groupes en échec : %s", new_dn, failed_groups)
         return jsonify({
-            "message": "Création de l'utilisateur réussie",
+            "message": "Création de l'utilisateur réussie" if not failed_groups
+                       else "Utilisateur créé, mais l'ajout à certains groupes a échoué",
             "password": password,
-            "loginName": loginName
+            "loginName": user_info['loginName'],
+            "dn": new_dn,
+            "groups": group_outcomes,
+            "failedGroups": failed_groups
         }), 200
 
     except Exception as e:
         logger.exception("Erreur inattendue dans /create_user")
         return jsonify({"error": "Erreur inattendue", "details": str(e)}), 500
 
+@app.route('/create_users_bulk', methods=['POST'])
+@token_required
+def create_users_bulk():
+    """
+    Création d'un lot de collaborateurs (JSON ou CSV, même champs que /create_user).
+    La réponse est un flux NDJSON : une ligne par collaborateur, puis l'état des groupes
+    de chaque compte créé, puis une ligne par groupe.
+    """
+    try:
+        if 'file' in request.files:
+            upload = request.files['file']
+            batch_format = 'csv' if upload.filename.lower().endswith('.csv') else 'json'
+            rows = parse_user_batch(upload.read().decode('utf-8-sig'), batch_format)
+        elif request.mimetype == 'text/csv':
+            rows = parse_user_batch(request.get_data(as_text=True), 'csv')
+        else:
+            rows = parse_user_batch(request.get_json(), 'json')
+    except ValueError as e:
+        return jsonify({"error": "Lot invalide", "details": str(e)}), 400
+
+    def generate():
+        try:
+            for result in provision_users(rows):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.exception("Erreur inattendue dans /create_users_bulk")
+            yield json.dumps({"error": "Erreur inattendue", "details": str(e)}, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/delete_user', methods=['POST'])
 @token_required
 def delete_user():
@@ -402,6 +876,7 @@ def delete_user():
         fullName = data.get('fullName', '').strip()
         retention_days = data.get('retention_days', 0)
         retention_minutes = data.get('retention_minutes', 0)
+        urgent = bool(data.get('urgent', False))
 
         if not dn:
             return jsonify({"error": "Le champ 'dn' est obligatoire."}), 400
@@ -420,7 +895,8 @@ def delete_user():
                 if not success:
                     error_details = ldap_connection.result
                     return jsonify({"error": "Échec de la suppression immédiate", "details": error_details}), 500
-                send_deletion_email(mail, recipient, fullName)
+                notify_directory_change(dn, deleted=True)
+                notify('user_deleted', urgent=urgent, recipient=recipient, user_full_name=fullName)
                 return jsonify({"message": "L'utilisateur a été supprimé immédiatement."}), 200
             else:
                 deletion_datetime = datetime.datetime.now() + datetime.timedelta(days=retention_days, minutes=retention_minutes)
@@ -433,7 +909,9 @@ def delete_user():
                 if not success:
                     error_details = ldap_connection.result
                     return jsonify({"error": "Échec de la désactivation du compte", "details": error_details}), 500
-                send_deferred_deletion_email(mail, recipient, fullName, deletion_date_str)
+                notify_directory_change(dn)
+                notify('user_deletion_scheduled', urgent=urgent, recipient=recipient,
+                       user_full_name=fullName, deletion_date_str=deletion_date_str)
                 return jsonify({
                     "message": f"L'utilisateur sera définitivement supprimé le {deletion_date_str}. "
                                f"En attendant, le compte a été désactivé."
@@ -461,15 +939,33 @@ def apply_changes():
         domain = data.get('domain', '').strip()
         manager_dn = data.get('managerDn', '').strip()
         member_of = data.get('memberOf', [])
+        remove_member_of = data.get('removeMemberOf', [])
 
         if not dn or not new_ou or not main_ou:
             return jsonify({"error": "DN, new OU et main OU requis"}), 400
 
         # Logique de modification LDAP à compléter selon besoins
 
+        # Ajout aux groupes sélectionnés et retrait des groupes listés dans removeMemberOf :
+        # une modification par groupe. Le formulaire ne présente pas les groupes actuels du
+        # compte, un groupe non sélectionné n'est donc pas retiré implicitement.
+        group_dns = [group["dn"] if isinstance(group, dict) else group for group in member_of]
+        removed_group_dns = [group["dn"] if isinstance(group, dict) else group for group in remove_member_of]
+        group_writer = GroupMembershipWriter(BASE_DN)
+        for group_dn in group_dns:
+            group_writer.add(group_dn, dn)
+        for group_dn in removed_group_dns:
+            group_writer.remove(group_dn, dn)
+        group_outcomes = {}
+        if group_writer.pending_groups():
+            with ldap_admin_connection_context() as ldap_connection:
+                group_outcomes = group_writer.flush(ldap_connection)
+        notify_directory_change(dn)
+
         # Envoi du mail de modification
-        send_modification_email(mail, MAIL_RECIPIENT, fullName, data, member_of)
-        return jsonify({"message": "Modifications appliquées avec succès"}), 200
+        notify('user_modified', urgent=bool(data.get('urgent', False)), recipient=MAIL_RECIPIENT,
+               user_full_name=fullName, data=data, all_groups=group_dns)
+        return jsonify({"message": "Modifications appliquées avec succès", "groups": group_outcomes}), 200
 
     except LDAPException as e:
         logger.exception("LDAP error during apply_changes")
@@ -478,6 +974,60 @@ def apply_changes():
         logger.exception("Unexpected error during apply_changes")
         return jsonify({"error": "Erreur inattendue", "details": str(e)}), 500
 
+# ------------------ COMMANDES CLI ------------------
+
+@app.cli.command("create-users-bulk")
+@click.argument("batch_file", type=click.Path(exists=True, dir_okay=False))
+@click.option("--sheets", type=click.Path(dir_okay=False, writable=True), default=None,
+              help="Écrit les fiches d'identifiants des comptes créés dans un seul PDF (une page par collaborateur).")
+def create_users_bulk_command(batch_file, sheets):
+    """Crée les collaborateurs d'un fichier CSV ou JSON (résultats NDJSON sur la sortie standard)."""
+    batch_format = 'csv' if batch_file.lower().endswith('.csv') else 'json'
+    with open(batch_file, encoding='utf-8-sig') as fp:
+        rows = parse_user_batch(fp.read(), batch_format)
+    created = []
+    for result in provision_users(rows):
+        click.echo(json.dumps(result, ensure_ascii=False))
+        if result.get("status") == "created":
+            row = rows[result["row"] - 1]
+            created.append({"firstName": row.get("firstName", ""), "lastName": row.get("lastName", ""),
+                            "loginName": result["loginName"], "password": result["password"]})
+    if sheets and created:
+        logo_path = os.path.join(os.path.dirname(__file__), "logo_pdf.png")
+        get_credential_template(logo_path).render_batch(created, output_filename=sheets)
+        click.echo(f"{len(created)} fiche(s) d'identifiants écrite(s) dans {sheets}", err=True)
+    # Le processus CLI ne doit pas se terminer avant l'envoi des mails en file
+    notification_queue.join()
+
+# ------------------ JAUGES EXPOSÉES SUR /metrics ------------------
+
+def _pool_gauge(field):
+    return lambda: {(name, ): pool.stats()[field]
+                    for name, pool in (('admin', admin_ldap_pool), ('login', login_ldap_pool))}
+
+metrics.gauge('ldap_pool_idle_connections', "Connexions LDAP inactives par pool", _pool_gauge('idle'), ('pool',))
+metrics.gauge('ldap_pool_in_use_connections', "Connexions LDAP empruntées par pool", _pool_gauge('in_use'), ('pool',))
+metrics.gauge('ldap_pool_connects_total', "Connexions LDAP ouvertes par pool", _pool_gauge('connects'), ('pool',),
+              kind='counter')
+metrics.gauge('ldap_domain_controller_up', "Disponibilité des contrôleurs de domaine",
+              lambda: {(dc['host'], dc['port']): int(dc['up']) for dc in domain_controllers.stats()}, ('host', 'port'))
+metrics.gauge('ldap_domain_controller_latency_seconds', "Latence moyenne mesurée des contrôleurs de domaine",
+              lambda: {(dc['host'], dc['port']): None if dc['latency_ms'] is None else dc['latency_ms'] / 1000
+                       for dc in domain_controllers.stats()}, ('host', 'port'))
+metrics.gauge('search_cache_entries', "Entrées du cache de recherche", lambda: search_cache.stats()['entries'])
+metrics.gauge('search_cache_lookups_total', "Consultations du cache de recherche par résultat",
+              lambda: {(outcome, ): search_cache.stats()[outcome] for outcome in ('hits', 'refinement_hits', 'misses')},
+              ('outcome',), kind='counter')
+metrics.gauge('coalesced_calls_total', "Appels LDAP identiques regroupés (single-flight)",
+              lambda: {('search', ): search_flights.stats()['coalesced'], ('login', ): login_flights.stats()['coalesced']},
+              ('kind',), kind='counter')
+metrics.gauge('jwt_cache_entries', "Jetons JWT vérifiés en cache", lambda: token_cache.stats()['entries'])
+metrics.gauge('login_throttled_total', "Tentatives de connexion refusées par limitation",
+              lambda: login_throttle.rejected, kind='counter')
+metrics.gauge('notification_jobs', "Notifications du journal par état",
+              lambda: {(state, ): value for state, value in notification_queue.status().items()
+                       if state in ('pending', 'running', 'failed')}, ('state',))
+
 # ------------------ ROUTES CATCH-ALL ET ERREURS ------------------
 
 @app.route('/<path:path>')
@@ -1,25 +1,91 @@
 # delete_expired_users.py
 import os
+import json
+import time
+import signal
+import argparse
+import tempfile
 import datetime
-from ldap3 import Server, Connection, ALL, MODIFY_DELETE
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ldap3.core.exceptions import LDAPException
+from ldap3.utils.conv import escape_filter_chars
 from dotenv import load_dotenv
 from flask import Flask
 from flask_mail import Mail
 
-from mail_utils import send_final_deletion_email, send_deferred_deletion_email, get_cn_from_dn
+from ldap_pool import LdapConnectionPool
+from ldap_servers import DomainControllerPool, parse_server_list
+from ldap_schema import SchemaSnapshot
+from rate_limit import TokenBucket
+from metrics import metrics
+from logging_setup import configure_logging, parse_levels
+from mail_utils import (
+    send_deferred_deletion_email,
+    send_digest_email,
+    digest_event,
+    get_cn_from_dn,
+    MailDispatcher
+)
 
 # Charger les variables d'environnement (mêmes que Flask)
-dotenv_path = "/var/www/flask_app/flask_app/log_ldap.env"
+dotenv_path = os.getenv('SWEEPER_DOTENV_PATH', os.getenv('DOTENV_PATH', "/var/www/flask_app/flask_app/log_ldap.env"))
 load_dotenv(dotenv_path)
 
 LDAP_SERVER = os.getenv('SERVER_IP')
 LDAP_PORT = int(os.getenv('LDAP_PORT', 636))
 LDAP_USER = f"{os.getenv('TESTNAME')}@{os.getenv('DOMAIN')}"
 LDAP_PASSWORD = os.getenv('PASSWORD')
+# Contrôleurs de domaine (mêmes variables que Flask) : le plus rapide disponible est utilisé
+LDAP_SERVERS = parse_server_list(os.getenv('LDAP_SERVERS') or LDAP_SERVER, LDAP_PORT)
+LDAP_CONNECT_TIMEOUT = int(os.getenv('LDAP_CONNECT_TIMEOUT', 5))
+LDAP_PROBE_INTERVAL = int(os.getenv('LDAP_PROBE_INTERVAL', 30))
+LDAP_LATENCY_EWMA_ALPHA = float(os.getenv('LDAP_LATENCY_EWMA_ALPHA', 0.3))
+# Copie locale du schéma LDAP tenue à jour par l'application Flask (lue hors ligne ici)
+LDAP_SCHEMA_PATH = os.getenv(
+    'LDAP_SCHEMA_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ldap_schema.json')
+)
 BASE_DN = os.getenv('BASE_DN')
 MAIL_RECIPIENT = os.getenv('MAIL_RECIPIENT')
+# Un seul mail récapitulatif par exécution au lieu d'un mail par compte supprimé
+SWEEPER_DIGEST = os.getenv('SWEEPER_DIGEST', 'false').lower() == 'true'
 
-LOG_FILE = "suppression_differee.log"
+# Journal des suppressions : chemin absolu par défaut (à côté du script), le répertoire
+# courant du service n'étant pas celui d'une exécution cron
+LOG_FILE = os.getenv(
+    'SWEEPER_LOG_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'suppression_differee.log')
+)
+
+# Recherche paginée et état de la dernière exécution
+SWEEPER_PAGE_SIZE = int(os.getenv('SWEEPER_PAGE_SIZE', 500))
+SWEEPER_STATE_FILE = os.getenv(
+    'SWEEPER_STATE_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'suppression_differee_state.json')
+)
+# Au-delà de ce délai depuis le dernier balayage complet, toute la fenêtre de 6 mois est relue
+SWEEPER_FULL_SCAN_HOURS = int(os.getenv('SWEEPER_FULL_SCAN_HOURS', 24))
+
+# Suppressions en parallèle : nombre de connexions, débit maximal (suppressions par seconde,
+# 0 = illimité), rafale autorisée et délai maximal par compte (secondes)
+SWEEPER_WORKERS = int(os.getenv('SWEEPER_WORKERS', 4))
+SWEEPER_RATE = float(os.getenv('SWEEPER_RATE', 10))
+SWEEPER_BURST = int(os.getenv('SWEEPER_BURST', 0))
+SWEEPER_ACCOUNT_TIMEOUT = int(os.getenv('SWEEPER_ACCOUNT_TIMEOUT', 30))
+
+# Mode service (--daemon) : délais minimal et maximal entre deux passages (secondes)
+# et adresse du point d'état HTTP (/health, /status)
+SWEEPER_MIN_SLEEP = int(os.getenv('SWEEPER_MIN_SLEEP', 30))
+SWEEPER_MAX_SLEEP = int(os.getenv('SWEEPER_MAX_SLEEP', 900))
+SWEEPER_STATUS_HOST = os.getenv('SWEEPER_STATUS_HOST', '127.0.0.1')
+SWEEPER_STATUS_PORT = int(os.getenv('SWEEPER_STATUS_PORT', 8765))
+# Mesures LDAP et SMTP exposées sur /metrics du point d'état (mode service)
+metrics.enabled = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+
+# Format de extensionAttribute1 : l'ordre alphabétique est l'ordre chronologique
+# (y compris pour l'ancien format "%Y-%m-%d"), ce qui permet de filtrer les dates côté LDAP
+DATE_FORMAT = "%Y-%m-%d %H:%M"
 
 # Initialisation Flask et Flask-Mail pour l'envoi de mail
 app = Flask(__name__)
@@ -30,54 +96,436 @@ app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER')
 mail = Mail(app)
+# Une seule session SMTP pour tous les mails d'une exécution
+mail_dispatcher = MailDispatcher(mail)
 
-def main():
-    today = datetime.datetime.now()
+
+def load_state():
+    """État de la dernière exécution : {"last_run", "last_full_scan", "failed"} (vide au premier lancement)."""
+    try:
+        with open(SWEEPER_STATE_FILE, encoding="utf-8") as fp:
+            return json.load(fp)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_state(state):
+    """
+    Écrit l'état de façon atomique : fichier temporaire propre à cet appel (le service et
+    une exécution cron ou --dry-run peuvent écrire en même temps), puis renommage.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(SWEEPER_STATE_FILE)),
+                                     prefix=os.path.basename(SWEEPER_STATE_FILE) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fp:
+            json.dump(state, fp, ensure_ascii=False, indent=2)
+        os.replace(temp_path, SWEEPER_STATE_FILE)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def parse_deletion_date(deletion_date_str):
+    """Gère les deux formats : avec ou sans heure. Lève ValueError si la date est invalide."""
+    value = deletion_date_str.strip()
+    if len(value) > 10:
+        return datetime.datetime.strptime(value, DATE_FORMAT)
+    return datetime.datetime.strptime(value, "%Y-%m-%d")
+
+
+def build_due_filter(lower_bound_str, upper_bound_str, retry_dns=()):
+    """
+    Comptes désactivés dont la date de suppression est comprise entre les deux bornes,
+    plus les comptes dont la suppression a échoué lors de l'exécution précédente.
+    """
+    date_filter = (f"(&(extensionAttribute1>={escape_filter_chars(lower_bound_str)})"
+                   f"(extensionAttribute1<={escape_filter_chars(upper_bound_str)}))")
+    if retry_dns:
+        retry_filter = "".join(f"(distinguishedName={escape_filter_chars(dn)})" for dn in retry_dns)
+        date_filter = f"(|{date_filter}(&(extensionAttribute1<={escape_filter_chars(upper_bound_str)}){retry_filter}))"
+    return f"(&(userAccountControl=514){date_filter})"
+
+
+def find_due_accounts(conn, state, today):
+    """
+    Recherche paginée des comptes à supprimer. Renvoie (comptes, balayage complet),
+    chaque compte étant un couple (DN, date de suppression).
+
+    Hors balayage complet, seuls les comptes échus depuis la dernière exécution
+    (et ceux en échec la fois précédente) sont relus.
+    """
     six_months_ago = today - datetime.timedelta(days=180)
-    six_months_later = today + datetime.timedelta(days=180)
-    today_str = today.strftime("%Y-%m-%d %H:%M")
-    server = Server(LDAP_SERVER, port=LDAP_PORT, use_ssl=True, get_info=ALL)
-    conn = Connection(server, user=LDAP_USER, password=LDAP_PASSWORD, auto_bind=True)
-
-    # Recherche tous les comptes désactivés avec une date de suppression (future ou passée)
-    search_filter = "(&(userAccountControl=514)(extensionAttribute1=*))"
-    conn.search(
-        BASE_DN,
-        search_filter,
-        attributes=['distinguishedName', 'extensionAttribute1']
+    full_scan = True
+    lower_bound = six_months_ago.strftime(DATE_FORMAT)
+    if state.get("last_run") and state.get("last_full_scan"):
+        last_full_scan = datetime.datetime.strptime(state["last_full_scan"], DATE_FORMAT)
+        if today - last_full_scan < datetime.timedelta(hours=SWEEPER_FULL_SCAN_HOURS):
+            full_scan = False
+            lower_bound = max(lower_bound, state["last_run"])
+
+    search_filter = build_due_filter(lower_bound, today.strftime(DATE_FORMAT), state.get("failed", []))
+    due = []
+    for item in conn.extend.standard.paged_search(
+            BASE_DN,
+            search_filter,
+            attributes=['distinguishedName', 'extensionAttribute1'],
+            paged_size=SWEEPER_PAGE_SIZE,
+            generator=True):
+        if item.get('type') != 'searchResEntry':
+            continue
+        value = item['attributes'].get('extensionAttribute1')
+        if isinstance(value, (list, tuple)):
+            value = value[0] if value else ''
+        due.append((item['dn'], str(value or '')))
+    return due, full_scan
+
+
+def find_next_due_date(conn, today):
+    """Plus proche date de suppression à venir (datetime), ou None s'il n'y en a pas."""
+    search_filter = (f"(&(userAccountControl=514)(extensionAttribute1=*)"
+                     f"(!(extensionAttribute1<={escape_filter_chars(today.strftime(DATE_FORMAT))})))")
+    next_due = None
+    for item in conn.extend.standard.paged_search(
+            BASE_DN,
+            search_filter,
+            attributes=['extensionAttribute1'],
+            paged_size=SWEEPER_PAGE_SIZE,
+            generator=True):
+        if item.get('type') != 'searchResEntry':
+            continue
+        value = item['attributes'].get('extensionAttribute1')
+        if isinstance(value, (list, tuple)):
+            value = value[0] if value else ''
+        try:
+            due = parse_deletion_date(str(value or ''))
+        except ValueError:
+            continue
+        if next_due is None or due < next_due:
+            next_due = due
+    return next_due
+
+
+def create_pool(size):
+    """Pool de connexions admin partagé par la recherche et les threads de suppression."""
+    domain_controllers = DomainControllerPool(
+        LDAP_SERVERS, LDAP_USER, LDAP_PASSWORD,
+        connect_timeout=LDAP_CONNECT_TIMEOUT,
+        receive_timeout=SWEEPER_ACCOUNT_TIMEOUT,
+        probe_interval=LDAP_PROBE_INTERVAL,
+        alpha=LDAP_LATENCY_EWMA_ALPHA
+    )
+    # Une sonde immédiate : une exécution ponctuelle n'attend pas le thread de fond
+    # pour choisir le contrôleur le plus rapide
+    if len(domain_controllers.servers) > 1:
+        domain_controllers.probe_all()
+    domain_controllers.start()
+    SchemaSnapshot(LDAP_SCHEMA_PATH, domain_controllers, refresh_interval=0).start()
+    # En mode service, les connexions restent ouvertes d'un passage à l'autre : le délai
+    # d'inactivité doit dépasser l'attente maximale entre deux passages (une connexion
+    # fermée entre-temps par le serveur est détectée et rouverte à l'emprunt)
+    return LdapConnectionPool(
+        domain_controllers, LDAP_USER, LDAP_PASSWORD,
+        size=size,
+        idle_timeout=max(300, SWEEPER_MAX_SLEEP + SWEEPER_MIN_SLEEP),
+        acquire_timeout=SWEEPER_ACCOUNT_TIMEOUT,
+        receive_timeout=SWEEPER_ACCOUNT_TIMEOUT
     )
 
+
+def delete_account(pool, rate_limiter, dn):
+    """
+    Supprime un compte sur une connexion du pool, après avoir obtenu un jeton du limiteur.
+    Renvoie (succès, détail de l'erreur). Un délai dépassé (attente d'une connexion ou de la
+    réponse du serveur) compte comme un échec et la connexion concernée est écartée.
+    """
+    rate_limiter.acquire()
+    try:
+        with pool.connection() as conn:
+            if conn.delete(dn):
+                return True, None
+            return False, conn.result
+    except LDAPException as e:
+        return False, f"{type(e).__name__}: {e}"
+
+
+def run_sweep(pool, dry_run=False, workers=None):
+    """
+    Un passage complet (recherche, suppressions, mails, état) sur un pool déjà ouvert.
+    Renvoie le bilan du passage.
+    """
+    workers = workers or SWEEPER_WORKERS
+    run_started = time.monotonic()
+    timings = {}
+    today = datetime.datetime.now()
+    today_str = today.strftime(DATE_FORMAT)
+    state = load_state()
+    rate_limiter = TokenBucket(SWEEPER_RATE, SWEEPER_BURST or workers)
+
     with open(LOG_FILE, "a", encoding="utf-8") as log, app.app_context():
-        log.write(f"\n=== Vérification du {today_str} ===\n")
-        for entry in conn.entries:
-            dn = str(entry.distinguishedName)
-            deletion_date_str = str(entry.extensionAttribute1)
+        log.write(f"\n=== Vérification du {today_str}{' (simulation)' if dry_run else ''} ===\n")
+
+        started = time.monotonic()
+        conn = pool.acquire()
+        timings["connexion"] = time.monotonic() - started
+        try:
+            started = time.monotonic()
+            due_accounts, full_scan = find_due_accounts(conn, state, today)
+            timings["recherche"] = time.monotonic() - started
+        finally:
+            pool.release(conn)
+        log.write(f"{len(due_accounts)} compte(s) à supprimer"
+                  f" ({'balayage complet' if full_scan else 'depuis le ' + state['last_run']}).\n")
+
+        deleted = []
+        failed = []
+        skipped = 0
+        to_delete = []
+        for dn, deletion_date_str in due_accounts:
             try:
-                # Gère les deux formats : avec ou sans heure
-                if len(deletion_date_str.strip()) > 10:
-                    deletion_date = datetime.datetime.strptime(deletion_date_str, "%Y-%m-%d %H:%M")
-                else:
-                    deletion_date = datetime.datetime.strptime(deletion_date_str, "%Y-%m-%d")
-            except Exception:
+                parse_deletion_date(deletion_date_str)
+            except ValueError:
                 log.write(f"Format de date invalide pour {dn}: {deletion_date_str}\n")
+                skipped += 1
                 continue
+            if dry_run:
+                log.write(f"[simulation] Le compte {dn} serait supprimé (date prévue : {deletion_date_str})\n")
+                skipped += 1
+                continue
+            to_delete.append((dn, deletion_date_str))
 
-            # Comparaison sur la période de 6 mois avant/après
-            if six_months_ago <= deletion_date <= six_months_later:
-                if deletion_date <= today:
-                    log.write(f"Suppression du compte {dn} (date prévue : {deletion_date_str})\n")
-                    success = conn.delete(dn)
-                    if success:
-                        log.write(f"Compte {dn} supprimé.\n")
-                        # Envoi du mail de confirmation de suppression définitive
-                        user_cn = get_cn_from_dn(dn)
-                        send_deferred_deletion_email(mail, MAIL_RECIPIENT, user_cn, today_str)
-                    else:
-                        log.write(f"Erreur lors de la suppression de {dn}: {conn.result}\n")
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="suppression") as executor:
+            futures = {
+                executor.submit(delete_account, pool, rate_limiter, dn): (dn, deletion_date_str)
+                for dn, deletion_date_str in to_delete
+            }
+            for future in as_completed(futures):
+                dn, deletion_date_str = futures[future]
+                success, error = future.result()
+                if success:
+                    log.write(f"Compte {dn} supprimé (date prévue : {deletion_date_str}).\n")
+                    deleted.append((dn, deletion_date_str))
                 else:
-                    log.write(f"Suppression prévue pour {dn} le {deletion_date_str}\n")
+                    log.write(f"Erreur lors de la suppression de {dn}: {error}\n")
+                    failed.append(dn)
+        timings["suppression"] = time.monotonic() - started
+
+        # Envoi des mails de confirmation de suppression définitive
+        started = time.monotonic()
+        if SWEEPER_DIGEST and deleted:
+            digest_events = [digest_event('user_deleted', get_cn_from_dn(dn), deletion_date_str=deletion_date_str)
+                             for dn, deletion_date_str in deleted]
+            try:
+                send_digest_email(mail_dispatcher, MAIL_RECIPIENT, digest_events)
+            except Exception as e:
+                log.write(f"Échec de l'envoi du mail récapitulatif ({len(digest_events)} comptes): {e}\n")
+        elif not SWEEPER_DIGEST:
+            for dn, deletion_date_str in deleted:
+                try:
+                    send_deferred_deletion_email(mail_dispatcher, MAIL_RECIPIENT, get_cn_from_dn(dn), today_str)
+                except Exception as e:
+                    log.write(f"Échec de l'envoi du mail pour {dn}: {e}\n")
+        timings["mails"] = time.monotonic() - started
+
+        if not dry_run:
+            state["last_run"] = today_str
+            if full_scan:
+                state["last_full_scan"] = today_str
+            state["failed"] = failed
+            save_state(state)
+
+        summary = {
+            "deleted": len(deleted),
+            "failed": len(failed),
+            "skipped": skipped,
+            "elapsed": round(time.monotonic() - run_started, 2),
+            "dry_run": dry_run,
+            "full_scan": full_scan,
+            "timings": {phase: round(duration, 3) for phase, duration in timings.items()},
+        }
+        log.write("Durées : " + ", ".join(f"{phase} {duration:.2f} s" for phase, duration in timings.items()) + "\n")
+        log.write(f"Bilan : {summary['deleted']} supprimé(s), {summary['failed']} échec(s), "
+                  f"{summary['skipped']} ignoré(s) en {summary['elapsed']:.2f} s.\n")
+    return summary
+
+
+def main(dry_run=False, workers=None):
+    """Exécution ponctuelle (cron) : ouvre le pool, fait un passage puis ferme les connexions."""
+    workers = workers or SWEEPER_WORKERS
+    pool = create_pool(workers)
+    try:
+        return run_sweep(pool, dry_run=dry_run, workers=workers)
+    finally:
+        pool.close()
+        pool.server.stop()
+        mail_dispatcher.close()
+
+
+class SweeperScheduler:
+    """
+    Mode service : garde le pool LDAP (et la session SMTP) ouverts entre les passages,
+    et se réveille à la prochaine date de suppression connue plutôt qu'à intervalle fixe.
+
+    Le délai entre deux passages est compris entre SWEEPER_MIN_SLEEP et SWEEPER_MAX_SLEEP :
+    le plafond prend en compte les suppressions programmées depuis le dernier passage.
+    """
+
+    def __init__(self, pool, workers=None, dry_run=False):
+        self.pool = pool
+        self.workers = workers or SWEEPER_WORKERS
+        self.dry_run = dry_run
+        self.runs = 0
+        self.errors = 0
+        self.last_summary = None
+        self.last_error = None
+        self.last_run_at = None
+        self.next_due = None
+        self.next_wake_at = None
+        self.started_at = datetime.datetime.now()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def run_once(self):
+        """Fait un passage puis calcule le délai avant le suivant (secondes)."""
+        try:
+            summary = run_sweep(self.pool, dry_run=self.dry_run, workers=self.workers)
+            with self.pool.connection() as conn:
+                next_due = find_next_due_date(conn, datetime.datetime.now())
+            with self._lock:
+                self.last_summary = summary
+                self.last_error = None
+                self.next_due = next_due
+        except Exception as e:
+            next_due = None
+            with self._lock:
+                self.errors += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+            with open(LOG_FILE, "a", encoding="utf-8") as log:
+                log.write(f"Échec du passage de suppression : {e}\n")
+        with self._lock:
+            self.runs += 1
+            self.last_run_at = datetime.datetime.now()
 
-    conn.unbind()
+        delay = SWEEPER_MAX_SLEEP
+        if next_due is not None:
+            # Les dates sont à la minute : réveil juste après l'échéance
+            delay = min(delay, (next_due - datetime.datetime.now()).total_seconds() + 1)
+        delay = max(delay, SWEEPER_MIN_SLEEP)
+        with self._lock:
+            self.next_wake_at = datetime.datetime.now() + datetime.timedelta(seconds=delay)
+        return delay
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            self._stop.wait(self.run_once())
+
+    def stop(self):
+        self._stop.set()
+
+    def _healthy(self):
+        """Dernier passage réussi et passage suivant pas en retard (verrou tenu)."""
+        if self.last_error is not None:
+            return False
+        if self.next_wake_at is None:
+            return True
+        late = datetime.datetime.now() - self.next_wake_at
+        return late < datetime.timedelta(seconds=SWEEPER_MAX_SLEEP)
+
+    def is_healthy(self):
+        with self._lock:
+            return self._healthy()
+
+    def status(self):
+        with self._lock:
+            return {
+                "healthy": self._healthy(),
+                "dry_run": self.dry_run,
+                "started_at": self.started_at.strftime(DATE_FORMAT),
+                "runs": self.runs,
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "last_run_at": None if self.last_run_at is None else self.last_run_at.strftime("%Y-%m-%d %H:%M:%S"),
+                "last_summary": self.last_summary,
+                "next_due": None if self.next_due is None else self.next_due.strftime(DATE_FORMAT),
+                "next_wake_at": None if self.next_wake_at is None else self.next_wake_at.strftime("%Y-%m-%d %H:%M:%S"),
+                "pool": self.pool.stats(),
+                "domain_controllers": self.pool.server.stats(),
+            }
+
+
+def serve_status(scheduler, host=SWEEPER_STATUS_HOST, port=SWEEPER_STATUS_PORT):
+    """Point d'état HTTP du mode service : /health (200 ou 503), /status (bilan JSON) et /metrics (Prometheus)."""
+
+    class StatusHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/health":
+                healthy = scheduler.is_healthy()
+                code, body = (200 if healthy else 503), {"status": "ok" if healthy else "degraded"}
+            elif self.path == "/status":
+                code, body = 200, scheduler.status()
+            elif self.path == "/metrics" and metrics.enabled:
+                payload = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                return
+            else:
+                code, body = 404, {"error": "Cette route n'existe pas"}
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), StatusHandler)
+    thread = threading.Thread(target=server.serve_forever, name="sweeper-status", daemon=True)
+    thread.start()
+    return server
+
+
+def run_daemon(dry_run=False, workers=None):
+    """Mode service : passages successifs jusqu'à SIGTERM/SIGINT, avec point d'état HTTP."""
+    workers = workers or SWEEPER_WORKERS
+    pool = create_pool(workers)
+    scheduler = SweeperScheduler(pool, workers=workers, dry_run=dry_run)
+    status_server = serve_status(scheduler)
+    signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        status_server.shutdown()
+        pool.close()
+        pool.server.stop()
+        mail_dispatcher.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Suppression des comptes dont la date de suppression différée est atteinte.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Liste les comptes qui seraient supprimés sans rien modifier ni envoyer.")
+    parser.add_argument("--workers", type=int, default=SWEEPER_WORKERS,
+                        help="Nombre de suppressions menées en parallèle (une connexion LDAP chacune).")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Reste actif et se réveille à chaque échéance (état sur /health et /status).")
+    arguments = parser.parse_args()
+    # Journaux des modules sur stderr (la sortie standard reste réservée au bilan JSON,
+    # LOG_FILE aux durées par phase)
+    configure_logging(
+        level=os.getenv('LOG_LEVEL', 'INFO'),
+        json_format=os.getenv('LOG_FORMAT', 'json').lower() == 'json',
+        module_levels=parse_levels(os.getenv('LOG_LEVELS'))
+    )
+    if arguments.daemon:
+        run_daemon(dry_run=arguments.dry_run, workers=arguments.workers)
+    else:
+        print(json.dumps(main(dry_run=arguments.dry_run, workers=arguments.workers), ensure_ascii=False))
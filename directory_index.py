@@ -0,0 +1,273 @@
+# directory_index.py
+
+import logging
+import threading
+import time
+
+from search_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+INDEX_ATTRIBUTES = ['cn', 'displayName', 'sAMAccountName', 'distinguishedName',
+                    'objectClass', 'objectCategory', 'memberOf', 'uSNChanged']
+
+
+def _trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def _first(attributes, name, default=''):
+    value = attributes.get(name, default)
+    if isinstance(value, (list, tuple)):
+        return value[0] if value else default
+    return value
+
+
+def _category_name(object_category):
+    """'CN=Person,CN=Schema,CN=Configuration,...' -> 'person'."""
+    value = str(object_category)
+    if value[:3].lower() == 'cn=':
+        value = value[3:].split(',', 1)[0]
+    return value.lower()
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+class DirectoryIndex:
+    """
+    Index en mémoire des objets de l'annuaire (cn, displayName, sAMAccountName, DN,
+    objectClass, memberOf) pour répondre aux recherches d'autocomplétion sans
+    interroger le contrôleur de domaine.
+
+    - chargement initial par recherche paginée sur base_dn ;
+    - synchronisation incrémentale toutes les `sync_interval` secondes sur
+      `uSNChanged` (seules les entrées créées ou modifiées depuis le dernier
+      passage sont relues) ;
+    - rechargement complet toutes les `full_reload_interval` secondes pour
+      prendre en compte les suppressions faites hors de l'application ;
+    - les recherches par sous-chaîne utilisent un index de trigrammes ;
+    - si la dernière synchronisation réussie date de plus de `max_staleness`
+      secondes, `search` renvoie None et l'appelant repasse par LDAP.
+
+    `connection_factory` est un callable renvoyant un gestionnaire de contexte
+    qui fournit une connexion LDAP liée (par exemple `LdapConnectionPool.connection`).
+    Les valeurs de uSNChanged étant propres à chaque contrôleur, le plus grand uSNChanged
+    vu est conservé par contrôleur : une synchronisation servie par un contrôleur déjà lu
+    repart de sa propre valeur, une synchronisation servie par un contrôleur jamais lu
+    (connexion ouverte sur un autre contrôleur du pool) devient un rechargement complet.
+    """
+
+    def __init__(self, connection_factory, base_dn, page_size=500, sync_interval=60,
+                 full_reload_interval=3600, max_staleness=300):
+        self.connection_factory = connection_factory
+        self.base_dn = base_dn
+        self.page_size = page_size
+        self.sync_interval = sync_interval
+        self.full_reload_interval = full_reload_interval
+        self.max_staleness = max_staleness
+
+        self._records = {}   # DN normalisé -> enregistrement
+        self._names = {}     # DN normalisé -> cn normalisé
+        self._trigram_index = {}  # trigramme -> ensemble de DN normalisés
+        self._highest_usn = {}  # "hôte:port" du contrôleur -> plus grand uSNChanged lu
+        self._last_sync = None
+        self._last_full_load = None
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ------------------ MISE À JOUR DE L'INDEX ------------------
+
+    def _unindex(self, key):
+        """Retire une entrée de l'index (verrou tenu)."""
+        self._records.pop(key, None)
+        name = self._names.pop(key, None)
+        if name is None:
+            return
+        for trigram in _trigrams(name):
+            keys = self._trigram_index.get(trigram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._trigram_index[trigram]
+
+    def _index(self, record):
+        """Ajoute ou remplace une entrée dans l'index (verrou tenu)."""
+        key = record['dn'].lower()
+        self._unindex(key)
+        name = normalize_query(record['cn'])
+        self._records[key] = record
+        self._names[key] = name
+        for trigram in _trigrams(name):
+            self._trigram_index.setdefault(trigram, set()).add(key)
+
+    @staticmethod
+    def _record_from_response(item):
+        attributes = item['attributes']
+        return {
+            'dn': item['dn'],
+            'cn': str(_first(attributes, 'cn')),
+            'displayName': str(_first(attributes, 'displayName')),
+            'sAMAccountName': str(_first(attributes, 'sAMAccountName')),
+            'objectClass': [str(v).lower() for v in _as_list(attributes.get('objectClass'))],
+            'objectCategory': _category_name(_first(attributes, 'objectCategory')),
+            'memberOf': [str(v) for v in _as_list(attributes.get('memberOf'))],
+        }
+
+    @staticmethod
+    def _source(connection):
+        """Contrôleur qui sert la connexion (avec un ServerPool, celui retenu à l'ouverture)."""
+        return f"{connection.server.host}:{connection.server.port}"
+
+    def _fetch(self, full):
+        """
+        Recherche paginée, complète ou limitée aux entrées modifiées depuis le dernier
+        uSNChanged connu du contrôleur qui sert la connexion.
+        Renvoie (enregistrements, plus grand uSNChanged vu, contrôleur, lecture complète).
+        """
+        records = []
+        highest_usn = 0
+        with self.connection_factory() as connection:
+            source = self._source(connection)
+            with self._lock:
+                known_usn = self._highest_usn.get(source)
+            if known_usn is None:
+                if not full:
+                    logger.info("Index annuaire : premier passage sur %s, rechargement complet.", source)
+                full = True
+            search_filter = "(cn=*)" if full else f"(&(cn=*)(uSNChanged>={known_usn + 1}))"
+            for item in connection.extend.standard.paged_search(
+                    self.base_dn,
+                    search_filter,
+                    attributes=INDEX_ATTRIBUTES,
+                    paged_size=self.page_size,
+                    generator=True):
+                if item.get('type') != 'searchResEntry':
+                    continue
+                records.append(self._record_from_response(item))
+                usn = _first(item['attributes'], 'uSNChanged', 0)
+                highest_usn = max(highest_usn, int(usn or 0))
+        return records, max(highest_usn, known_usn or 0), source, full
+
+    def _replace(self, records, highest_usn, source):
+        """
+        Remplace tout l'index. Les repères uSNChanged des autres contrôleurs sont conservés :
+        relire depuis leur repère ne fait que rejouer des modifications déjà vues, et évite
+        un rechargement complet à chaque changement de contrôleur entre deux connexions du pool.
+        """
+        with self._lock:
+            self._records = {}
+            self._names = {}
+            self._trigram_index = {}
+            for record in records:
+                self._index(record)
+            self._highest_usn[source] = highest_usn
+            self._last_sync = self._last_full_load = time.monotonic()
+
+    def load(self):
+        """Chargement complet de l'index (remplace l'index courant)."""
+        started = time.monotonic()
+        records, highest_usn, source, _ = self._fetch(full=True)
+        self._replace(records, highest_usn, source)
+        logger.info("Index annuaire chargé depuis %s : %s entrées en %.2f s.",
+                    source, len(records), time.monotonic() - started)
+
+    def sync(self):
+        """Relit uniquement les entrées modifiées depuis le dernier uSNChanged connu du contrôleur."""
+        records, highest_usn, source, full = self._fetch(full=False)
+        if full:
+            self._replace(records, highest_usn, source)
+            return
+        with self._lock:
+            for record in records:
+                self._index(record)
+            self._highest_usn[source] = highest_usn
+            self._last_sync = time.monotonic()
+        if records:
+            logger.info("Index annuaire : %s entrées mises à jour.", len(records))
+
+    def remove(self, dn):
+        """Retire immédiatement un objet supprimé par l'application."""
+        with self._lock:
+            self._unindex(dn.lower())
+
+    def request_sync(self):
+        """Demande une synchronisation anticipée au thread de fond."""
+        self._wake.set()
+
+    # ------------------ THREAD DE SYNCHRONISATION ------------------
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._last_full_load is None or \
+                        time.monotonic() - self._last_full_load >= self.full_reload_interval:
+                    self.load()
+                else:
+                    self.sync()
+            except Exception:
+                # Toute erreur (LDAP ou valeur inattendue dans une réponse) est journalisée sans
+                # arrêter le thread : sinon l'index vieillit et toutes les recherches repassent par LDAP
+                logger.exception("Échec de la synchronisation de l'index annuaire")
+            self._wake.wait(self.sync_interval)
+            self._wake.clear()
+
+    def start(self):
+        """Lance le chargement puis la synchronisation périodique en arrière-plan."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="directory-index", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    # ------------------ RECHERCHE ------------------
+
+    def is_fresh(self):
+        last_sync = self._last_sync
+        return last_sync is not None and time.monotonic() - last_sync <= self.max_staleness
+
+    def search(self, query, category=None):
+        """
+        Renvoie les enregistrements dont le cn contient `query` (insensible à la casse)
+        et, si `category` est fourni, dont l'objectCategory correspond ('person', 'group'),
+        ou None si l'index n'est pas chargé ou trop ancien.
+        """
+        if not self.is_fresh():
+            return None
+        normalized = normalize_query(query)
+        with self._lock:
+            if len(normalized) < 3:
+                keys = [key for key, name in self._names.items() if normalized in name]
+            else:
+                candidate_sets = []
+                for trigram in _trigrams(normalized):
+                    keys = self._trigram_index.get(trigram)
+                    if not keys:
+                        return []
+                    candidate_sets.append(keys)
+                candidate_sets.sort(key=len)
+                candidates = set(candidate_sets[0]).intersection(*candidate_sets[1:])
+                keys = [key for key in candidates if normalized in self._names[key]]
+            if category:
+                keys = [key for key in keys if self._records[key]['objectCategory'] == category]
+            keys.sort(key=self._names.__getitem__)
+            return [self._records[key] for key in keys]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._records),
+                "fresh": self.is_fresh(),
+                "highest_usn": dict(self._highest_usn),
+                "last_sync_age": None if self._last_sync is None else round(time.monotonic() - self._last_sync, 1),
+            }
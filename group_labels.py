@@ -1,13 +1,21 @@
 # group_labels.py
 
+import json
 import logging
+import threading
+import time
+
+from ldap3.core.exceptions import LDAPException
 
 logger = logging.getLogger(__name__)
 
 """
-Ce fichier contient un dictionnaire Python qui mappe chaque DN LDAP
-vers un label plus lisible. À adapter selon vos groupes réels.
-Aucune référence à une structure ou organisation spécifique.
+Libellés lisibles des groupes LDAP, affichés dans les mails à la place des DN.
+
+Les libellés sont lus dans l'annuaire (displayName, à défaut description, à défaut cn)
+par une seule recherche paginée, puis conservés en mémoire pendant `ttl` secondes.
+Le dictionnaire ci-dessous et le fichier de surcharge (JSON {DN: libellé}) sont
+prioritaires sur l'annuaire. Les DN sont comparés sans tenir compte de la casse.
 """
 
 group_label_map = {
@@ -21,24 +29,158 @@ group_label_map = {
     # Ajoutez ici d'autres groupes génériques si besoin
 }
 
+LABEL_ATTRIBUTES = ['displayName', 'description', 'cn']
+
+
+def normalize_dn(dn):
+    """'CN=IT, OU=Groups,DC=example,DC=com' -> 'cn=it,ou=groups,dc=example,dc=com'."""
+    return ",".join(part.strip() for part in str(dn).split(",")).lower()
+
+
+def cn_from_dn(dn):
+    """Premier RDN sans son type : 'CN=IT,OU=...' -> 'IT' (libellé de repli)."""
+    first = str(dn).split(",", 1)[0]
+    return first.split("=", 1)[1].strip() if "=" in first else str(dn)
+
+
+def _first(attributes, name):
+    value = attributes.get(name)
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else None
+    return str(value).strip() if value else ''
+
+
+def load_overrides(path):
+    """Lit le fichier de surcharge (JSON {DN: libellé}) ; renvoie un dictionnaire indexé par DN normalisé."""
+    with open(path, encoding='utf-8') as fp:
+        overrides = json.load(fp)
+    if not isinstance(overrides, dict):
+        raise ValueError(f"{path} doit contenir un objet JSON {{DN: libellé}}")
+    return {normalize_dn(dn): str(label) for dn, label in overrides.items()}
+
+
+class GroupLabelResolver:
+    """
+    Résolution DN de groupe -> libellé, par lot.
+
+    `connection_factory` est un callable renvoyant un gestionnaire de contexte qui fournit
+    une connexion LDAP liée (par exemple `LdapConnectionPool.connection`). Tous les groupes
+    sous `base_dn` sont chargés en une recherche paginée au premier besoin, puis rechargés
+    quand le cache a plus de `ttl` secondes. Si l'annuaire est injoignable, le dernier
+    chargement réussi reste utilisé et un nouvel essai n'a lieu qu'après `retry_delay` secondes.
+    Un DN inconnu est affiché par son cn.
+    """
+
+    def __init__(self, connection_factory=None, base_dn=None, ttl=3600, overrides_path=None,
+                 page_size=500, retry_delay=60):
+        self.connection_factory = connection_factory
+        self.base_dn = base_dn
+        self.ttl = ttl
+        self.overrides_path = overrides_path
+        self.page_size = page_size
+        self.retry_delay = retry_delay
+
+        self._overrides = {normalize_dn(dn): label for dn, label in group_label_map.items()}
+        if overrides_path:
+            self._overrides.update(load_overrides(overrides_path))
+        self._labels = {}  # DN normalisé -> libellé lu dans l'annuaire
+        self._next_load = 0
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.load_errors = 0
+
+    def _fetch(self):
+        labels = {}
+        with self.connection_factory() as connection:
+            for item in connection.extend.standard.paged_search(
+                    self.base_dn,
+                    "(objectClass=group)",
+                    attributes=LABEL_ATTRIBUTES,
+                    paged_size=self.page_size,
+                    generator=True):
+                if item.get('type') != 'searchResEntry':
+                    continue
+                attributes = item['attributes']
+                label = next((value for value in (_first(attributes, name) for name in LABEL_ATTRIBUTES) if value), '')
+                if label:
+                    labels[normalize_dn(item['dn'])] = label
+        return labels
+
+    def _refresh_if_stale(self):
+        if self.connection_factory is None or self.ttl <= 0:
+            return
+        now = time.monotonic()
+        if now < self._next_load:
+            return
+        with self._lock:
+            if time.monotonic() < self._next_load:
+                return
+            started = time.monotonic()
+            try:
+                labels = self._fetch()
+            except (LDAPException, OSError) as e:
+                self.load_errors += 1
+                self._next_load = time.monotonic() + self.retry_delay
+                logger.warning("Chargement des libellés de groupes impossible (%s libellés conservés) : %s",
+                               len(self._labels), e)
+                return
+            self._labels = labels
+            self.loads += 1
+            self._loaded_at = time.monotonic()
+            self._next_load = self._loaded_at + self.ttl
+            logger.info("Libellés de groupes chargés : %s groupes en %.2f s.", len(labels), self._loaded_at - started)
+
+    def invalidate(self):
+        """Force un rechargement au prochain appel (par exemple après une modification d'un groupe)."""
+        self._next_load = 0
+
+    def resolve(self, dns):
+        """Renvoie la liste des libellés des DN fournis, dans le même ordre."""
+        dns = list(dns)
+        if not dns:
+            return []
+        self._refresh_if_stale()
+        overrides, labels = self._overrides, self._labels
+        resolved = []
+        for dn in dns:
+            key = normalize_dn(dn)
+            resolved.append(overrides.get(key) or labels.get(key) or cn_from_dn(dn))
+        return resolved
+
+    def resolve_map(self, dns):
+        """Comme `resolve`, mais renvoie un dictionnaire {DN: libellé}."""
+        dns = list(dns)
+        return dict(zip(dns, self.resolve(dns)))
+
+    def stats(self):
+        return {
+            "labels": len(self._labels),
+            "overrides": len(self._overrides),
+            "age": None if self._loaded_at is None else round(time.monotonic() - self._loaded_at, 1),
+            "ttl": self.ttl,
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+        }
+
+
+# Résolveur utilisé par les mails ; remplacé au démarrage de l'application par un résolveur
+# branché sur l'annuaire (sans annuaire, seuls les libellés statiques sont connus)
+_resolver = GroupLabelResolver()
+
+
+def set_resolver(resolver):
+    global _resolver
+    _resolver = resolver
+
+
+def get_resolver():
+    return _resolver
+
 
 def get_group_labels_from_dns(dn_list):
     """
-    Convertit une liste (ou un set) de DN LDAP en une liste de labels conviviaux.
-    Si un DN n'existe pas dans le dictionnaire, on renvoie le DN tel quel.
+    Convertit une liste (ou un set) de DN LDAP en une liste de libellés lisibles.
+    Un DN sans libellé connu est affiché par son cn.
     """
-    logger.debug("=== get_group_labels_from_dns ===")
-    logger.debug(f"Liste de DN reçue : {dn_list}")
-
-    labels = []
-    for dn in dn_list:
-        label = group_label_map.get(dn, dn)
-        if label == dn:
-            logger.debug(f"[group_labels] DN introuvable dans group_label_map => '{dn}' (fallback = DN)")
-        else:
-            logger.debug(f"[group_labels] DN matché : '{dn}' => Label : '{label}'")
-        labels.append(label)
-
-    logger.debug(f"Labels finaux : {labels}")
-    logger.debug("=================================\n")
-    return labels
+    return _resolver.resolve(dn_list)
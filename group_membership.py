@@ -0,0 +1,188 @@
+# group_membership.py
+
+import logging
+
+from ldap3 import MODIFY_ADD, MODIFY_DELETE, BASE
+from ldap3.utils.conv import escape_filter_chars
+
+logger = logging.getLogger(__name__)
+
+RESULT_NO_SUCH_ATTRIBUTE = 16
+RESULT_CONSTRAINT_VIOLATION = 19
+RESULT_ATTRIBUTE_OR_VALUE_EXISTS = 20
+RESULT_INVALID_ATTRIBUTE_SYNTAX = 21
+RESULT_NO_SUCH_OBJECT = 32
+RESULT_UNWILLING_TO_PERFORM = 53
+RESULT_ENTRY_ALREADY_EXISTS = 68
+
+# Codes renvoyés par l'AD quand un membre est déjà présent (ajout) ou absent (retrait)
+MEMBERSHIP_CONFLICT_RESULTS = {
+    RESULT_NO_SUCH_ATTRIBUTE,
+    RESULT_ATTRIBUTE_OR_VALUE_EXISTS,
+    RESULT_UNWILLING_TO_PERFORM,
+    RESULT_ENTRY_ALREADY_EXISTS,
+}
+
+# Codes pour lesquels le refus peut ne concerner qu'une partie des membres (membre
+# inexistant, valeur refusée) : le lot est alors scindé pour isoler les DN en cause
+SPLITTABLE_RESULTS = MEMBERSHIP_CONFLICT_RESULTS | {
+    RESULT_NO_SUCH_OBJECT,
+    RESULT_CONSTRAINT_VIOLATION,
+    RESULT_INVALID_ATTRIBUTE_SYNTAX,
+}
+
+MEMBER_SEARCH_BATCH_SIZE = 100
+
+
+class GroupMembershipWriter:
+    """
+    Regroupe les ajouts et retraits de membres par groupe, puis les applique avec
+    une seule modification LDAP par groupe (tous les membres dans la même opération).
+
+    Si la modification groupée est refusée parce qu'une partie des membres est déjà
+    présente (ajout) ou absente (retrait), l'appartenance actuelle des membres concernés
+    est lue en une recherche et la modification est rejouée pour le reste seulement.
+    Si elle est encore refusée (membre inexistant, valeur invalide...), le lot est scindé
+    en deux moitiés, récursivement, jusqu'à isoler les DN refusés : les autres membres
+    sont appliqués et les DN en cause rapportés dans `failed` (détail dans `errors`).
+    Un groupe inexistant fait échouer tous ses membres sans scission.
+
+    `flush` renvoie un résultat par groupe :
+    {"status": "ok" | "partial" | "error", "added": [...], "removed": [...],
+     "already_member": [...], "not_member": [...], "failed": [...],
+     "errors": {DN: description}, "error": "..."}
+    """
+
+    def __init__(self, base_dn):
+        self.base_dn = base_dn
+        self._groups = {}  # DN du groupe en minuscules -> (DN, ajouts, retraits)
+
+    def _pending(self, group_dn):
+        key = group_dn.lower()
+        if key not in self._groups:
+            self._groups[key] = (group_dn, {}, {})
+        return self._groups[key]
+
+    def add(self, group_dn, member_dn):
+        """Programme l'ajout de member_dn au groupe."""
+        if group_dn and member_dn:
+            _, additions, removals = self._pending(group_dn)
+            removals.pop(member_dn.lower(), None)
+            additions[member_dn.lower()] = member_dn
+
+    def remove(self, group_dn, member_dn):
+        """Programme le retrait de member_dn du groupe."""
+        if group_dn and member_dn:
+            _, additions, removals = self._pending(group_dn)
+            additions.pop(member_dn.lower(), None)
+            removals[member_dn.lower()] = member_dn
+
+    def pending_groups(self):
+        return len(self._groups)
+
+    # ------------------ APPLICATION ------------------
+
+    @staticmethod
+    def _changes(additions, removals):
+        operations = []
+        if additions:
+            operations.append((MODIFY_ADD, additions))
+        if removals:
+            operations.append((MODIFY_DELETE, removals))
+        return {'member': operations}
+
+    def _current_members(self, ldap_connection, group_dn, member_dns):
+        """Renvoie, parmi member_dns, ceux qui sont actuellement membres directs du groupe."""
+        current = set()
+        escaped_group = escape_filter_chars(group_dn)
+        for start in range(0, len(member_dns), MEMBER_SEARCH_BATCH_SIZE):
+            batch = member_dns[start:start + MEMBER_SEARCH_BATCH_SIZE]
+            members_filter = "".join(f"(distinguishedName={escape_filter_chars(dn)})" for dn in batch)
+            ldap_connection.search(
+                self.base_dn,
+                f"(&(memberOf={escaped_group})(|{members_filter}))",
+                attributes=['distinguishedName']
+            )
+            current.update(str(entry.entry_dn).lower() for entry in ldap_connection.entries)
+        return current
+
+    def _group_exists(self, ldap_connection, group_dn):
+        ldap_connection.search(group_dn, '(objectClass=*)', search_scope=BASE, attributes=['1.1'])
+        return bool(ldap_connection.entries)
+
+    def _split_apply(self, ldap_connection, group_dn, adds, removes, outcome):
+        """Applique les membres par moitiés successives pour isoler ceux que l'annuaire refuse."""
+        items = [(MODIFY_ADD, dn) for dn in adds] + [(MODIFY_DELETE, dn) for dn in removes]
+        pending = [items]
+        while pending:
+            chunk = pending.pop()
+            chunk_adds = [dn for operation, dn in chunk if operation == MODIFY_ADD]
+            chunk_removes = [dn for operation, dn in chunk if operation == MODIFY_DELETE]
+            if ldap_connection.modify(group_dn, self._changes(chunk_adds, chunk_removes)):
+                outcome["added"].extend(chunk_adds)
+                outcome["removed"].extend(chunk_removes)
+                continue
+            result = ldap_connection.result
+            if len(chunk) > 1:
+                middle = len(chunk) // 2
+                pending.extend((chunk[middle:], chunk[:middle]))
+                continue
+            operation, dn = chunk[0]
+            if result.get('result') in MEMBERSHIP_CONFLICT_RESULTS:
+                outcome["already_member" if operation == MODIFY_ADD else "not_member"].append(dn)
+                continue
+            outcome["failed"].append(dn)
+            outcome["errors"][dn] = result.get('description')
+            logger.warning("Membre %s refusé pour le groupe %s : %s", dn, group_dn, result.get('description'))
+
+    def _flush_group(self, ldap_connection, group_dn, additions, removals):
+        outcome = {"added": [], "removed": [], "already_member": [], "not_member": [], "failed": [], "errors": {}}
+        adds = list(additions.values())
+        removes = list(removals.values())
+
+        if ldap_connection.modify(group_dn, self._changes(adds, removes)):
+            outcome["added"], outcome["removed"] = adds, removes
+            return outcome
+
+        result = ldap_connection.result
+        if result.get('result') in MEMBERSHIP_CONFLICT_RESULTS:
+            current = self._current_members(ldap_connection, group_dn, adds + removes)
+            outcome["already_member"] = [dn for dn in adds if dn.lower() in current]
+            outcome["not_member"] = [dn for dn in removes if dn.lower() not in current]
+            adds = [dn for dn in adds if dn.lower() not in current]
+            removes = [dn for dn in removes if dn.lower() in current]
+            if not adds and not removes:
+                return outcome
+            if ldap_connection.modify(group_dn, self._changes(adds, removes)):
+                outcome["added"], outcome["removed"] = adds, removes
+                return outcome
+            result = ldap_connection.result
+
+        if result.get('result') in SPLITTABLE_RESULTS and self._group_exists(ldap_connection, group_dn):
+            self._split_apply(ldap_connection, group_dn, adds, removes, outcome)
+            if outcome["failed"]:
+                outcome["error"] = result.get('description')
+            return outcome
+
+        outcome["failed"] = adds + removes
+        outcome["error"] = result.get('description')
+        logger.error("Échec de la mise à jour des membres du groupe %s : %s", group_dn, result.get('description'))
+        return outcome
+
+    def flush(self, ldap_connection):
+        """Applique toutes les modifications en attente et renvoie {DN du groupe: résultat}."""
+        outcomes = {}
+        groups, self._groups = self._groups, {}
+        for group_dn, additions, removals in groups.values():
+            if not additions and not removals:
+                continue
+            outcome = self._flush_group(ldap_connection, group_dn, additions, removals)
+            succeeded = outcome["added"] or outcome["removed"] or outcome["already_member"] or outcome["not_member"]
+            if not outcome["failed"]:
+                outcome["status"] = "ok"
+            elif succeeded:
+                outcome["status"] = "partial"
+            else:
+                outcome["status"] = "error"
+            outcomes[group_dn] = outcome
+        return outcomes
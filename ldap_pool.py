@@ -0,0 +1,298 @@
+# ldap_pool.py
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from ldap3 import Server, SYNC, BASE, ANONYMOUS
+from ldap3.core.exceptions import (
+    LDAPException, LDAPBindError, LDAPCommunicationError, LDAPSocketOpenError, LDAPServerPoolExhaustedError
+)
+
+from ldap_servers import DomainControllerPool
+from metrics import InstrumentedConnection
+
+logger = logging.getLogger(__name__)
+
+
+class LdapPoolTimeout(LDAPException):
+    """
+    Levée lorsqu'aucune connexion n'a pu être obtenue du pool dans le délai imparti.
+    """
+
+
+class LdapConnectionPool:
+    """
+    Pool borné et thread-safe de connexions LDAP authentifiées avec un compte de service.
+
+    Toutes les connexions partagent le même objet Server : la poignée de main TLS,
+    le bind et la lecture des informations du serveur ne sont faits qu'à l'ouverture
+    d'une connexion, puis la connexion est réutilisée d'une requête à l'autre.
+
+    `server` peut aussi être un DomainControllerPool : chaque nouvelle connexion est alors
+    ouverte sur le contrôleur le plus rapide disponible, les durées de bind et de vérification
+    lui sont signalées et une erreur de communication le déclare hors service.
+
+    - size : nombre maximal de connexions ouvertes simultanément ;
+    - idle_timeout : durée (s) au-delà de laquelle une connexion inutilisée est fermée ;
+    - check_interval : durée (s) d'inactivité après laquelle une connexion est vérifiée
+      avant d'être prêtée ;
+    - acquire_timeout : attente maximale (s) d'une connexion libre ;
+    - client_strategy : stratégie ldap3 (SYNC en production, MOCK_SYNC pour les tests) ;
+    - receive_timeout : attente maximale (s) d'une réponse du serveur pour chaque opération
+      (None : pas de limite) ; au-delà, la connexion est considérée comme perdue ;
+    - require_bound : si False, une connexion restée non authentifiée (après un bind refusé
+      par verify_credentials) est conservée, à l'emprunt comme à la restitution ; seul
+      l'état du canal est vérifié.
+    """
+
+    def __init__(self, server, user, password, size=5, idle_timeout=300,
+                 check_interval=60, acquire_timeout=10, client_strategy=SYNC, receive_timeout=None,
+                 require_bound=True):
+        if size < 1:
+            raise ValueError("La taille du pool LDAP doit être au moins 1.")
+        self.server = server
+        self.user = user
+        self.password = password
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.acquire_timeout = acquire_timeout
+        self.client_strategy = client_strategy
+        self.receive_timeout = receive_timeout
+        self.require_bound = require_bound
+
+        self._idle = []  # pile LIFO de tuples (connexion, horodatage du dernier retour)
+        self._in_use = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        # Durée d'ouverture des connexions (socket, TLS, bind) : nombre et cumul
+        self.connects = 0
+        self.connect_seconds = 0.0
+        self.last_connect_seconds = None
+
+    # ------------------ OUVERTURE / FERMETURE ------------------
+
+    def _open_connection(self, retries=1):
+        """
+        Ouvre et authentifie une nouvelle connexion.
+        En cas d'échec d'ouverture de socket, on retente une fois avant d'abandonner.
+        """
+        attempt = 0
+        while True:
+            try:
+                target = self._target()
+                started = time.monotonic()
+                connection = InstrumentedConnection(
+                    target,
+                    user=self.user,
+                    password=self.password,
+                    client_strategy=self.client_strategy,
+                    receive_timeout=self.receive_timeout
+                )
+                # Bind explicite (et non auto_bind) pour rester compatible avec MOCK_SYNC
+                if not connection.bind():
+                    raise LDAPBindError(f"Échec du bind LDAP du pool : {connection.result.get('description')}")
+                elapsed = time.monotonic() - started
+                self._observe(connection, elapsed)
+                with self._condition:
+                    self.connects += 1
+                    self.connect_seconds += elapsed
+                    self.last_connect_seconds = elapsed
+                logger.info("Nouvelle connexion LDAP ouverte dans le pool en %.3f s.", elapsed)
+                return connection
+            except (LDAPSocketOpenError, LDAPServerPoolExhaustedError) as e:
+                # Avec un ServerPool, les contrôleurs injoignables sont déjà écartés par ldap3
+                if isinstance(target, Server):
+                    self._mark_failed(target, e)
+                attempt += 1
+                if attempt > retries:
+                    raise
+                logger.warning("Ouverture de socket LDAP impossible, nouvelle tentative (%s/%s).", attempt, retries)
+
+    def _target(self):
+        """Server (ou ServerPool ldap3) sur lequel ouvrir une nouvelle connexion."""
+        if isinstance(self.server, DomainControllerPool):
+            return self.server.server_pool()
+        return self.server
+
+    def _observe(self, connection, seconds):
+        if isinstance(self.server, DomainControllerPool):
+            self.server.observe(connection.server, seconds)
+
+    def _mark_failed(self, server, error):
+        if server is not None and isinstance(self.server, DomainControllerPool):
+            self.server.mark_failed(server, error)
+
+    @staticmethod
+    def _close_connection(connection):
+        try:
+            connection.unbind()
+        except LDAPException:
+            logger.debug("Fermeture d'une connexion LDAP déjà interrompue.", exc_info=True)
+
+    def _is_healthy(self, connection):
+        """
+        Vérifie qu'une connexion est toujours utilisable par une lecture du Root DSE.
+        Seule une erreur de communication rend la connexion inutilisable.
+        """
+        if connection.closed or (self.require_bound and not connection.bound):
+            return False
+        started = time.monotonic()
+        try:
+            connection.search('', '(objectClass=*)', search_scope=BASE, attributes=['1.1'])
+        except LDAPCommunicationError as e:
+            self._mark_failed(connection.server, e)
+            return False
+        except LDAPException:
+            # Refus du serveur (ou base non gérée par MOCK_SYNC) : le canal reste valide
+            return True
+        self._observe(connection, time.monotonic() - started)
+        return True
+
+    def _evict_idle(self, now):
+        """Ferme les connexions restées inactives plus de idle_timeout secondes (verrou tenu)."""
+        expired = [item for item in self._idle if now - item[1] > self.idle_timeout]
+        if expired:
+            self._idle = [item for item in self._idle if now - item[1] <= self.idle_timeout]
+        return [connection for connection, _ in expired]
+
+    # ------------------ EMPRUNT / RESTITUTION ------------------
+
+    def acquire(self):
+        """
+        Emprunte une connexion liée. Attend au plus acquire_timeout secondes
+        si toutes les connexions sont déjà utilisées.
+        """
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise LdapPoolTimeout("Le pool de connexions LDAP est fermé")
+                now = time.monotonic()
+                expired = self._evict_idle(now)
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._in_use < self.size:
+                    connection, last_used = None, None
+                    self._in_use += 1
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise LdapPoolTimeout("Aucune connexion LDAP disponible dans le pool")
+                self._condition.wait(remaining)
+
+        for stale in expired:
+            self._close_connection(stale)
+
+        try:
+            if connection is not None and (
+                    connection.closed or (self.require_bound and not connection.bound) or
+                    (time.monotonic() - last_used > self.check_interval and not self._is_healthy(connection))):
+                logger.info("Connexion LDAP du pool inutilisable, reconnexion.")
+                self._close_connection(connection)
+                connection = None
+            if connection is None:
+                connection = self._open_connection()
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+        return connection
+
+    def release(self, connection, discard=False):
+        """
+        Rend une connexion au pool. Si discard est vrai (erreur de communication
+        pendant l'emprunt), la connexion est fermée au lieu d'être réutilisée.
+        """
+        close = discard or connection.closed or (self.require_bound and not connection.bound)
+        if discard:
+            self._mark_failed(connection.server, "erreur de communication")
+        with self._condition:
+            self._in_use -= 1
+            if not close and not self._closed:
+                self._idle.append((connection, time.monotonic()))
+            else:
+                close = True
+            self._condition.notify()
+        if close:
+            self._close_connection(connection)
+
+    @contextmanager
+    def connection(self):
+        """
+        Gestionnaire de contexte : emprunte une connexion et la rend au pool en sortie.
+        """
+        connection = self.acquire()
+        discard = False
+        try:
+            yield connection
+        except LDAPCommunicationError:
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard=discard)
+
+    def close(self):
+        """Ferme toutes les connexions inactives et refuse les emprunts suivants."""
+        with self._condition:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle = []
+            self._condition.notify_all()
+        for connection in idle:
+            self._close_connection(connection)
+
+    def verify_credentials(self, user_dn, password):
+        """
+        Vérifie un mot de passe par un nouveau bind sur une connexion du pool, sans nouvelle
+        poignée de main TLS. Après un bind réussi, la connexion est liée de nouveau au compte
+        de service avant d'être rendue (elle ne reste pas authentifiée comme le dernier
+        utilisateur connecté) ; après un bind refusé, elle reste anonyme et est conservée
+        telle quelle : à n'utiliser que sur un pool dédié (require_bound=False).
+        Renvoie True si le bind réussit.
+        """
+        if not user_dn or not password:
+            # Un bind simple avec mot de passe vide serait accepté comme bind anonyme
+            return False
+        connection = self.acquire()
+        discard = False
+        try:
+            started = time.monotonic()
+            verified = bool(connection.rebind(user=user_dn, password=password, read_server_info=False))
+            self._observe(connection, time.monotonic() - started)
+            if verified:
+                if self.user:
+                    restored = connection.rebind(user=self.user, password=self.password, read_server_info=False)
+                else:
+                    restored = connection.rebind(authentication=ANONYMOUS, read_server_info=False)
+                if not restored:
+                    logger.warning("Retour au compte de service impossible après vérification, connexion fermée.")
+                    self._close_connection(connection)
+            else:
+                # Bind refusé : la connexion est anonyme ; on n'y garde pas le mot de passe essayé
+                connection.user, connection.password = self.user, self.password
+            return verified
+        except (LDAPCommunicationError, LDAPBindError):
+            # ldap3 signale une coupure pendant le rebind par LDAPBindError : canal à écarter
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard=discard)
+
+    def stats(self):
+        """Renvoie l'état courant du pool (connexions inactives, empruntées, taille max, durée d'ouverture)."""
+        with self._condition:
+            return {
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "size": self.size,
+                "connects": self.connects,
+                "avg_connect_ms": round(self.connect_seconds / self.connects * 1000, 1) if self.connects else None,
+                "last_connect_ms": None if self.last_connect_seconds is None
+                else round(self.last_connect_seconds * 1000, 1),
+            }
@@ -0,0 +1,157 @@
+# ldap_schema.py
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from ldap3 import Server, Connection, ALL
+from ldap3.core.exceptions import LDAPException
+from ldap3.protocol.rfc4512 import DsaInfo, SchemaInfo
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaSnapshot:
+    """
+    Copie locale (fichier JSON) du schéma et des informations DSA (Root DSE) de l'annuaire.
+
+    Les serveurs du DomainControllerPool sont créés sans lecture d'informations
+    (get_info=NONE) : sans cela, chaque nouvelle connexion téléchargerait le schéma complet
+    (plusieurs centaines de Ko pour Active Directory). Le schéma est lu une fois, enregistré
+    dans `path`, rechargé hors ligne au démarrage puis rafraîchi par un thread de fond toutes
+    les `refresh_interval` secondes (ou au démarrage si la copie est absente ou trop ancienne).
+
+    Le schéma étant commun à la forêt, la même copie est attachée à tous les contrôleurs ;
+    les informations DSA sont celles du contrôleur qui a servi à la lecture.
+    """
+
+    def __init__(self, path, domain_controllers, refresh_interval=86400):
+        self.path = path
+        self.domain_controllers = domain_controllers
+        self.refresh_interval = refresh_interval
+        self.saved_at = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ------------------ FICHIER LOCAL ------------------
+
+    def load(self):
+        """Charge la copie locale et l'attache aux serveurs ; renvoie False si elle est absente ou illisible."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, encoding='utf-8') as fp:
+                snapshot = json.load(fp)
+            dsa_info = DsaInfo.from_json(snapshot['dsa_info'])
+            schema = SchemaInfo.from_json(snapshot['schema'])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Copie locale du schéma LDAP illisible (%s) : %s", self.path, e)
+            return False
+        self._attach(dsa_info, schema)
+        self.saved_at = snapshot.get('saved_at')
+        logger.info("Schéma LDAP chargé depuis %s.", self.path)
+        return True
+
+    def _save(self, dsa_info, schema, saved_at):
+        """
+        Écriture atomique de la copie locale, par un fichier temporaire propre à l'appelant
+        (plusieurs processus mod_wsgi et le script de suppression peuvent rafraîchir en même temps).
+        """
+        snapshot = {
+            'saved_at': saved_at,
+            'dsa_info': dsa_info.to_json(),
+            'schema': schema.to_json(),
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                        prefix=os.path.basename(self.path) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+                json.dump(snapshot, fp)
+            # mkstemp crée le fichier en 0600 : la copie doit rester lisible par le script de suppression
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _attach(self, dsa_info, schema):
+        for server in self.domain_controllers.servers:
+            server.attach_dsa_info(dsa_info)
+            server.attach_schema_info(schema)
+
+    # ------------------ LECTURE DEPUIS L'ANNUAIRE ------------------
+
+    def refresh(self):
+        """Lit le schéma et le Root DSE sur le contrôleur le plus rapide, puis met à jour la copie locale."""
+        dcs = self.domain_controllers
+        source = dcs.ordered_servers()[0]
+        server = Server(source.host, port=source.port, use_ssl=source.ssl, get_info=ALL,
+                        connect_timeout=source.connect_timeout)
+        started = time.monotonic()
+        connection = Connection(server, user=dcs.user, password=dcs.password,
+                                client_strategy=dcs.client_strategy, receive_timeout=dcs.receive_timeout)
+        try:
+            if not connection.bind():
+                raise LDAPException(f"bind refusé : {connection.result.get('description')}")
+            if server.info is None or server.schema is None:
+                raise LDAPException("schéma ou Root DSE non renvoyé par le serveur")
+        finally:
+            try:
+                connection.unbind()
+            except LDAPException:
+                pass
+        self._attach(server.info, server.schema)
+        # Le schéma est en mémoire même si la copie locale ne peut pas être écrite :
+        # le prochain téléchargement n'a lieu qu'après refresh_interval
+        self.saved_at = time.time()
+        logger.info("Schéma LDAP lu sur %s en %.2f s.", source.host, time.monotonic() - started)
+        if self.path:
+            try:
+                self._save(server.info, server.schema, self.saved_at)
+            except OSError as e:
+                self.last_error = f"copie locale non enregistrée : {e}"
+                logger.warning("Copie locale du schéma LDAP non enregistrée (%s) : %s", self.path, e)
+
+    def _is_stale(self):
+        return self.saved_at is None or time.time() - self.saved_at >= self.refresh_interval
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._is_stale():
+                try:
+                    self.last_error = None
+                    self.refresh()
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.warning("Lecture du schéma LDAP impossible, nouvel essai plus tard : %s", e)
+                    self._stop.wait(min(self.refresh_interval, 300))
+                    continue
+            delay = self.refresh_interval - (time.time() - self.saved_at) if self.saved_at else self.refresh_interval
+            self._stop.wait(max(delay, 1))
+
+    def start(self):
+        """Charge la copie locale puis démarre le rafraîchissement en arrière-plan."""
+        self.load()
+        if self.refresh_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="ldap-schema-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "loaded": self.domain_controllers.servers[0].schema is not None,
+            "age": None if self.saved_at is None else round(time.time() - self.saved_at, 1),
+            "refresh_interval": self.refresh_interval,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,191 @@
+# ldap_servers.py
+
+import logging
+import threading
+import time
+
+from ldap3 import Server, ServerPool, Connection, SYNC, BASE, FIRST, NONE, set_config_parameter
+from ldap3.core.exceptions import LDAPException
+
+logger = logging.getLogger(__name__)
+
+# ldap3 attend POOLING_LOOP_TIMEOUT secondes (10 par défaut) après un tour infructueux du
+# ServerPool avant de lever LDAPServerPoolExhaustedError : avec un seul tour (active=1),
+# l'échec doit remonter immédiatement, la réadmission des contrôleurs étant faite par la sonde.
+set_config_parameter('POOLING_LOOP_TIMEOUT', 0)
+
+
+def parse_server_list(value, default_port):
+    """'dc1.example.com, dc2.example.com:3269' -> [('dc1.example.com', 636), ('dc2.example.com', 3269)]."""
+    servers = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(':') if item.count(':') == 1 else (item, '', '')
+        servers.append((host, int(port)) if port else (item, default_port))
+    return servers
+
+
+class DomainControllerPool:
+    """
+    Ensemble de contrôleurs de domaine interchangeables, ordonnés par latence mesurée.
+
+    - chaque contrôleur est sondé toutes les `probe_interval` secondes (ouverture, bind,
+      lecture du Root DSE) par un thread de fond, y compris ceux déclarés hors service ;
+    - la latence retenue est une moyenne mobile exponentielle (coefficient `alpha`) des
+      sondes et des opérations signalées par `observe` ;
+    - un contrôleur en échec (sonde ou erreur de communication signalée par `mark_failed`)
+      passe en fin de liste jusqu'à ce qu'une sonde réussisse à nouveau (réadmission) ;
+    - `server_pool` renvoie un ServerPool ldap3 (stratégie FIRST, un seul tour) dans cet
+      ordre : à l'ouverture d'une connexion, ldap3 passe au contrôleur suivant si le premier
+      ne répond pas dans `connect_timeout` secondes.
+
+    Les serveurs ne lisent ni le schéma ni le Root DSE à la connexion (get_info=NONE) :
+    ces informations sont fournies par ldap_schema.SchemaSnapshot.
+
+    `probe` permet de remplacer la sonde (callable recevant un Server et renvoyant sa durée
+    en secondes, ou levant une exception) : les tests peuvent ainsi injecter des délais.
+    """
+
+    def __init__(self, hosts, user, password, use_ssl=True, connect_timeout=5, receive_timeout=None,
+                 probe_interval=30, alpha=0.3, client_strategy=SYNC, get_info=NONE, probe=None):
+        if not hosts:
+            raise ValueError("Au moins un contrôleur de domaine doit être configuré.")
+        self.user = user
+        self.password = password
+        self.receive_timeout = receive_timeout
+        self.probe_interval = probe_interval
+        self.alpha = alpha
+        self.client_strategy = client_strategy
+        self.probe = probe or self._probe
+        self.servers = [
+            Server(host, port=port, use_ssl=use_ssl, get_info=get_info, connect_timeout=connect_timeout)
+            for host, port in hosts
+        ]
+        # Par serveur : latence moyenne (None tant qu'aucune mesure), disponibilité, compteurs
+        self._state = {
+            id(server): {"latency": None, "up": True, "failures": 0, "last_probe": None, "last_error": None}
+            for server in self.servers
+        }
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ------------------ MESURES ------------------
+
+    def _probe(self, server):
+        started = time.monotonic()
+        connection = Connection(server, user=self.user, password=self.password,
+                                client_strategy=self.client_strategy, receive_timeout=self.receive_timeout)
+        try:
+            if not connection.bind():
+                raise LDAPException(f"bind refusé : {connection.result.get('description')}")
+            connection.search('', '(objectClass=*)', search_scope=BASE, attributes=['1.1'])
+        finally:
+            try:
+                connection.unbind()
+            except LDAPException:
+                pass
+        return time.monotonic() - started
+
+    def _find(self, server):
+        """État d'un serveur du pool (None pour un serveur étranger)."""
+        return self._state.get(id(server))
+
+    def observe(self, server, seconds):
+        """
+        Intègre une durée mesurée (bind, recherche...) à la latence moyenne du serveur.
+        Une opération réussie réadmet un serveur déclaré hors service (seul moyen de
+        réadmission quand la sonde ne tourne pas, avec un seul contrôleur).
+        """
+        state = self._find(server)
+        if state is None:
+            return
+        with self._lock:
+            latency = state["latency"]
+            state["latency"] = seconds if latency is None else self.alpha * seconds + (1 - self.alpha) * latency
+            if not state["up"]:
+                logger.info("Contrôleur %s de nouveau disponible (%.3f s).", server.host, seconds)
+                state["up"] = True
+                state["last_error"] = None
+
+    def mark_failed(self, server, error=None):
+        """Déclare un serveur hors service jusqu'à la prochaine sonde réussie."""
+        state = self._find(server)
+        if state is None:
+            return
+        with self._lock:
+            if state["up"]:
+                logger.warning("Contrôleur %s déclaré hors service : %s", server.host, error)
+            state["up"] = False
+            state["failures"] += 1
+            state["last_error"] = None if error is None else str(error)
+
+    def probe_all(self):
+        """Sonde tous les contrôleurs (appelée périodiquement par le thread de fond)."""
+        for server in self.servers:
+            state = self._find(server)
+            try:
+                seconds = self.probe(server)
+            except Exception as e:
+                self.mark_failed(server, e)
+                with self._lock:
+                    state["last_probe"] = time.time()
+                continue
+            self.observe(server, seconds)
+            with self._lock:
+                state["last_probe"] = time.time()
+
+    # ------------------ SÉLECTION ------------------
+
+    def ordered_servers(self):
+        """Contrôleurs disponibles du plus rapide au plus lent (non mesurés ensuite), puis ceux hors service."""
+        with self._lock:
+            def key(item):
+                index, server = item
+                state = self._state[id(server)]
+                return (not state["up"], state["latency"] is None, state["latency"] or 0, index)
+            return [server for _, server in sorted(enumerate(self.servers), key=key)]
+
+    def server_pool(self):
+        """ServerPool ldap3 à utiliser pour ouvrir une nouvelle connexion."""
+        servers = self.ordered_servers()
+        if len(servers) == 1:
+            return servers[0]
+        return ServerPool(servers, FIRST, active=1, exhaust=False)
+
+    # ------------------ SONDE PÉRIODIQUE ------------------
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.probe_all()
+            except Exception:
+                logger.exception("Erreur lors de la sonde des contrôleurs de domaine")
+            self._stop.wait(self.probe_interval)
+
+    def start(self):
+        """Démarre la sonde périodique (inutile avec un seul contrôleur)."""
+        if len(self.servers) < 2 or self.probe_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="ldap-dc-probe", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return [
+                {
+                    "host": server.host,
+                    "port": server.port,
+                    "up": self._state[id(server)]["up"],
+                    "latency_ms": None if self._state[id(server)]["latency"] is None
+                    else round(self._state[id(server)]["latency"] * 1000, 1),
+                    "failures": self._state[id(server)]["failures"],
+                    "last_error": self._state[id(server)]["last_error"],
+                }
+                for server in self.servers
+            ]
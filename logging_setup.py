@@ -0,0 +1,179 @@
+# logging_setup.py
+
+import atexit
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import uuid
+
+"""
+Configuration des journaux de l'application.
+
+Les threads des requêtes ne font que déposer les enregistrements dans une file
+(QueueHandler) ; l'écriture sur disque ou sur stderr, le masquage des secrets et la mise
+en forme (JSON ou texte) sont faits par le thread du QueueListener. Chaque enregistrement
+porte l'identifiant de la requête Flask en cours (en-tête X-Request-ID).
+"""
+
+# Identifiant de la requête en cours ('-' hors requête : threads de fond, script...)
+request_id_var = contextvars.ContextVar('request_id', default='-')
+
+# Valeurs masquées dans les messages : mots de passe, jetons et secrets sous forme
+# clé=valeur, "clé": "valeur" ou 'clé': 'valeur', ainsi que les jetons JWT
+SECRET_KEYS = r"(?:password|passwd|pwd|mot de passe(?: généré)?|secret(?:_key)?|token|authToken|newPassword)"
+SECRET_PATTERNS = [
+    re.compile(r"(?i)(['\"]?" + SECRET_KEYS + r"['\"]?\s*[:=]\s*)(['\"])(?:\\.|(?!\2).)*\2"),
+    re.compile(r"(?i)(\b" + SECRET_KEYS + r"\b\s*[:=]\s*)(?!['\"])[^\s,;}]+"),
+    re.compile(r"\beyJ[\w-]+\.[\w-]+\.[\w-]+"),
+]
+REDACTED = "***"
+
+_listener = None
+_exception_formatter = logging.Formatter()
+# Identifiant de requête accepté depuis l'en-tête X-Request-ID (sinon un nouveau est généré)
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+
+def redact(text):
+    """Masque les secrets reconnus dans un texte de journal."""
+    text = SECRET_PATTERNS[0].sub(lambda m: f"{m.group(1)}{m.group(2)}{REDACTED}{m.group(2)}", text)
+    text = SECRET_PATTERNS[1].sub(lambda m: f"{m.group(1)}{REDACTED}", text)
+    return SECRET_PATTERNS[2].sub(REDACTED, text)
+
+
+class RequestIdFilter(logging.Filter):
+    """Ajoute `request_id` à chaque enregistrement (dans le thread qui journalise)."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class RedactingFormatter(logging.Formatter):
+    """Format texte classique, secrets masqués."""
+
+    def format(self, record):
+        return redact(super().format(record))
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objet JSON par ligne : horodatage, niveau, module, identifiant de requête, message (secrets masqués)."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, 'request_id', '-'),
+            "thread": record.threadName,
+            "message": redact(record.getMessage()),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = redact(record.exc_text)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler qui abandonne l'enregistrement (et le compte) si la file est pleine.
+    Dans le thread appelant, seul le message est assemblé (et la trace d'une exception
+    mise en texte) ; la mise en forme complète est laissée au QueueListener.
+    """
+
+    dropped = 0
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+def parse_levels(value):
+    """'ldap3=WARNING, mail_utils=DEBUG' -> {'ldap3': 'WARNING', 'mail_utils': 'DEBUG'}."""
+    levels = {}
+    for item in (value or '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level='INFO', json_format=True, log_file=None, module_levels=None, queue_size=10000):
+    """
+    Remplace les gestionnaires du journal racine par un QueueHandler (non bloquant) dont la
+    file est vidée par un QueueListener vers stderr et, si `log_file` est fourni, vers ce
+    fichier (WatchedFileHandler : compatible avec logrotate). Au-delà de `queue_size`
+    enregistrements en attente, les nouveaux sont abandonnés plutôt que de bloquer.
+    `module_levels` fixe un niveau par module ({'ldap3': 'WARNING'}). Sans effet si les
+    journaux sont déjà configurés par ce module (import multiple sous mod_wsgi).
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    root = logging.getLogger()
+
+    formatter = JsonFormatter() if json_format else RedactingFormatter(
+        '%(asctime)s - %(levelname)s - %(name)s - [%(request_id)s] %(message)s')
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        handlers.append(logging.handlers.WatchedFileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    for name, module_level in (module_levels or {}).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
+
+
+def init_app(app):
+    """Attribue un identifiant à chaque requête (X-Request-ID reçu ou généré) et le renvoie dans la réponse."""
+    from flask import g, request
+
+    @app.before_request
+    def _assign_request_id():
+        request_id = request.headers.get('X-Request-ID', '')
+        if not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        g.request_id_token = request_id_var.set(request_id)
+
+    @app.after_request
+    def _return_request_id(response):
+        response.headers['X-Request-ID'] = request_id_var.get()
+        return response
+
+    @app.teardown_request
+    def _clear_request_id(exc):
+        token = g.pop('request_id_token', None)
+        if token is not None:
+            request_id_var.reset(token)
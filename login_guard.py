@@ -0,0 +1,110 @@
+# login_guard.py
+
+import threading
+import time
+from collections import OrderedDict
+
+from rate_limit import SlidingWindowLimiter
+
+
+class UnknownUserCache:
+    """
+    Cache négatif des identifiants (UPN) absents de l'annuaire.
+
+    Un UPN introuvable est mémorisé `ttl` secondes : les tentatives suivantes sont refusées
+    sans interroger les contrôleurs de domaine. Les UPN sont comparés sans tenir compte de
+    la casse (comme le fait Active Directory) et au plus `max_entries` sont conservés (LRU).
+    """
+
+    def __init__(self, ttl=60, max_entries=4096):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # upn -> expiration
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def contains(self, upn):
+        if not self.enabled:
+            return False
+        key = upn.lower()
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is None:
+                return False
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return False
+            self.hits += 1
+            return True
+
+    def add(self, upn):
+        if not self.enabled:
+            return
+        key = upn.lower()
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Appelée après une création de compte : un UPN inconnu peut désormais exister."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "ttl": self.ttl, "hits": self.hits}
+
+
+class LoginThrottle:
+    """
+    Limitation des tentatives de connexion par identifiant et par adresse IP (fenêtres glissantes).
+
+    `acquire` est appelée avant tout échange LDAP : la vérification des deux limites et
+    l'enregistrement de la tentative sont une seule opération du store, de sorte que des
+    tentatives simultanées (threads ou workers) ne peuvent pas toutes passer avant d'être
+    comptées. Une tentative refusée n'est pas comptée.
+
+    Une connexion réussie remet à zéro le compteur de l'identifiant et retire la tentative
+    du compteur de l'IP : seuls les échecs sont comptés par adresse, et des utilisateurs
+    derrière une même adresse (NAT) ne sont pas limités tant qu'ils se connectent.
+    Une limite nulle désactive le contrôle correspondant.
+    """
+
+    def __init__(self, per_user, per_ip, window, store=None):
+        self.user_limiter = SlidingWindowLimiter(per_user, window, store)
+        self.ip_limiter = SlidingWindowLimiter(per_ip, window, store)
+        self.rejected = 0
+
+    @staticmethod
+    def _user_key(upn):
+        return "user:" + upn.lower()
+
+    @staticmethod
+    def _ip_key(ip):
+        return "ip:" + (ip or "inconnue")
+
+    def acquire(self, upn, ip):
+        """
+        Compte la tentative si les deux limites le permettent. Renvoie (délai, ticket) :
+        délai 0 si la tentative est admise, sinon délai (secondes, arrondi au supérieur)
+        avant une nouvelle tentative. Le ticket est à passer à `succeeded`.
+        """
+        user_key, ip_key = self._user_key(upn), self._ip_key(ip)
+        delay, user_ts = self.user_limiter.try_hit(user_key)
+        if not delay:
+            delay, ip_ts = self.ip_limiter.try_hit(ip_key)
+            if not delay:
+                return 0, ip_ts
+            self.user_limiter.refund(user_key, user_ts)
+        self.rejected += 1
+        return int(delay) + 1, None
+
+    def succeeded(self, upn, ip, ticket):
+        self.user_limiter.reset(self._user_key(upn))
+        self.ip_limiter.refund(self._ip_key(ip), ticket)
@@ -0,0 +1,129 @@
+# mail_templates.py
+
+from jinja2 import DictLoader, Environment, StrictUndefined
+
+"""
+Modèles HTML des mails envoyés par l'application.
+Les modèles sont compilés une seule fois au chargement du module, partagent la même
+feuille de style (modèle "base.html") et échappent automatiquement les valeurs.
+"""
+
+BASE_CSS = """      body {
+        font-family: Arial, sans-serif;
+        margin: 0;
+        padding: 0;
+      }
+      table {
+        font-family: Arial, sans-serif;
+        border-collapse: collapse;
+      }
+      th, td {
+        padding: 5px 10px;
+        text-align: left;
+      }"""
+
+TEMPLATES = {
+    "base.html": """<html>
+  <head>
+    <style>
+{{ css }}
+    </style>
+  </head>
+  <body style="margin:0; padding:0; font-family:Arial, sans-serif;">
+{% block content %}{% endblock %}
+  </body>
+</html>
+""",
+
+    "fields_table.html": """    <table border="0" cellspacing="0" cellpadding="0">
+      <tr>
+        <th>Champs</th>
+        <th>Valeurs</th>
+      </tr>
+{% for label, value in rows %}
+      <tr><td>{{ label }}</td><td>{{ value }}</td></tr>
+{% endfor %}
+    </table>
+""",
+
+    "creation.html": """{% extends "base.html" %}
+{% block content %}
+    <p>Bonjour,</p>
+    <p>Les informations suivantes ont été créées pour le collaborateur :</p>
+{% include "fields_table.html" %}
+    <p>Cordialement,<br>L'équipe Infra</p>
+{% endblock %}
+""",
+
+    "support.html": """{% extends "base.html" %}
+{% block content %}
+    <p>Bonjour,</p>
+    <p>L'utilisateur <strong>{{ user_cn }}</strong> a été créé. Vous retrouverez ses identifiants en pièce jointe.</p>
+    <p>Cordialement,<br>L'équipe infra</p>
+{% endblock %}
+""",
+
+    "deletion.html": """{% extends "base.html" %}
+{% block content %}
+    <p>Le collaborateur <strong>{{ display_name }}</strong> a été supprimé.</p>
+{% endblock %}
+""",
+
+    "deferred_deletion.html": """{% extends "base.html" %}
+{% block content %}
+    <p>Le collaborateur <strong>{{ display_name }}</strong> sera définitivement supprimé le <strong>{{ deletion_date }}</strong>.</p>
+{% endblock %}
+""",
+
+    "modification.html": """{% extends "base.html" %}
+{% block content %}
+    <p>Bonjour,</p>
+    <p>Les informations suivantes ont été modifiées pour le collaborateur :</p>
+{% include "fields_table.html" %}
+    <p>Cordialement,<br>L'équipe IT</p>
+{% endblock %}
+""",
+
+    "digest.html": """{% extends "base.html" %}
+{% block content %}
+    <p>Bonjour,</p>
+    <p>Récapitulatif des mouvements de personnel :</p>
+    <table border="0" cellspacing="0" cellpadding="0">
+      <tr>
+        <th>Date</th>
+        <th>Événement</th>
+        <th>Collaborateur</th>
+        <th>Détails</th>
+      </tr>
+{% for event in events %}
+      <tr>
+        <td>{{ event.time }}</td>
+        <td>{{ event.label }}</td>
+        <td>{{ event.collaborator }}</td>
+        <td>{% for label, value in event.details %}{{ label }} : {{ value }}{% if not loop.last %}<br>{% endif %}{% endfor %}</td>
+      </tr>
+{% endfor %}
+    </table>
+    <p>Cordialement,<br>L'équipe IT</p>
+{% endblock %}
+""",
+}
+
+environment = Environment(
+    loader=DictLoader(TEMPLATES),
+    autoescape=True,
+    undefined=StrictUndefined,
+    trim_blocks=True,
+    lstrip_blocks=True,
+    keep_trailing_newline=True,
+)
+environment.globals["css"] = BASE_CSS
+
+# Compilation de tous les modèles au démarrage (mis en cache par l'environnement)
+_compiled = {name: environment.get_template(name) for name in TEMPLATES}
+
+
+def render(name, **context):
+    """Rend le modèle `name` avec les valeurs fournies (échappées automatiquement)."""
+    return _compiled[name].render(**context)
+
@@ -1,12 +1,118 @@
+import datetime
 import logging
 import re
 import os
+import smtplib
+import threading
+import time
 from flask_mail import Message
+import mail_templates
+from metrics import metrics
 from group_labels import get_group_labels_from_dns
 from pdf_utils import generate_pdf_with_logo
 
 logger = logging.getLogger(__name__)
 
+# Erreurs indiquant que la session SMTP est perdue (et non un refus du message)
+SMTP_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+class MailDispatcher:
+    """
+    Remplace l'objet `mail` de Flask-Mail auprès des fonctions send_*_email :
+    une seule session SMTP authentifiée (STARTTLS compris) est ouverte puis réutilisée
+    pour tous les envois, au lieu d'une session par message.
+
+    - si la session a été coupée, elle est rouverte et le message renvoyé une fois ;
+    - la session est fermée après `idle_timeout` secondes sans envoi ;
+    - les envois sont sérialisés (un verrou protège la session partagée).
+    Les envois doivent être faits dans un contexte d'application Flask.
+    """
+
+    def __init__(self, mail, idle_timeout=30):
+        self.mail = mail
+        self.idle_timeout = idle_timeout
+        self._connection = None
+        self._last_used = 0
+        self._timer = None
+        self._lock = threading.RLock()
+        self.sessions_opened = 0
+        self.messages_sent = 0
+
+    def _open(self):
+        """Ouvre la session SMTP si nécessaire (verrou tenu)."""
+        if self._connection is None:
+            connection = self.mail.connect()
+            self._connection = connection.__enter__()
+            self.sessions_opened += 1
+            metrics.inc('smtp_sessions_opened_total', ())
+            logger.debug("Session SMTP ouverte.")
+        return self._connection
+
+    def _close(self):
+        """Ferme la session SMTP courante (verrou tenu)."""
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except (smtplib.SMTPException, OSError):
+                logger.debug("Session SMTP déjà interrompue à la fermeture.", exc_info=True)
+
+    def _close_if_idle(self):
+        with self._lock:
+            if self._connection is not None and time.monotonic() - self._last_used >= self.idle_timeout:
+                self._close()
+                logger.debug("Session SMTP fermée après inactivité.")
+
+    def _schedule_idle_close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.idle_timeout, self._close_if_idle)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def send(self, message):
+        """Envoie un message sur la session partagée (même interface que Mail.send)."""
+        with self._lock:
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                try:
+                    message.send(self._open())
+                except SMTP_CONNECTION_ERRORS:
+                    logger.info("Session SMTP perdue, reconnexion.")
+                    self._close()
+                    message.send(self._open())
+                outcome = 'ok'
+            finally:
+                metrics.observe('smtp_send_duration_seconds', (outcome,), time.perf_counter() - started)
+            self.messages_sent += 1
+            self._last_used = time.monotonic()
+            self._schedule_idle_close()
+
+    def send_batch(self, messages):
+        """
+        Envoie une liste de messages sur la même session.
+        Renvoie la liste des exceptions rencontrées (None pour chaque message envoyé).
+        """
+        errors = []
+        with self._lock:
+            for message in messages:
+                try:
+                    self.send(message)
+                    errors.append(None)
+                except Exception as e:
+                    logger.error("Échec de l'envoi du message « %s » : %s", message.subject, e)
+                    errors.append(e)
+        return errors
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._close()
+
 def get_cn_from_dn(dn):
     """
     Extrait la valeur après 'CN=' dans un DN LDAP.
@@ -24,73 +130,45 @@ def send_creation_email(mail, recipient, user_info, password, all_groups):
     Envoie le mail de création d'utilisateur en HTML,
     avec un tableau pour un alignement parfait et la police Arial,
     et joint un PDF contenant le login et le mot de passe.
+    Renvoie les octets du PDF, pour les joindre aussi au mail du support.
     """
     try:
         logger.debug("=== send_creation_email ===")
-        logger.debug(f"Destinataire : {recipient}")
-        logger.debug(f"user_info : {user_info}")
-        logger.debug(f"Mot de passe généré : {password}")
-        logger.debug(f"Groupes bruts reçus (DNs) : {all_groups}")
+        logger.debug("Destinataire : %s", recipient)
+        logger.debug("user_info : %s", user_info)
+        logger.debug("Groupes bruts reçus (DNs) : %s", all_groups)
 
         manager_dn = user_info.get('managerDn', '')
         manager_cn = get_cn_from_dn(manager_dn)
         parsed_groups = get_group_labels_from_dns(all_groups)
-        logger.debug(f"Groupes convertis (labels) : {parsed_groups}")
-
-        html_content = f"""
-<html>
-  <head>
-    <style>
-      table {{
-        font-family: Arial, sans-serif;
-        border-collapse: collapse;
-      }}
-      th, td {{
-        padding: 5px 10px;
-        text-align: left;
-      }}
-    </style>
-  </head>
-  <body style="margin:0; padding:0; font-family:Arial, sans-serif;">
-    <p>Bonjour,</p>
-    <p>Les informations suivantes ont été créées pour le collaborateur :</p>
-    <table border="0" cellspacing="0" cellpadding="0">
-      <tr>
-        <th>Champs</th>
-        <th>Valeurs</th>
-      </tr>
-      <tr><td>Nom complet</td><td>{user_info['fullName']}</td></tr>
-      <tr><td>Prénom</td><td>{user_info['firstName']}</td></tr>
-      <tr><td>Nom de famille</td><td>{user_info['lastName']}</td></tr>
-      <tr><td>OU de création</td><td>{user_info['new_ou']}</td></tr>
-      <tr><td>Description</td><td>{user_info['newDescription'] or 'Non spécifiée'}</td></tr>
-      <tr><td>Bureau</td><td>{user_info['newOffice'] or 'Non spécifié'}</td></tr>
-      <tr><td>Numéro de téléphone</td><td>{user_info['newPhoneNumber'] or 'Non spécifié'}</td></tr>
-      <tr><td>Login</td><td>{user_info['loginName'] + user_info['domain']}</td></tr>
-      <tr><td>Manager</td><td>{manager_cn or 'Aucun'}</td></tr>
-      <tr><td>Groupes attribués</td><td>{', '.join(parsed_groups) if parsed_groups else 'Aucun'}</td></tr>
-      <tr><td>Mot de passe généré</td><td>{password}</td></tr>
-    </table>
-    <p>Cordialement,<br>L'équipe Infra</p>
-  </body>
-</html>
-"""
+        logger.debug("Groupes convertis (labels) : %s", parsed_groups)
+
+        html_content = mail_templates.render("creation.html", rows=[
+            ("Nom complet", user_info['fullName']),
+            ("Prénom", user_info['firstName']),
+            ("Nom de famille", user_info['lastName']),
+            ("OU de création", user_info['new_ou']),
+            ("Description", user_info['newDescription'] or 'Non spécifiée'),
+            ("Bureau", user_info['newOffice'] or 'Non spécifié'),
+            ("Numéro de téléphone", user_info['newPhoneNumber'] or 'Non spécifié'),
+            ("Login", user_info['loginName'] + user_info['domain']),
+            ("Manager", manager_cn or 'Aucun'),
+            ("Groupes attribués", ', '.join(parsed_groups) if parsed_groups else 'Aucun'),
+            ("Mot de passe généré", password),
+        ])
         msg = Message(
             subject="Création de personnel réussie",
             recipients=[recipient],
             html=html_content
         )
 
-        # Génération du PDF dans le dossier dédié
-        import uuid
-        unique_id = str(uuid.uuid4())
-        output_pdf = f"/var/www/flask_app/flask_app/pdf_temp/creation_compte_{unique_id}.pdf"
+        # Génération du PDF en mémoire (aucun mot de passe écrit sur disque)
         logo_path = os.path.join(os.path.dirname(__file__), "logo_pdf.png")
         first_name = user_info.get("firstName", "")
         last_name = user_info.get("lastName", "")
         login = user_info.get("loginName", "")
-        generate_pdf_with_logo(
-            output_filename=output_pdf,
+        pdf_bytes = generate_pdf_with_logo(
+            output_filename=None,
             logo_path=logo_path,
             first_name=first_name,
             last_name=last_name,
@@ -99,47 +177,30 @@ def send_creation_email(mail, recipient, user_info, password, all_groups):
         )
 
         # Attachement du PDF
-        with open(output_pdf, "rb") as fp:
-            msg.attach("creation_compte.pdf", "application/pdf", fp.read())
+        msg.attach("creation_compte.pdf", "application/pdf", pdf_bytes)
 
         # Envoi du mail avec le PDF en pièce jointe
         mail.send(msg)
         logger.info("Mail de création envoyé avec succès.")
 
-        return output_pdf
+        return pdf_bytes
     
     except Exception as e:
-        logger.error(f"Erreur lors de l'envoi du mail de création : {e}")
+        logger.error("Erreur lors de l'envoi du mail de création : %s", e)
+        raise
 
-def send_support_email(mail, recipient, user_cn, pdf_path):
+def send_support_email(mail, recipient, user_cn, pdf):
     """
     Envoie un mail simple au pôle support avec le PDF des identifiants en pièce jointe.
+    `pdf` contient les octets du PDF (ou, pour compatibilité, le chemin d'un fichier PDF).
     """
     try:
         logger.debug("=== send_support_email ===")
-        logger.debug(f"Destinataire : {recipient}")
-        logger.debug(f"CN utilisateur : {user_cn}")
-        logger.debug(f"PDF attaché : {pdf_path}")
-
-        # Message simple
-        html_content = f"""
-<html>
-  <head>
-    <style>
-      body {{
-        font-family: Arial, sans-serif;
-        margin: 0;
-        padding: 0;
-      }}
-    </style>
-  </head>
-  <body>
-    <p>Bonjour,</p>
-    <p>L'utilisateur <strong>{user_cn}</strong> a été créé. Vous retrouverez ses identifiants en pièce jointe.</p>
-    <p>Cordialement,<br>L'équipe infra</p>
-  </body>
-</html>
-"""
+        logger.debug("Destinataire : %s", recipient)
+        logger.debug("CN utilisateur : %s", user_cn)
+        logger.debug("PDF attaché : %s", len(pdf) if isinstance(pdf, bytes) else pdf)
+
+        html_content = mail_templates.render("support.html", user_cn=user_cn)
 
         msg = Message(
             subject=f"Création de l'utilisateur : {user_cn}",
@@ -147,14 +208,17 @@ def send_support_email(mail, recipient, user_cn, pdf_path):
             html=html_content
         )
 
-        with open(pdf_path, "rb") as fp:
-            msg.attach("creation_compte.pdf", "application/pdf", fp.read())
+        if isinstance(pdf, str):
+            with open(pdf, "rb") as fp:
+                pdf = fp.read()
+        msg.attach("creation_compte.pdf", "application/pdf", pdf)
 
         mail.send(msg)
         logger.info("Mail de support envoyé avec succès.")
 
     except Exception as e:
-        logger.error(f"Erreur lors de l'envoi du mail au support : {e}")
+        logger.error("Erreur lors de l'envoi du mail au support : %s", e)
+        raise
 
 
 def send_deletion_email(mail, recipient, user_full_name):
@@ -165,30 +229,12 @@ def send_deletion_email(mail, recipient, user_full_name):
     """
     try:
         logger.debug("=== send_deletion_email ===")
-        logger.debug(f"Destinataire : {recipient}")
-        logger.debug(f"Nom complet : {user_full_name}")
+        logger.debug("Destinataire : %s", recipient)
+        logger.debug("Nom complet : %s", user_full_name)
 
         display_name = user_full_name.strip() if user_full_name.strip() else "Inconnu"
 
-        html_content = f"""
-<html>
-  <head>
-    <style>
-      table {{
-        font-family: Arial, sans-serif;
-        border-collapse: collapse;
-      }}
-      th, td {{
-        padding: 5px 10px;
-        text-align: left;
-      }}
-    </style>
-  </head>
-  <body style="margin:0; padding:0; font-family:Arial, sans-serif;">
-    <p>Le collaborateur <strong>{display_name}</strong> a été supprimé.</p>
-  </body>
-</html>
-"""
+        html_content = mail_templates.render("deletion.html", display_name=display_name)
         msg = Message(
             subject="Suppression immédiate de collaborateur",
             recipients=[recipient],
@@ -197,7 +243,8 @@ def send_deletion_email(mail, recipient, user_full_name):
         mail.send(msg)
         logger.info("Mail de suppression immédiate envoyé avec succès.")
     except Exception as e:
-        logger.error(f"Erreur lors de l'envoi du mail de suppression immédiate : {e}")
+        logger.error("Erreur lors de l'envoi du mail de suppression immédiate : %s", e)
+        raise
 
 def send_deferred_deletion_email(mail, recipient, user_full_name, deletion_date_str):
     """
@@ -207,31 +254,14 @@ def send_deferred_deletion_email(mail, recipient, user_full_name, deletion_date_
     """
     try:
         logger.debug("=== send_deferred_deletion_email ===")
-        logger.debug(f"Destinataire : {recipient}")
-        logger.debug(f"Nom complet : {user_full_name}")
-        logger.debug(f"Date de suppression planifiée : {deletion_date_str}")
+        logger.debug("Destinataire : %s", recipient)
+        logger.debug("Nom complet : %s", user_full_name)
+        logger.debug("Date de suppression planifiée : %s", deletion_date_str)
 
         display_name = user_full_name.strip() if user_full_name.strip() else "Inconnu"
 
-        html_content = f"""
-<html>
-  <head>
-    <style>
-      table {{
-        font-family: Arial, sans-serif;
-        border-collapse: collapse;
-      }}
-      th, td {{
-        padding: 5px 10px;
-        text-align: left;
-      }}
-    </style>
-  </head>
-  <body style="margin:0; padding:0; font-family:Arial, sans-serif;">
-    <p>Le collaborateur <strong>{display_name}</strong> sera définitivement supprimé le <strong>{deletion_date_str}</strong>.</p>
-  </body>
-</html>
-"""
+        html_content = mail_templates.render("deferred_deletion.html", display_name=display_name,
+                                             deletion_date=deletion_date_str)
         msg = Message(
             subject="Planification de suppression de collaborateur",
             recipients=[recipient],
@@ -240,7 +270,30 @@ def send_deferred_deletion_email(mail, recipient, user_full_name, deletion_date_
         mail.send(msg)
         logger.info("Mail de suppression différée envoyé avec succès.")
     except Exception as e:
-        logger.error(f"Erreur lors de l'envoi du mail de suppression différée : {e}")
+        logger.error("Erreur lors de l'envoi du mail de suppression différée : %s", e)
+        raise
+
+def modification_fields(user_full_name, data, all_groups):
+    """Lignes (libellé, valeur) du récapitulatif de modification d'un collaborateur."""
+    new_description = data.get('newDescription', '').strip()
+    new_office = data.get('newOffice', '').strip()
+    new_phone_number = data.get('newPhoneNumber', '').strip()
+    login_name = data.get('loginName', '').strip()
+    domain = data.get('domain', '').strip()
+
+    manager_cn = get_cn_from_dn(data.get('managerDn', ''))
+    parsed_groups = get_group_labels_from_dns(all_groups)
+    logger.debug("Groupes convertis (labels) : %s", parsed_groups)
+
+    return [
+        ("Collaborateur", user_full_name),
+        ("Description", new_description or "Non modifiée"),
+        ("Bureau", new_office or "Non modifié"),
+        ("Numéro de téléphone", new_phone_number or "Non modifié"),
+        ("Login", (login_name + domain) if login_name else "Non modifié"),
+        ("Manager", manager_cn or "Aucun"),
+        ("Groupes attribués", ", ".join(parsed_groups) if parsed_groups else "Aucun"),
+    ]
 
 def send_modification_email(mail, recipient, user_full_name, data, all_groups):
     """
@@ -250,63 +303,14 @@ def send_modification_email(mail, recipient, user_full_name, data, all_groups):
     """
     try:
         logger.debug("=== send_modification_email ===")
-        logger.debug(f"Destinataire : {recipient}")
-        logger.debug(f"Nom complet : {user_full_name}")
-        logger.debug(f"Data : {data}")
-        logger.debug(f"Groupes bruts reçus (DNs) : {all_groups}")
-
-        new_description = data.get('newDescription', '').strip()
-        new_office = data.get('newOffice', '').strip()
-        new_phone_number = data.get('newPhoneNumber', '').strip()
-        login_name = data.get('loginName', '').strip()
-        domain = data.get('domain', '').strip()
-
-        manager_cn = get_cn_from_dn(data.get('managerDn', ''))
-        parsed_groups = get_group_labels_from_dns(all_groups)
-        logger.debug(f"Groupes convertis (labels) : {parsed_groups}")
-
-        # Préparation des champs pour générer le tableau
-        fields = [
-            ("Collaborateur", user_full_name),
-            ("Description", new_description or "Non modifiée"),
-            ("Bureau", new_office or "Non modifié"),
-            ("Numéro de téléphone", new_phone_number or "Non modifié"),
-            ("Login", (login_name + domain) if login_name else "Non modifié"),
-            ("Manager", manager_cn or "Aucun"),
-            ("Groupes attribués", ", ".join(parsed_groups) if parsed_groups else "Aucun")
-        ]
-        table_rows = ""
-        for key, value in fields:
-            table_rows += f"<tr><td style='padding:5px 10px;'>{key}</td><td style='padding:5px 10px;'>{value}</td></tr>"
-
-        html_content = f"""
-<html>
-  <head>
-    <style>
-      table {{
-        font-family: Arial, sans-serif;
-        border-collapse: collapse;
-      }}
-      th, td {{
-        padding: 5px 10px;
-        text-align: left;
-      }}
-    </style>
-  </head>
-  <body style="margin:0; padding:0; font-family:Arial, sans-serif;">
-    <p>Bonjour,</p>
-    <p>Les informations suivantes ont été modifiées pour le collaborateur :</p>
-    <table border="0" cellspacing="0" cellpadding="0">
-      <tr>
-        <th>Champs</th>
-        <th>Valeurs</th>
-      </tr>
-      {table_rows}
-    </table>
-    <p>Cordialement,<br>L'équipe IT</p>
-  </body>
-</html>
-"""
+        logger.debug("Destinataire : %s", recipient)
+        logger.debug("Nom complet : %s", user_full_name)
+        logger.debug("Data : %s", data)
+        logger.debug("Groupes bruts reçus (DNs) : %s", all_groups)
+
+        html_content = mail_templates.render(
+            "modification.html", rows=modification_fields(user_full_name, data, all_groups)
+        )
         msg = Message(
             subject="Modification de collaborateur réussie",
             recipients=[recipient],
@@ -315,4 +319,54 @@ def send_modification_email(mail, recipient, user_full_name, data, all_groups):
         mail.send(msg)
         logger.info("Mail de modification envoyé avec succès.")
     except Exception as e:
-        logger.error(f"Erreur lors de l'envoi du mail de modification : {e}")
+        logger.error("Erreur lors de l'envoi du mail de modification : %s", e)
+        raise
+
+
+# ------------------ RÉCAPITULATIFS ------------------
+
+DIGEST_EVENT_LABELS = {
+    'user_deleted': "Suppression",
+    'user_deletion_scheduled': "Suppression planifiée",
+    'user_modified': "Modification",
+}
+
+def digest_event(kind, user_full_name, deletion_date_str='', data=None, all_groups=()):
+    """
+    Décrit un événement pour le mail récapitulatif (dictionnaire sérialisable en JSON) :
+    mêmes arguments que les fonctions send_*_email correspondantes.
+    """
+    details = []
+    if deletion_date_str:
+        details.append(("Date de suppression", deletion_date_str))
+    if kind == 'user_modified':
+        details.extend(modification_fields(user_full_name, data or {}, all_groups)[1:])
+    return {
+        "kind": kind,
+        "label": DIGEST_EVENT_LABELS.get(kind, kind),
+        "collaborator": user_full_name.strip() or "Inconnu",
+        "details": details,
+        "time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
+    }
+
+def send_digest_email(mail, recipient, events):
+    """
+    Envoie un seul mail récapitulant une liste d'événements (voir digest_event),
+    sous forme de tableau, au lieu d'un mail par événement.
+    """
+    try:
+        logger.debug("=== send_digest_email ===")
+        logger.debug("Destinataire : %s", recipient)
+        logger.debug("Nombre d'événements : %s", len(events))
+
+        html_content = mail_templates.render("digest.html", events=events)
+        msg = Message(
+            subject=f"Récapitulatif des mouvements de personnel ({len(events)} événement(s))",
+            recipients=[recipient],
+            html=html_content
+        )
+        mail.send(msg)
+        logger.info("Mail récapitulatif envoyé avec succès.")
+    except Exception as e:
+        logger.error("Erreur lors de l'envoi du mail récapitulatif : %s", e)
+        raise
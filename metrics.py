@@ -0,0 +1,267 @@
+# metrics.py
+
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from ldap3 import Connection
+
+logger = logging.getLogger(__name__)
+
+"""
+Instrumentation de l'application : histogrammes de durées, compteurs et jauges,
+exposés au format texte Prometheus (route /metrics), et traces par requête optionnelles.
+
+Les mesures sont enregistrées sous forme de tuples (nom, valeurs des étiquettes) sans
+formatage de chaîne : le texte n'est produit qu'à la lecture de /metrics. Si le registre
+est désactivé, chaque mesure se réduit à un test de booléen.
+"""
+
+# Bornes des histogrammes de durée (secondes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Bornes des histogrammes de taille de résultat LDAP (entrées)
+SIZE_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """
+    Registre des mesures.
+
+    - `describe` déclare une métrique (type 'histogram' ou 'counter', aide, noms des étiquettes) ;
+    - `observe` ajoute une valeur à un histogramme, `inc` incrémente un compteur ;
+    - `timer` mesure la durée d'un bloc (et l'ajoute à la trace de la requête en cours) ;
+    - `gauge` enregistre une fonction lue à chaque export, qui renvoie une valeur ou
+      un dictionnaire {valeurs des étiquettes: valeur} (kind='counter' pour exporter un
+      compteur tenu par un autre composant) ;
+    - `render` produit le texte au format d'exposition Prometheus.
+
+    Les traces (`tracing`) conservent, pour la requête en cours dans le thread, la liste
+    des blocs mesurés ; l'application les renvoie dans l'en-tête Server-Timing.
+    """
+
+    def __init__(self, enabled=True, tracing=False):
+        self.enabled = enabled
+        self.tracing = tracing
+        self._descriptions = {}  # nom -> (type, aide, noms des étiquettes, bornes)
+        self._histograms = {}    # (nom, étiquettes) -> [compteurs par borne, somme, nombre]
+        self._counters = {}      # (nom, étiquettes) -> valeur
+        self._gauges = []        # (nom, aide, noms des étiquettes, fonction, type)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def describe(self, name, kind, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self._descriptions[name] = (kind, help_text, tuple(label_names), tuple(buckets))
+
+    def gauge(self, name, help_text, fn, label_names=(), kind='gauge'):
+        self._gauges.append((name, help_text, tuple(label_names), fn, kind))
+
+    # ------------------ MESURES ------------------
+
+    def observe(self, name, labels, value):
+        if not self.enabled:
+            return
+        buckets = self._descriptions[name][3]
+        index = bisect.bisect_left(buckets, value)
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def inc(self, name, labels, value=1):
+        if not self.enabled:
+            return
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, name, labels):
+        """Mesure la durée du bloc dans l'histogramme `name` (et dans la trace de la requête)."""
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(name, labels, elapsed)
+            self.add_span(name, labels, elapsed)
+
+    # ------------------ TRACES PAR REQUÊTE ------------------
+
+    def start_trace(self):
+        if self.enabled and self.tracing:
+            self._local.spans = []
+
+    def add_span(self, name, labels, elapsed):
+        spans = getattr(self._local, 'spans', None)
+        if spans is not None:
+            spans.append((name, labels, elapsed))
+
+    def end_trace(self):
+        """Renvoie les blocs mesurés pendant la requête [(nom, étiquettes, durée)] et termine la trace."""
+        spans = getattr(self._local, 'spans', None)
+        self._local.spans = None
+        return spans or []
+
+    # ------------------ EXPORT ------------------
+
+    def render(self):
+        """Texte au format d'exposition Prometheus (version 0.0.4)."""
+        with self._lock:
+            histograms = {key: ([*value[0]], value[1], value[2]) for key, value in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = []
+        for name, (kind, help_text, label_names, buckets) in self._descriptions.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                for (metric, labels), (counts, total, count) in histograms.items():
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip((*buckets, float('inf')), counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{_format_labels(label_names, labels, ('le', _format_value(bound)))} "
+                                     f"{cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(label_names, labels)} {_format_value(total)}")
+                    lines.append(f"{name}_count{_format_labels(label_names, labels)} {count}")
+            else:
+                for (metric, labels), value in counters.items():
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(label_names, labels)} {_format_value(value)}")
+        for name, help_text, label_names, fn, kind in self._gauges:
+            try:
+                value = fn()
+            except Exception:
+                logger.exception("Lecture de la jauge %s impossible", name)
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            items = value.items() if isinstance(value, dict) else [((), value)]
+            for labels, item in items:
+                if item is None:
+                    continue
+                labels = labels if isinstance(labels, tuple) else (labels,)
+                lines.append(f"{name}{_format_labels(label_names, labels)} {_format_value(item)}")
+        return "\n".join(lines) + "\n"
+
+
+# Registre de l'application (et du script de suppression différée)
+metrics = Metrics()
+
+metrics.describe('http_request_duration_seconds', 'histogram', "Durée de traitement des requêtes HTTP",
+                 ('method', 'route', 'status'))
+metrics.describe('ldap_operation_duration_seconds', 'histogram', "Durée des opérations LDAP",
+                 ('operation', 'outcome'))
+metrics.describe('ldap_search_result_entries', 'histogram', "Nombre d'entrées renvoyées par recherche LDAP",
+                 (), buckets=SIZE_BUCKETS)
+metrics.describe('smtp_send_duration_seconds', 'histogram', "Durée d'envoi d'un mail (session SMTP partagée)",
+                 ('outcome',))
+metrics.describe('smtp_sessions_opened_total', 'counter', "Sessions SMTP ouvertes")
+metrics.describe('pdf_render_duration_seconds', 'histogram', "Durée de génération des fiches PDF",
+                 ('kind',))
+
+
+class InstrumentedConnection(Connection):
+    """
+    Connexion ldap3 dont les opérations (bind, search, add, modify, delete) sont mesurées
+    dans le registre `metrics` ; les recherches paginées sont mesurées page par page et
+    rebind passe par bind.
+    """
+
+    def _measure(self, operation, method, *args, **kwargs):
+        if not metrics.enabled:
+            return method(*args, **kwargs)
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = method(*args, **kwargs)
+            outcome = 'ok' if result else 'failed'
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.observe('ldap_operation_duration_seconds', (operation, outcome), elapsed)
+            metrics.add_span('ldap_' + operation, (), elapsed)
+            if operation == 'search' and outcome != 'error':
+                metrics.observe('ldap_search_result_entries', (), len(self.response or ()))
+
+    def bind(self, *args, **kwargs):
+        return self._measure('bind', super().bind, *args, **kwargs)
+
+    def search(self, *args, **kwargs):
+        return self._measure('search', super().search, *args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        return self._measure('add', super().add, *args, **kwargs)
+
+    def modify(self, *args, **kwargs):
+        return self._measure('modify', super().modify, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._measure('delete', super().delete, *args, **kwargs)
+
+    def modify_dn(self, *args, **kwargs):
+        return self._measure('modify_dn', super().modify_dn, *args, **kwargs)
+
+
+def init_app(app, allowed_ips=None):
+    """
+    Mesure la durée de chaque requête Flask (par règle de routage et code de retour),
+    ajoute l'en-tête Server-Timing si les traces sont activées, et expose /metrics
+    (réservée aux adresses de `allowed_ips` si la liste n'est pas vide).
+    """
+    from flask import Response, g, jsonify, request
+
+    @app.before_request
+    def _start_timer():
+        if metrics.enabled:
+            g.metrics_started = time.perf_counter()
+            metrics.start_trace()
+
+    @app.after_request
+    def _record(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule is not None else 'inconnue'
+        metrics.observe('http_request_duration_seconds', (request.method, route, response.status_code), elapsed)
+        spans = metrics.end_trace()
+        if metrics.tracing:
+            timings = [f"{name};dur={duration * 1000:.1f}" for name, _, duration in spans]
+            timings.append(f"total;dur={elapsed * 1000:.1f}")
+            response.headers['Server-Timing'] = ", ".join(timings)
+        return response
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        if not metrics.enabled:
+            return jsonify({"error": "Métriques désactivées"}), 404
+        if allowed_ips and request.remote_addr not in allowed_ips:
+            return jsonify({"error": "Accès refusé"}), 403
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,335 @@
+# notifications.py
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notification_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    lease_owner TEXT,
+    lease_until REAL,
+    last_error TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notification_jobs_due ON notification_jobs (status, next_attempt);
+CREATE TABLE IF NOT EXISTS digest_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient TEXT NOT NULL,
+    event TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS digest_events_recipient ON digest_events (recipient, id);
+"""
+
+# Nom de la notification qui envoie le récapitulatif d'un destinataire
+DIGEST_KIND = 'digest'
+
+
+
+class NotificationQueue:
+    """
+    File persistante des envois de mails (et de la génération de PDF associée),
+    traitée hors du thread de la requête par un pool de threads.
+
+    Chaque notification est journalisée dans une base SQLite (`spool_path`) avant
+    d'être traitée : rien n'est perdu si le processus redémarre. Une notification
+    en échec est retentée avec un délai exponentiel (`retry_base_delay` × 2^n, plafonné
+    à `retry_max_delay`) jusqu'à `max_attempts` tentatives, puis marquée 'failed'.
+    Plusieurs processus (workers mod_wsgi) peuvent partager le même journal : une
+    notification est réservée par un bail de `lease_duration` secondes avant traitement.
+
+    Les traitements sont enregistrés par nom avec `register` ; les arguments passés à
+    `submit` doivent être sérialisables en JSON. Un envoi peut être rejoué après un échec
+    partiel (livraison « au moins une fois »).
+    Le journal contient les données des mails (dont les mots de passe générés) jusqu'à
+    leur envoi : il est créé avec des droits 0600 (SQLite donne les mêmes droits aux
+    fichiers -wal et -shm) et les lignes supprimées sont effacées sur disque
+    (secure_delete). Une notification abandonnée ('failed') perd ses données dès son
+    abandon ; la ligne, qui ne garde que le type et la dernière erreur, est supprimée
+    `failed_retention` secondes après sa création.
+
+    Mode récapitulatif : `add_to_digest` journalise un événement pour un destinataire et
+    programme, s'il n'y en a pas déjà une, une notification DIGEST_KIND à la fin de la fenêtre ;
+    son traitement lit les événements accumulés (`digest_events`) et les envoie en un seul mail.
+    """
+
+    def __init__(self, app, spool_path, workers=2, max_attempts=5, retry_base_delay=30,
+                 retry_max_delay=3600, lease_duration=300, poll_interval=5, failed_retention=7 * 86400,
+                 purge_interval=3600):
+        self.app = app
+        self.spool_path = spool_path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.lease_duration = lease_duration
+        self.poll_interval = poll_interval
+        self.failed_retention = failed_retention
+        self.purge_interval = purge_interval
+        self._next_purge = 0
+
+        self._handlers = {}
+        self._owner = uuid.uuid4().hex
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self._init_spool()
+
+    # ------------------ JOURNAL SQLITE ------------------
+
+    def _connect(self):
+        db = sqlite3.connect(self.spool_path, timeout=30)
+        db.execute("PRAGMA secure_delete=ON")
+        return closing(db)
+
+    def _init_spool(self):
+        directory = os.path.dirname(os.path.abspath(self.spool_path))
+        os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(self.spool_path):
+            os.close(os.open(self.spool_path, os.O_CREAT | os.O_WRONLY, 0o600))
+        else:
+            try:
+                os.chmod(self.spool_path, 0o600)
+            except OSError as e:
+                logger.warning("Droits du journal des notifications non modifiables (%s) : %s", self.spool_path, e)
+        with self._connect() as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+        self.purge()
+
+    def purge(self):
+        """
+        Efface les données restées dans les notifications abandonnées (journaux antérieurs)
+        et supprime celles créées il y a plus de `failed_retention` secondes.
+        Renvoie le nombre de lignes supprimées.
+        """
+        with self._connect() as db, db:
+            db.execute("UPDATE notification_jobs SET payload = '{}' WHERE status = 'failed' AND payload != '{}'")
+            deleted = db.execute(
+                "DELETE FROM notification_jobs WHERE status = 'failed' AND created <= ?",
+                (time.time() - self.failed_retention,)
+            ).rowcount
+        self._next_purge = time.monotonic() + self.purge_interval
+        if deleted:
+            logger.info("%s notification(s) abandonnée(s) supprimée(s) du journal.", deleted)
+        return deleted
+
+    def _claim(self):
+        """Réserve la prochaine notification échue (ou dont le bail a expiré)."""
+        now = time.time()
+        with self._connect() as db, db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT id, kind, payload, attempts FROM notification_jobs "
+                "WHERE (status = 'pending' AND next_attempt <= ?) "
+                "OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY next_attempt, id LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE notification_jobs SET status = 'running', lease_owner = ?, lease_until = ? WHERE id = ?",
+                (self._owner, now + self.lease_duration, row[0])
+            )
+        return row
+
+    def _next_due_delay(self):
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT MIN(next_attempt) FROM notification_jobs WHERE status = 'pending'"
+            ).fetchone()
+        if row[0] is None:
+            return self.poll_interval
+        return min(max(row[0] - time.time(), 0), self.poll_interval)
+
+    def _complete(self, job_id):
+        with self._connect() as db, db:
+            db.execute("DELETE FROM notification_jobs WHERE id = ?", (job_id,))
+
+    def _fail(self, job_id, attempts, error):
+        attempts += 1
+        with self._connect() as db, db:
+            if attempts >= self.max_attempts:
+                # Abandon : les données du mail (mot de passe généré...) ne sont pas conservées
+                db.execute(
+                    "UPDATE notification_jobs SET status = 'failed', payload = '{}', attempts = ?, last_error = ?, "
+                    "lease_owner = NULL, lease_until = NULL WHERE id = ?",
+                    (attempts, error, job_id)
+                )
+                return False
+            delay = min(self.retry_base_delay * 2 ** (attempts - 1), self.retry_max_delay)
+            db.execute(
+                "UPDATE notification_jobs SET status = 'pending', attempts = ?, next_attempt = ?, "
+                "last_error = ?, lease_owner = NULL, lease_until = NULL WHERE id = ?",
+                (attempts, time.time() + delay, error, job_id)
+            )
+            return True
+
+    # ------------------ TRAITEMENT ------------------
+
+    def register(self, kind, handler):
+        """Associe un nom de notification à la fonction qui la traite."""
+        self._handlers[kind] = handler
+
+    def _process(self, job_id, kind, payload, attempts):
+        handler = self._handlers.get(kind)
+        try:
+            if handler is None:
+                raise LookupError(f"Aucun traitement enregistré pour la notification '{kind}'")
+            with self.app.app_context():
+                handler(**json.loads(payload))
+        except Exception as e:
+            if self._fail(job_id, attempts, f"{type(e).__name__}: {e}"):
+                self.retried += 1
+                logger.warning("Notification %s (%s) en échec, nouvelle tentative prévue : %s", job_id, kind, e)
+            else:
+                self.failed += 1
+                logger.exception("Notification %s (%s) abandonnée après %s tentatives", job_id, kind, attempts + 1)
+            return
+        self._complete(job_id)
+        self.sent += 1
+
+    def _worker(self):
+        while not self._stop.is_set():
+            delay = self.poll_interval
+            try:
+                if time.monotonic() >= self._next_purge:
+                    self.purge()
+                job = self._claim()
+                if job is not None:
+                    self._process(*job)
+                    continue
+                delay = self._next_due_delay()
+            except sqlite3.Error:
+                logger.exception("Accès au journal des notifications impossible")
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def start(self):
+        """Démarre les threads de traitement (reprend aussi les notifications journalisées)."""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"notifications-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def submit(self, kind, **payload):
+        """Journalise une notification puis réveille les threads de traitement."""
+        now = time.time()
+        with self._connect() as db, db:
+            cursor = db.execute(
+                "INSERT INTO notification_jobs (kind, payload, next_attempt, created) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload, ensure_ascii=False), now, now)
+            )
+            job_id = cursor.lastrowid
+        self.start()
+        self._wake.set()
+        return job_id
+
+    def add_to_digest(self, recipient, event, window):
+        """
+        Ajoute un événement (sérialisable en JSON) au récapitulatif de `recipient`.
+        Le récapitulatif part `window` secondes après le premier événement de la fenêtre.
+        """
+        now = time.time()
+        payload = json.dumps({"recipient": recipient}, ensure_ascii=False)
+        with self._connect() as db, db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "INSERT INTO digest_events (recipient, event, created) VALUES (?, ?, ?)",
+                (recipient, json.dumps(event, ensure_ascii=False), now)
+            )
+            scheduled = db.execute(
+                "SELECT 1 FROM notification_jobs WHERE kind = ? AND payload = ? AND status = 'pending'",
+                (DIGEST_KIND, payload)
+            ).fetchone()
+            if scheduled is None:
+                db.execute(
+                    "INSERT INTO notification_jobs (kind, payload, next_attempt, created) VALUES (?, ?, ?, ?)",
+                    (DIGEST_KIND, payload, now + window, now)
+                )
+        self.start()
+
+    def digest_events(self, recipient):
+        """Renvoie (identifiants, événements) en attente pour ce destinataire, du plus ancien au plus récent."""
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id, event FROM digest_events WHERE recipient = ? ORDER BY id", (recipient,)
+            ).fetchall()
+        return [row[0] for row in rows], [json.loads(row[1]) for row in rows]
+
+    def discard_digest_events(self, event_ids):
+        """Supprime les événements envoyés dans un récapitulatif."""
+        with self._connect() as db, db:
+            db.executemany("DELETE FROM digest_events WHERE id = ?", [(event_id,) for event_id in event_ids])
+
+    def join(self, timeout=None):
+        """
+        Attend qu'il n'y ait plus de notification en attente ou en cours de traitement
+        (hors récapitulatifs, qui partent à la fin de leur fenêtre).
+        Renvoie False si le délai `timeout` (secondes) est dépassé.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._connect() as db:
+                remaining = db.execute(
+                    "SELECT COUNT(*) FROM notification_jobs WHERE status IN ('pending', 'running') AND kind != ?",
+                    (DIGEST_KIND,)
+                ).fetchone()[0]
+            if not remaining:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.2)
+
+    def status(self):
+        """État du journal et compteurs du processus courant (sans les données des mails)."""
+        with self._connect() as db:
+            counts = dict(db.execute(
+                "SELECT status, COUNT(*) FROM notification_jobs GROUP BY status"
+            ).fetchall())
+            oldest = db.execute(
+                "SELECT MIN(created) FROM notification_jobs WHERE status IN ('pending', 'running')"
+            ).fetchone()[0]
+            digest_events = db.execute("SELECT COUNT(*) FROM digest_events").fetchone()[0]
+            failures = db.execute(
+                "SELECT id, kind, attempts, last_error FROM notification_jobs "
+                "WHERE last_error IS NOT NULL ORDER BY id DESC LIMIT 10"
+            ).fetchall()
+        return {
+            "pending": counts.get('pending', 0),
+            "running": counts.get('running', 0),
+            "failed": counts.get('failed', 0),
+            "digest_events": digest_events,
+            "oldest_pending_age": None if oldest is None else round(time.time() - oldest, 1),
+            "workers": self.workers,
+            "process": {"sent": self.sent, "retried": self.retried, "failed": self.failed},
+            "recent_errors": [
+                {"id": job_id, "kind": kind, "attempts": attempts, "error": error}
+                for job_id, kind, attempts, error in failures
+            ],
+        }
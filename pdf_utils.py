@@ -1,47 +1,131 @@
 # pdf_utils.py
 
+import threading
+from io import BytesIO
+
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import cm
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.utils import ImageReader
 
+from metrics import metrics
+
+STATIC_FORM_NAME = "credential_sheet_static"
+
+
+class CredentialSheetTemplate:
+    """
+    Modèle de fiche d'identifiants : le logo est décodé une seule fois et la mise en page
+    (positions, polices, libellés) est calculée à la construction. Pour chaque fiche, seule
+    la partie statique (logo, titre, libellés) est rejouée sous forme de formulaire PDF,
+    puis les valeurs du collaborateur sont écrites.
+
+    `render` produit une fiche d'une page ; `render_batch` produit un seul PDF contenant une
+    page par collaborateur (création en masse), la partie statique n'y étant embarquée qu'une fois.
+    """
+
+    def __init__(self, logo_path):
+        self.logo_path = logo_path
+        self.logo = ImageReader(logo_path)
+        # Force le décodage du logo maintenant plutôt qu'à la première fiche
+        self.logo.getRGBData()
+
+        width, height = A4
+        self.page_size = A4
+
+        logo_width_pt = 4.0 * cm
+        logo_height_pt = 4.0 * cm
+        x_logo = 2 * cm
+        y_logo = height - 2 * cm - logo_height_pt
+        self.logo_box = (x_logo, y_logo, logo_width_pt, logo_height_pt)
+
+        text_start_y = y_logo - 1.5 * cm
+        self.title = (2 * cm, text_start_y, "Création de compte")
+
+        content_start_y = text_start_y - 2 * cm
+        line_height = 0.7 * cm
+        rows_y = [content_start_y - i * line_height for i in range(4)]
+        self.labels = list(zip(rows_y, ["Nom :", "Prénom :", "Identifiant :", "Mot de passe :"]))
+        self.value_x = 6 * cm
+        self.values_y = rows_y
+
+    def _draw_static(self, pdf):
+        x_logo, y_logo, logo_width_pt, logo_height_pt = self.logo_box
+        pdf.drawImage(self.logo, x_logo, y_logo, width=logo_width_pt, height=logo_height_pt,
+                      preserveAspectRatio=True, mask='auto')
+
+        # Titre
+        x, y, title = self.title
+        pdf.setFont("Helvetica-Bold", 16)
+        pdf.drawString(x, y, title)
+
+        # Libellés
+        pdf.setFont("Helvetica", 12)
+        for y, label in self.labels:
+            pdf.drawString(2 * cm, y, label)
+
+    def _draw_page(self, pdf, first_name, last_name, login_name, password):
+        pdf.doForm(STATIC_FORM_NAME)
+        pdf.setFont("Helvetica", 12)
+        for y, value in zip(self.values_y, (last_name, first_name, login_name, password)):
+            pdf.drawString(self.value_x, y, value or "")
+        pdf.showPage()
+
+    def _open(self, output_filename):
+        buffer = BytesIO() if output_filename is None else None
+        pdf = canvas.Canvas(buffer if buffer is not None else output_filename, pagesize=self.page_size)
+        pdf.beginForm(STATIC_FORM_NAME)
+        self._draw_static(pdf)
+        pdf.endForm()
+        return pdf, buffer
+
+    def render(self, first_name, last_name, login_name, password, output_filename=None):
+        """
+        Génère la fiche d'un collaborateur.
+        Renvoie les octets du PDF, ou le chemin du fichier si output_filename est fourni.
+        """
+        with metrics.timer('pdf_render_duration_seconds', ('single',)):
+            pdf, buffer = self._open(output_filename)
+            self._draw_page(pdf, first_name, last_name, login_name, password)
+            pdf.save()
+        return buffer.getvalue() if buffer is not None else output_filename
+
+    def render_batch(self, users, output_filename=None):
+        """
+        Génère un seul PDF avec une page par collaborateur.
+        `users` est un itérable de dictionnaires (firstName, lastName, loginName, password).
+        Renvoie les octets du PDF, ou le chemin du fichier si output_filename est fourni.
+        """
+        with metrics.timer('pdf_render_duration_seconds', ('batch',)):
+            pdf, buffer = self._open(output_filename)
+            for user in users:
+                self._draw_page(pdf, user.get("firstName", ""), user.get("lastName", ""),
+                                user.get("loginName", ""), user.get("password", ""))
+            pdf.save()
+        return buffer.getvalue() if buffer is not None else output_filename
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def get_credential_template(logo_path):
+    """Renvoie le modèle de fiche associé à ce logo, construit une seule fois par processus."""
+    template = _templates.get(logo_path)
+    if template is None:
+        with _templates_lock:
+            template = _templates.get(logo_path)
+            if template is None:
+                template = _templates[logo_path] = CredentialSheetTemplate(logo_path)
+    return template
+
+
 def generate_pdf_with_logo(output_filename, logo_path, first_name, last_name, login_name, password):
-    pdf = canvas.Canvas(output_filename, pagesize=A4)
-    width, height = A4
-
-    # Charger le logo
-    logo = ImageReader(logo_path)
-    logo_width_cm = 4.0
-    logo_height_cm = 4.0
-    logo_width_pt = logo_width_cm * cm
-    logo_height_pt = logo_height_cm * cm
-
-    x_logo = 2 * cm
-    y_logo = height - 2 * cm - logo_height_pt
-
-    pdf.drawImage(logo, x_logo, y_logo, width=logo_width_pt, height=logo_height_pt, preserveAspectRatio=True, mask='auto')
-
-    # Titre
-    text_start_y = y_logo - 1.5 * cm
-    pdf.setFont("Helvetica-Bold", 16)
-    pdf.drawString(2 * cm, text_start_y, "Création de compte")
-
-    # Contenu
-    content_start_y = text_start_y - 2 * cm
-    line_height = 0.7 * cm
-    pdf.setFont("Helvetica", 12)
-
-    pdf.drawString(2 * cm, content_start_y, "Nom :")
-    pdf.drawString(2 * cm, content_start_y - line_height, "Prénom :")
-    pdf.drawString(2 * cm, content_start_y - 2 * line_height, "Identifiant :")
-    pdf.drawString(2 * cm, content_start_y - 3 * line_height, "Mot de passe :")
-
-    x_value = 6 * cm
-    pdf.drawString(x_value, content_start_y, last_name)
-    pdf.drawString(x_value, content_start_y - line_height, first_name)
-    pdf.drawString(x_value, content_start_y - 2 * line_height, login_name)
-    pdf.drawString(x_value, content_start_y - 3 * line_height, password)
-
-    # Fermeture
-    pdf.showPage()
-    pdf.save()
+    """
+    Génère la fiche d'identifiants du collaborateur.
+    Si output_filename vaut None, le PDF est produit en mémoire et ses octets sont renvoyés ;
+    sinon il est écrit dans ce fichier et le chemin est renvoyé.
+    """
+    return get_credential_template(logo_path).render(
+        first_name, last_name, login_name, password, output_filename=output_filename
+    )
@@ -0,0 +1,227 @@
+# rate_limit.py
+
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import closing
+
+
+class TokenBucket:
+    """
+    Limiteur de débit à seau de jetons, partagé entre threads.
+
+    Le seau contient au plus `capacity` jetons et se remplit de `rate` jetons par seconde ;
+    chaque opération consomme un jeton et attend s'il n'y en a plus. Un débit nul ou
+    négatif désactive la limitation.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = max(capacity or rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        """Ajoute les jetons accumulés depuis la dernière mise à jour (verrou tenu)."""
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Consomme `tokens` jetons, en attendant au besoin.
+        Renvoie False si les jetons n'ont pas pu être obtenus dans le délai `timeout` (secondes).
+        """
+        if self.rate <= 0:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None:
+                if now + wait > deadline:
+                    return False
+            time.sleep(wait)
+
+
+class MemoryWindowStore:
+    """Horodatages des tentatives par clé, en mémoire (propres au processus)."""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._hits = {}  # clé -> deque d'horodatages croissants
+        self._lock = threading.Lock()
+
+    def add_and_count(self, key, now, window, limit=None):
+        """
+        Enregistre une tentative et renvoie (nombre de tentatives dans la fenêtre, plus ancienne).
+        Si `limit` est fourni et déjà atteint, la tentative n'est pas enregistrée (le nombre
+        renvoyé la compte tout de même et dépasse donc `limit`).
+        """
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                if len(self._hits) >= self.max_keys:
+                    self._purge(now, window)
+                hits = self._hits[key] = deque()
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if limit is not None and len(hits) >= limit:
+                return len(hits) + 1, hits[0]
+            hits.append(now)
+            return len(hits), hits[0]
+
+    def count(self, key, now, window):
+        with self._lock:
+            hits = self._hits.get(key)
+            if not hits:
+                return 0, None
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            return len(hits), (hits[0] if hits else None)
+
+    def remove(self, key, ts):
+        """Retire une tentative enregistrée (horodatage renvoyé par SlidingWindowLimiter.try_hit)."""
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits:
+                try:
+                    hits.remove(ts)
+                except ValueError:
+                    pass
+
+    def clear(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+    def _purge(self, now, window):
+        """Oublie les clés sans tentative récente ; à défaut, les plus anciennes (verrou tenu)."""
+        for key in [key for key, hits in self._hits.items() if not hits or hits[-1] <= now - window]:
+            del self._hits[key]
+        while len(self._hits) >= self.max_keys:
+            del self._hits[min(self._hits, key=lambda k: self._hits[k][-1])]
+
+
+class SqliteWindowStore:
+    """
+    Horodatages des tentatives par clé dans une base SQLite partagée par tous les
+    processus (workers mod_wsgi), pour que les limites s'appliquent globalement.
+
+    Les tentatives expirées d'une clé sont effacées quand cette clé est vérifiée ; toutes
+    les `purge_every` tentatives, celles de toutes les clés sont effacées, pour que les clés
+    vues une seule fois (noms d'utilisateur essayés en rafale, adresses de passage) ne
+    s'accumulent pas dans la table.
+    """
+
+    def __init__(self, path, purge_every=500):
+        self.path = path
+        self.purge_every = purge_every
+        self._calls = 0
+        self._max_window = 0
+        self._lock = threading.Lock()
+        if not os.path.exists(path):
+            os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+        with self._connect() as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS attempts (key TEXT NOT NULL, ts REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS attempts_key ON attempts (key, ts)")
+            db.execute("CREATE INDEX IF NOT EXISTS attempts_ts ON attempts (ts)")
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=10))
+
+    def add_and_count(self, key, now, window, limit=None):
+        with self._lock:
+            self._calls += 1
+            self._max_window = max(self._max_window, window)
+            purge = self.purge_every > 0 and self._calls % self.purge_every == 0
+        if purge:
+            self.purge(now)
+        with self._connect() as db, db:
+            # Verrou d'écriture pris avant le comptage : deux processus ne peuvent pas
+            # compter puis insérer en même temps (vérification et enregistrement atomiques)
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("DELETE FROM attempts WHERE key = ? AND ts <= ?", (key, now - window))
+            count, oldest = db.execute("SELECT COUNT(*), MIN(ts) FROM attempts WHERE key = ?", (key,)).fetchone()
+            if limit is not None and count >= limit:
+                return count + 1, oldest
+            db.execute("INSERT INTO attempts (key, ts) VALUES (?, ?)", (key, now))
+            return count + 1, (now if oldest is None else oldest)
+
+    def count(self, key, now, window):
+        with self._connect() as db:
+            return tuple(db.execute(
+                "SELECT COUNT(*), MIN(ts) FROM attempts WHERE key = ? AND ts > ?", (key, now - window)
+            ).fetchone())
+
+    def remove(self, key, ts):
+        with self._connect() as db, db:
+            db.execute("DELETE FROM attempts WHERE rowid IN "
+                       "(SELECT rowid FROM attempts WHERE key = ? AND ts = ? LIMIT 1)", (key, ts))
+
+    def clear(self, key):
+        with self._connect() as db, db:
+            db.execute("DELETE FROM attempts WHERE key = ?", (key,))
+
+    def purge(self, now):
+        """Efface les tentatives de toutes les clés sorties de la plus longue fenêtre utilisée."""
+        with self._connect() as db, db:
+            return db.execute("DELETE FROM attempts WHERE ts <= ?", (now - self._max_window,)).rowcount
+
+
+class SlidingWindowLimiter:
+    """
+    Limiteur à fenêtre glissante : au plus `limit` tentatives par clé sur les `window`
+    dernières secondes. `store` conserve les horodatages (MemoryWindowStore par défaut,
+    SqliteWindowStore pour partager les compteurs entre processus).
+    """
+
+    def __init__(self, limit, window, store=None):
+        self.limit = limit
+        self.window = window
+        self.store = store if store is not None else MemoryWindowStore()
+
+    def retry_after(self, key):
+        """Délai (secondes) avant qu'une nouvelle tentative soit permise, 0 si elle l'est déjà."""
+        if self.limit <= 0:
+            return 0
+        now = time.time()
+        count, oldest = self.store.count(key, now, self.window)
+        if count < self.limit:
+            return 0
+        return max(oldest + self.window - now, 0)
+
+    def hit(self, key):
+        """Enregistre une tentative."""
+        if self.limit > 0:
+            self.store.add_and_count(key, time.time(), self.window)
+
+    def try_hit(self, key):
+        """
+        Vérifie la limite et enregistre la tentative en une seule opération du store, sans
+        fenêtre entre les deux (threads et processus concurrents). Renvoie (délai, horodatage) :
+        délai 0 et horodatage de la tentative enregistrée si elle est admise, délai avant une
+        nouvelle tentative et None si elle est refusée (elle n'est alors pas enregistrée).
+        """
+        if self.limit <= 0:
+            return 0, None
+        now = time.time()
+        count, oldest = self.store.add_and_count(key, now, self.window, limit=self.limit)
+        if count > self.limit:
+            return oldest + self.window - now, None
+        return 0, now
+
+    def refund(self, key, ts):
+        """Annule une tentative admise par try_hit."""
+        if ts is not None:
+            self.store.remove(key, ts)
+
+    def reset(self, key):
+        self.store.clear(key)
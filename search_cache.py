@@ -0,0 +1,128 @@
+# search_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """Normalise une saisie d'autocomplétion (espaces de bord, casse)."""
+    return " ".join(query.split()).casefold()
+
+
+class SearchCache:
+    """
+    Cache partagé des résultats des recherches d'autocomplétion.
+
+    Les entrées sont indexées par (route, requête normalisée, attributs demandés),
+    expirent au bout de `ttl` secondes et sont évincées dans l'ordre LRU au-delà
+    de `max_entries`. Une recherche `(cn=*dupo*)` peut être servie depuis le
+    résultat de `(cn=*dup*)` en filtrant localement sur le cn, à condition que ce
+    résultat n'ait pas été tronqué par une limite de taille.
+
+    Chaque enregistrement mis en cache est un dictionnaire contenant au moins la clé 'cn'.
+    """
+
+    def __init__(self, max_entries=512, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # clé -> (expiration, tronqué, enregistrements)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.refinement_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    @staticmethod
+    def _key(endpoint, normalized_query, attributes):
+        return endpoint, normalized_query, tuple(sorted(attributes))
+
+    def _store(self, key, expires_at, truncated, records):
+        """Ajoute une entrée en tête de LRU et évince la plus ancienne si besoin (verrou tenu)."""
+        self._entries[key] = (expires_at, truncated, records)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _lookup(self, key, now):
+        """Renvoie l'entrée valide associée à la clé, en supprimant une entrée expirée (verrou tenu)."""
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        if item[0] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return item
+
+    def get(self, endpoint, query, attributes):
+        """
+        Renvoie le couple (enregistrements, tronqué) en cache pour cette recherche, ou None.
+        Essaie d'abord la requête exacte, puis ses préfixes du plus long au plus court.
+        """
+        if not self.enabled:
+            return None
+        normalized = normalize_query(query)
+        now = time.monotonic()
+        with self._lock:
+            item = self._lookup(self._key(endpoint, normalized, attributes), now)
+            if item is not None:
+                self.hits += 1
+                return item[2], item[1]
+
+            for length in range(len(normalized) - 1, 0, -1):
+                parent_key = self._key(endpoint, normalized[:length], attributes)
+                parent = self._lookup(parent_key, now)
+                if parent is None or parent[1]:
+                    continue
+                records = [r for r in parent[2] if normalized in normalize_query(r.get('cn', ''))]
+                # Le résultat affiné n'expire pas après celui dont il est issu
+                self._store(self._key(endpoint, normalized, attributes), parent[0], False, records)
+                self.refinement_hits += 1
+                return records, False
+
+            self.misses += 1
+            return None
+
+    def put(self, endpoint, query, attributes, records, truncated=False):
+        """Enregistre le résultat d'une recherche LDAP."""
+        if not self.enabled:
+            return
+        key = self._key(endpoint, normalize_query(query), attributes)
+        with self._lock:
+            self._store(key, time.monotonic() + self.ttl, truncated, records)
+
+    def invalidate(self, name=None):
+        """
+        Invalide le cache après une modification de l'annuaire.
+        Si `name` (cn de l'objet modifié) est fourni, seules les recherches dont
+        le résultat peut contenir cet objet sont supprimées ; sinon tout est vidé.
+        """
+        with self._lock:
+            self.invalidations += 1
+            if not name:
+                self._entries.clear()
+                return
+            normalized_name = normalize_query(name)
+            for key in [k for k in self._entries if k[1] in normalized_name]:
+                del self._entries[key]
+
+    def stats(self):
+        """Compteurs d'utilisation, pour dimensionner le cache."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "refinement_hits": self.refinement_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
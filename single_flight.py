@@ -0,0 +1,118 @@
+# single_flight.py
+
+import threading
+
+
+class SingleFlightTimeout(TimeoutError):
+    """
+    Levée lorsqu'un appel en attente du résultat d'un appel identique en cours
+    ne l'a pas obtenu dans le délai imparti.
+    """
+
+
+class FlightAbandoned(Exception):
+    """
+    Transmise aux appels en attente lorsque le premier appel a été interrompu sans erreur
+    propre (générateur fermé par le client) : ils peuvent alors exécuter l'appel eux-mêmes.
+    """
+
+
+class Flight:
+    """Appel en cours : les appels identiques attendent `done` puis lisent le résultat ou l'erreur."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def result(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise SingleFlightTimeout("Délai dépassé en attente d'une recherche identique en cours")
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class SingleFlight:
+    """
+    Regroupement des appels identiques simultanés (« single-flight »), entre les threads
+    d'un même processus.
+
+    Le premier appel pour une clé l'exécute ; les appels de même clé qui arrivent pendant
+    son exécution attendent au plus `timeout` secondes et reçoivent le même résultat
+    (ou la même exception). Rien n'est conservé une fois l'appel terminé : ce n'est pas
+    un cache, seules les exécutions simultanées sont partagées.
+
+    Si le premier appel est interrompu (par exemple un générateur abandonné par le client),
+    les appels en attente reçoivent FlightAbandoned.
+
+    `do` convient aux appels qui renvoient un résultat complet ; `begin`, `complete` et
+    `fail` permettent au premier appel de diffuser son résultat au fil de l'eau (générateur)
+    et de ne le publier qu'à la fin.
+    """
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def begin(self, key):
+        """Renvoie (appel, premier) : si `premier` est vrai, l'appelant exécute puis publie le résultat."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self.executed += 1
+            return flight, True
+
+    def _finish(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.done.set()
+
+    def complete(self, key, flight, value):
+        flight.value = value
+        self._finish(key, flight)
+
+    def fail(self, key, flight, error):
+        """Publie l'erreur du premier appel ; une interruption (GeneratorExit...) devient FlightAbandoned."""
+        flight.error = error if isinstance(error, Exception) else FlightAbandoned()
+        self._finish(key, flight)
+
+    def wait(self, flight):
+        """Attend le résultat d'un appel en cours (pour un appelant qui n'est pas le premier)."""
+        try:
+            return flight.result(self.timeout)
+        except SingleFlightTimeout:
+            with self._lock:
+                self.timeouts += 1
+            raise
+
+    def do(self, key, fn):
+        """Exécute `fn()` ou, si un appel de même clé est en cours, partage son résultat."""
+        flight, leader = self.begin(key)
+        if not leader:
+            return self.wait(flight)
+        try:
+            value = fn()
+        except BaseException as e:
+            self.fail(key, flight, e)
+            raise
+        self.complete(key, flight, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "timeouts": self.timeouts,
+                "timeout": self.timeout,
+            }
@@ -0,0 +1,117 @@
+# tests/bench_app.py
+"""
+Outils communs aux scripts de mesure `tests/bench_*.py` (non collectés par pytest).
+
+`load_app` charge l'application Flask sans contrôleur de domaine : le pool admin est
+remplacé par un pool sur l'annuaire simulé de ldap3 (MOCK_SYNC) et le spool de
+notifications est placé dans un dossier temporaire, sans worker d'envoi.
+`inject_latency` ajoute un délai fixe à chaque opération LDAP pour approcher le coût
+d'un aller-retour réseau. Les scripts se lancent depuis la racine du dépôt, par exemple :
+python tests/bench_bulk_onboarding.py
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+
+from ldap3 import Server, Connection, MOCK_SYNC
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+BASE_DN = 'DC=example,DC=com'
+ADMIN_LOGIN = 'svc'
+ADMIN_DOMAIN = 'example.com'
+ADMIN_PASSWORD = 'service-pw'
+ADMIN_DN = f'CN={ADMIN_LOGIN},{BASE_DN}'
+
+
+def load_app(**environ):
+    """
+    Importe l'application (paquet racine) sous le nom `flask_app` et renvoie
+    (module, connexion liée servant à peupler l'annuaire simulé).
+    """
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    settings = {
+        'DOTENV_PATH': os.devnull,
+        'SERVER_IP': 'mock-dc',
+        'BASE_DN': BASE_DN,
+        'TESTNAME': ADMIN_LOGIN,
+        'DOMAIN': ADMIN_DOMAIN,
+        'PASSWORD': ADMIN_PASSWORD,
+        'SECRET_KEY': 'bench-secret-key-for-local-measurements-only',
+        'LOG_LEVEL': 'ERROR',
+        'NOTIFICATION_WORKERS': '0',
+        'NOTIFICATION_SPOOL_PATH': os.path.join(workdir, 'notifications_spool.sqlite3'),
+        'LDAP_SCHEMA_PATH': os.path.join(workdir, 'ldap_schema.json'),
+        'DIRECTORY_INDEX_ENABLED': 'false',
+    }
+    settings.update(environ)
+    for name, value in settings.items():
+        os.environ.setdefault(name, value)
+
+    spec = importlib.util.spec_from_file_location(
+        'flask_app', os.path.join(REPO_ROOT, '__init__.py'), submodule_search_locations=[REPO_ROOT])
+    flask_app = importlib.util.module_from_spec(spec)
+    sys.modules['flask_app'] = flask_app
+    spec.loader.exec_module(flask_app)
+    return flask_app, mock_directory(flask_app)
+
+
+def mock_directory(flask_app):
+    """
+    Remplace le pool admin de l'application par un pool sur un nouvel annuaire simulé
+    (vide hormis le compte de service) et renvoie la connexion qui sert à le peupler.
+    Le coût des filtres du serveur simulé croît avec la taille de l'annuaire : chaque
+    mesure comparée part d'un annuaire neuf.
+    """
+    from ldap_pool import LdapConnectionPool
+
+    server = Server('mock-dc')
+    seed = Connection(server, user=ADMIN_DN, password=ADMIN_PASSWORD, client_strategy=MOCK_SYNC)
+    seed.strategy.add_entry(ADMIN_DN, {'cn': ADMIN_LOGIN, 'userPassword': ADMIN_PASSWORD})
+    seed.bind()
+    flask_app.admin_ldap_pool.close()
+    flask_app.admin_ldap_pool = LdapConnectionPool(server, ADMIN_DN, ADMIN_PASSWORD, client_strategy=MOCK_SYNC)
+    return seed
+
+
+def authenticated_client(flask_app, user='bench@example.com'):
+    """Client de test Flask porteur d'un cookie JWT valide."""
+    client = flask_app.app.test_client()
+    with flask_app.app.app_context():
+        client.set_cookie('authToken', flask_app.create_jwt_token(user))
+    return client
+
+
+def inject_latency(delay, operations=('search', 'add', 'modify', 'delete', 'bind')):
+    """
+    Ajoute `delay` secondes à chaque opération des connexions instrumentées (celles des
+    pools) et renvoie un compteur [nombre d'opérations] remis à zéro par l'appelant.
+    """
+    from metrics import InstrumentedConnection
+
+    counter = [0]
+    for name in operations:
+        original = getattr(InstrumentedConnection, name)
+
+        def delayed(self, *args, _original=original, **kwargs):
+            counter[0] += 1
+            time.sleep(delay)
+            return _original(self, *args, **kwargs)
+
+        setattr(InstrumentedConnection, name, delayed)
+    return counter
+
+
+def timed(function, *args, **kwargs):
+    """Renvoie (résultat, durée en secondes) d'un appel."""
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def report(label, count, seconds, unit='op'):
+    print(f"{label:<45} {count:>7} {unit} en {seconds:7.3f} s  ({count / seconds:10.1f} {unit}/s)")
@@ -0,0 +1,53 @@
+# tests/bench_bulk_onboarding.py
+"""
+Mesure : N appels /create_user successifs contre un seul appel /create_users_bulk de N lignes,
+sur l'annuaire simulé avec un délai injecté à chaque opération LDAP (2 ms par défaut).
+
+    python tests/bench_bulk_onboarding.py [--count 100] [--delay 0.002] [--groups 3]
+"""
+
+import argparse
+
+import bench_app
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument('--count', type=int, default=100, help="nombre de collaborateurs créés par mesure")
+parser.add_argument('--delay', type=float, default=0.002, help="délai ajouté à chaque opération LDAP (s)")
+parser.add_argument('--groups', type=int, default=3, help="nombre de groupes par collaborateur")
+args = parser.parse_args()
+
+flask_app, _ = bench_app.load_app()
+flask_app.DEFAULT_GROUPS = []
+operations = bench_app.inject_latency(args.delay)
+client = bench_app.authenticated_client(flask_app)
+
+
+def prepare(tag):
+    """Annuaire neuf avec ses groupes, et les lignes à créer."""
+    seed = bench_app.mock_directory(flask_app)
+    groups = [f'CN=Groupe {i},OU=Groups,{bench_app.BASE_DN}' for i in range(args.groups)]
+    for group_dn in groups:
+        seed.strategy.add_entry(group_dn, {'cn': group_dn[3:].split(',')[0], 'objectClass': ['top', 'group']})
+    return [{'fullName': f'Prenom{i}{tag} Nom', 'firstName': f'Prenom{i}{tag}', 'lastName': 'Nom',
+             'new_ou': 'Staff', 'memberOf': groups} for i in range(args.count)]
+
+
+def sequential(rows):
+    for row in rows:
+        response = client.post('/create_user', json=row)
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+
+def bulk(rows):
+    body = client.post('/create_users_bulk', json=rows).get_data(as_text=True)
+    assert body.count('"status": "created"') == len(rows), body[-500:]
+
+
+print(f"{args.count} collaborateurs, {args.groups} groupe(s) chacun, {args.delay * 1000:.1f} ms par opération LDAP")
+for tag, label, function in (('s', f"{args.count} x /create_user", sequential),
+                             ('b', "/create_users_bulk", bulk)):
+    rows = prepare(tag)
+    operations[0] = 0
+    _, seconds = bench_app.timed(function, rows)
+    bench_app.report(label, args.count, seconds, unit='comptes')
+    print(f"{'':<45} {operations[0]:>7} opérations LDAP")
@@ -0,0 +1,100 @@
+# tests/bench_credential_sheets.py
+"""
+Mesure : fiches d'identifiants par seconde, chemin d'origine (logo relu et décodé à chaque
+fiche) contre CredentialSheetTemplate (logo décodé une fois, partie statique en formulaire
+PDF), fiche par fiche puis en lot (render_batch, un seul PDF).
+
+Sans `--logo`, un logo PNG de 400x400 pixels est généré dans un dossier temporaire
+(logo_pdf.png n'est pas versionné).
+
+    python tests/bench_credential_sheets.py [--count 200] [--logo chemin/logo.png]
+"""
+
+import argparse
+import os
+import tempfile
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+import bench_app
+from pdf_utils import CredentialSheetTemplate
+
+
+def decode_per_call_sheet(logo_path, first_name, last_name, login_name, password):
+    """Chemin d'origine de generate_pdf_with_logo (en mémoire) : ImageReader à chaque fiche."""
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    logo = ImageReader(logo_path)
+    logo_width_pt = 4.0 * cm
+    logo_height_pt = 4.0 * cm
+    x_logo = 2 * cm
+    y_logo = height - 2 * cm - logo_height_pt
+    pdf.drawImage(logo, x_logo, y_logo, width=logo_width_pt, height=logo_height_pt, preserveAspectRatio=True, mask='auto')
+    text_start_y = y_logo - 1.5 * cm
+    pdf.setFont("Helvetica-Bold", 16)
+    pdf.drawString(2 * cm, text_start_y, "Création de compte")
+    content_start_y = text_start_y - 2 * cm
+    line_height = 0.7 * cm
+    pdf.setFont("Helvetica", 12)
+    pdf.drawString(2 * cm, content_start_y, "Nom :")
+    pdf.drawString(2 * cm, content_start_y - line_height, "Prénom :")
+    pdf.drawString(2 * cm, content_start_y - 2 * line_height, "Identifiant :")
+    pdf.drawString(2 * cm, content_start_y - 3 * line_height, "Mot de passe :")
+    x_value = 6 * cm
+    pdf.drawString(x_value, content_start_y, last_name)
+    pdf.drawString(x_value, content_start_y - line_height, first_name)
+    pdf.drawString(x_value, content_start_y - 2 * line_height, login_name)
+    pdf.drawString(x_value, content_start_y - 3 * line_height, password)
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def sample_logo(directory):
+    """Logo de test : dégradé avec un disque semi-transparent (compressible comme un vrai logo)."""
+    path = os.path.join(directory, 'logo_pdf.png')
+    image = Image.linear_gradient('L').resize((400, 400)).convert('RGBA')
+    ImageDraw.Draw(image).ellipse((60, 60, 340, 340), fill=(0, 90, 170, 200))
+    image.save(path)
+    return path
+
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument('--count', type=int, default=200, help="nombre de fiches par mesure")
+parser.add_argument('--logo', default=None, help="logo PNG à utiliser")
+args = parser.parse_args()
+
+logo_path = args.logo or sample_logo(tempfile.mkdtemp(prefix='bench-'))
+users = [{"firstName": f"Prénom{i}", "lastName": "Nom", "loginName": f"pnom{i}", "password": "Xy7!kP2m-aQ9"}
+         for i in range(args.count)]
+
+
+def per_call():
+    for user in users:
+        decode_per_call_sheet(logo_path, user["firstName"], user["lastName"], user["loginName"], user["password"])
+
+
+template, build_seconds = bench_app.timed(CredentialSheetTemplate, logo_path)
+
+
+def cached():
+    for user in users:
+        template.render(user["firstName"], user["lastName"], user["loginName"], user["password"])
+
+
+def batch():
+    template.render_batch(users)
+
+
+print(f"{args.count} fiches, logo {logo_path} (construction du modèle : {build_seconds * 1000:.1f} ms)")
+for label, function in (("logo décodé à chaque fiche", per_call),
+                        ("modèle en cache, une fiche par PDF", cached),
+                        ("modèle en cache, render_batch", batch)):
+    _, seconds = bench_app.timed(function)
+    bench_app.report(label, args.count, seconds, unit='fiches')
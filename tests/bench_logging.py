@@ -0,0 +1,89 @@
+# tests/bench_logging.py
+"""
+Mesure : coût d'un appel de journalisation dans le thread de la requête.
+
+1. logger.info vers un fichier avec fsync à chaque enregistrement (disque lent ou
+   journal réseau) : FileHandler synchrone contre NonBlockingQueueHandler + QueueListener
+   (formatage JSON et écriture dans le thread d'écoute) ; moyenne et 99e centile.
+2. Appel debug désactivé avec un dictionnaire en argument : f-string (formatée même si
+   le niveau est désactivé) contre formatage différé "%s".
+
+    python tests/bench_logging.py [--count 20000]
+"""
+
+import argparse
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+
+import bench_app
+import logging_setup
+
+
+class FsyncFileHandler(logging.FileHandler):
+    """Écrit et force chaque enregistrement sur disque."""
+
+    def emit(self, record):
+        super().emit(record)
+        self.flush()
+        os.fsync(self.stream.fileno())
+
+
+def measure(label, handler, count):
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(logging.INFO)
+    logger = logging.getLogger('bench')
+    latencies = []
+    for number in range(count):
+        _, seconds = bench_app.timed(logger.info, "Utilisateur %s modifié (%d)", "jdupont", number)
+        latencies.append(seconds)
+    latencies.sort()
+    mean = sum(latencies) / count
+    print(f"{label:<45} moyenne {mean * 1e6:8.1f} µs   p99 {latencies[int(count * 0.99)] * 1e6:8.1f} µs")
+
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument('--count', type=int, default=20000, help="nombre d'appels par mesure")
+args = parser.parse_args()
+workdir = tempfile.mkdtemp(prefix='bench-')
+
+synchronous = FsyncFileHandler(os.path.join(workdir, 'sync.log'))
+synchronous.setFormatter(logging_setup.JsonFormatter())
+synchronous.addFilter(logging_setup.RequestIdFilter())
+measure("FileHandler synchrone (fsync)", synchronous, args.count)
+synchronous.close()
+
+records = queue.Queue(args.count * 2)
+queued = logging_setup.NonBlockingQueueHandler(records)
+queued.addFilter(logging_setup.RequestIdFilter())
+sink = FsyncFileHandler(os.path.join(workdir, 'queue.log'))
+sink.setFormatter(logging_setup.JsonFormatter())
+listener = logging.handlers.QueueListener(records, sink)
+listener.start()
+measure("QueueHandler + listener (fsync)", queued, args.count)
+listener.stop()
+sink.close()
+
+root = logging.getLogger()
+root.setLevel(logging.INFO)
+logger = logging.getLogger('bench')
+data = {'newDescription': 'Chef de projet', 'memberOf': [f'CN=Groupe {i},OU=Groups,DC=example,DC=com'
+                                                         for i in range(20)]}
+
+
+def eager():
+    for _ in range(args.count):
+        logger.debug(f"Data : {data}")
+
+
+def lazy():
+    for _ in range(args.count):
+        logger.debug("Data : %s", data)
+
+
+for label, function in (("debug désactivé, f-string", eager), ("debug désactivé, %s différé", lazy)):
+    _, seconds = bench_app.timed(function)
+    print(f"{label:<45} moyenne {seconds / args.count * 1e6:8.2f} µs")
@@ -0,0 +1,82 @@
+# tests/bench_mail_dispatcher.py
+"""
+Mesure : messages par seconde envoyés par MailDispatcher (une session SMTP réutilisée)
+contre Mail.send de Flask-Mail (une session par message, chemin d'avant le dispatcher),
+vers un serveur SMTP local (aiosmtpd).
+
+Le serveur local répond sans délai : `--handshake-delay` retarde la réponse à EHLO pour
+approcher le coût d'ouverture d'une session réelle (connexion, STARTTLS, authentification).
+
+    python tests/bench_mail_dispatcher.py [--count 200] [--handshake-delay 0.05]
+"""
+
+import argparse
+import asyncio
+import socket
+
+from aiosmtpd.controller import Controller
+from flask import Flask
+from flask_mail import Mail, Message
+
+import bench_app
+from mail_utils import MailDispatcher
+
+
+class SinkHandler:
+    """Serveur SMTP puits : compte les messages et les sessions ouvertes."""
+
+    def __init__(self, handshake_delay):
+        self.handshake_delay = handshake_delay
+        self.messages = 0
+        self.sessions = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        if self.handshake_delay:
+            await asyncio.sleep(self.handshake_delay)
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        return '250 OK'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument('--count', type=int, default=200, help="nombre de messages par mesure")
+parser.add_argument('--handshake-delay', type=float, default=0.0, help="délai ajouté à EHLO (s)")
+args = parser.parse_args()
+
+handler = SinkHandler(args.handshake_delay)
+controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+controller.start()
+
+app = Flask('bench')
+app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=controller.port, MAIL_USE_TLS=False,
+                  MAIL_DEFAULT_SENDER='noreply@example.com')
+mail = Mail(app)
+dispatcher = MailDispatcher(mail, idle_timeout=30)
+
+
+def send_all(sender):
+    with app.app_context():
+        for number in range(args.count):
+            sender.send(Message(f"Message {number}", recipients=['rh@example.com'], body="Corps du message"))
+
+
+print(f"{args.count} messages, délai de session {args.handshake_delay * 1000:.0f} ms")
+try:
+    for label, sender in (("Mail.send (une session par message)", mail), ("MailDispatcher (session réutilisée)", dispatcher)):
+        handler.messages = handler.sessions = 0
+        _, seconds = bench_app.timed(send_all, sender)
+        bench_app.report(label, handler.messages, seconds, unit='messages')
+        print(f"{'':<45} {handler.sessions:>7} session(s) SMTP")
+finally:
+    dispatcher.close()
+    controller.stop()
@@ -0,0 +1,88 @@
+# tests/bench_mail_templates.py
+"""
+Mesure : rendus par seconde du mail de modification, modèle Jinja2 précompilé (échappement
+automatique) contre l'ancienne construction par f-string et concaténation (sans échappement,
+puis avec html.escape pour une sortie équivalente), et du mail récapitulatif de 50 événements.
+
+    python tests/bench_mail_templates.py [--count 20000]
+"""
+
+import argparse
+import html
+
+import bench_app
+import mail_templates
+
+FIELDS = [
+    ("Collaborateur", "Jean Dupont"),
+    ("Description", "Chef de projet <Infra> & réseaux"),
+    ("Bureau", "B-204"),
+    ("Numéro de téléphone", "01 23 45 67 89"),
+    ("Login", "jdupont@example.com"),
+    ("Manager", "Marie Martin"),
+    ("Groupes attribués", "Utilisateurs VPN, Comptabilité, Partage RH"),
+]
+
+EVENTS = [{"kind": "user_modified", "label": "Modification", "collaborator": f"Collaborateur {i}",
+           "details": FIELDS[1:], "time": "2026-10-18 09:30"} for i in range(50)]
+
+
+def fstring_modification(fields, escape=False):
+    """Construction d'origine du mail de modification (send_modification_email avant les modèles)."""
+    table_rows = ""
+    for key, value in fields:
+        if escape:
+            key, value = html.escape(key), html.escape(value)
+        table_rows += f"<tr><td style='padding:5px 10px;'>{key}</td><td style='padding:5px 10px;'>{value}</td></tr>"
+    return f"""
+<html>
+  <head>
+    <style>
+      table {{
+        font-family: Arial, sans-serif;
+        border-collapse: collapse;
+      }}
+      th, td {{
+        padding: 5px 10px;
+        text-align: left;
+      }}
+    </style>
+  </head>
+  <body style="margin:0; padding:0; font-family:Arial, sans-serif;">
+    <p>Bonjour,</p>
+    <p>Les informations suivantes ont été modifiées pour le collaborateur :</p>
+    <table border="0" cellspacing="0" cellpadding="0">
+      <tr>
+        <th>Champs</th>
+        <th>Valeurs</th>
+      </tr>
+      {table_rows}
+    </table>
+    <p>Cordialement,<br>L'équipe IT</p>
+  </body>
+</html>
+"""
+
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument('--count', type=int, default=20000, help="nombre de rendus par mesure")
+args = parser.parse_args()
+
+
+def repeat(function, count):
+    def run():
+        for _ in range(count):
+            function()
+    return run
+
+
+digest_count = max(1, args.count // 50)
+cases = (
+    ("f-string, sans échappement (origine)", args.count, lambda: fstring_modification(FIELDS)),
+    ("f-string + html.escape", args.count, lambda: fstring_modification(FIELDS, escape=True)),
+    ("modèle Jinja2 modification.html", args.count, lambda: mail_templates.render("modification.html", rows=FIELDS)),
+    ("modèle Jinja2 digest.html (50 événements)", digest_count, lambda: mail_templates.render("digest.html", events=EVENTS)),
+)
+for label, count, function in cases:
+    _, seconds = bench_app.timed(repeat(function, count))
+    bench_app.report(label, count, seconds, unit='rendus')
@@ -0,0 +1,49 @@
+# tests/bench_token_required.py
+"""
+Mesure : appels par seconde du décorateur token_required avec le cache des jetons vérifiés
+(VerifiedTokenCache) et sans (JWT_CACHE_SIZE=0 : vérification HMAC complète à chaque
+appel), d'abord seul dans un contexte de requête, puis sur /check_auth par le client de
+test Flask.
+
+    python tests/bench_token_required.py [--count 20000]
+"""
+
+import argparse
+
+import bench_app
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument('--count', type=int, default=20000, help="nombre d'appels par mesure")
+args = parser.parse_args()
+
+flask_app, _ = bench_app.load_app()
+client = bench_app.authenticated_client(flask_app)
+with flask_app.app.app_context():
+    token = flask_app.create_jwt_token('bench@example.com')
+
+
+@flask_app.token_required
+def protected():
+    return 'ok'
+
+
+def decorator_only():
+    with flask_app.app.test_request_context('/', headers={'Cookie': f'authToken={token}'}):
+        for _ in range(args.count):
+            assert protected() == 'ok'
+
+
+def check_auth():
+    for _ in range(args.count // 10):
+        assert client.get('/check_auth').status_code == 200
+
+
+cache_size = flask_app.token_cache.max_entries
+for label, size in (("avec cache", cache_size), ("sans cache", 0)):
+    flask_app.token_cache.max_entries = size
+    flask_app.token_cache.discard(flask_app.token_digest(token))
+    _, seconds = bench_app.timed(decorator_only)
+    bench_app.report(f"token_required seul, {label}", args.count, seconds, unit='appels')
+    _, seconds = bench_app.timed(check_auth)
+    bench_app.report(f"GET /check_auth, {label}", args.count // 10, seconds, unit='requêtes')
+flask_app.token_cache.max_entries = cache_size
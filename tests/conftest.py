@@ -0,0 +1,27 @@
+# tests/conftest.py
+
+import os
+import sys
+
+import pytest
+from ldap3 import Server, Connection, MOCK_SYNC, OFFLINE_AD_2012_R2
+
+# Les modules de l'application sont à la racine du dépôt (importés sans paquet)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ADMIN_DN = 'CN=svc,DC=example,DC=com'
+ADMIN_PASSWORD = 'service-pw'
+BASE_DN = 'DC=example,DC=com'
+
+
+@pytest.fixture
+def ldap_server():
+    """
+    Serveur ldap3 simulé (MOCK_SYNC) : toutes les connexions ouvertes sur ce Server
+    partagent le même annuaire. Renvoie (server, connexion liée servant à peupler l'annuaire).
+    """
+    server = Server('mock-dc', get_info=OFFLINE_AD_2012_R2)
+    seed = Connection(server, user=ADMIN_DN, password=ADMIN_PASSWORD, client_strategy=MOCK_SYNC)
+    seed.strategy.add_entry(ADMIN_DN, {'cn': 'svc', 'userPassword': ADMIN_PASSWORD, 'objectClass': ['top', 'user']})
+    seed.bind()
+    return server, seed
@@ -0,0 +1,27 @@
+# tests/test_directory_index.py
+
+import time
+
+from directory_index import DirectoryIndex
+
+
+def test_sync_thread_survives_unexpected_errors(caplog):
+    index = DirectoryIndex(connection_factory=None, base_dn='DC=example,DC=com', sync_interval=0.01)
+    calls = []
+
+    def load():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            # Erreur hors LDAP (valeur inattendue dans une réponse, par exemple)
+            raise ValueError("uSNChanged invalide")
+
+    index.load = load
+    index.start()
+    try:
+        deadline = time.monotonic() + 2
+        while len(calls) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        index.stop()
+    assert len(calls) >= 3
+    assert "Échec de la synchronisation de l'index annuaire" in caplog.text
@@ -0,0 +1,89 @@
+# tests/test_group_membership.py
+
+import pytest
+from ldap3 import Server, Connection, MOCK_SYNC
+
+from conftest import ADMIN_DN, ADMIN_PASSWORD, BASE_DN
+from group_membership import GroupMembershipWriter, RESULT_NO_SUCH_OBJECT
+
+GROUP_DN = f'CN=Staff,OU=Groups,{BASE_DN}'
+
+
+def user_dn(name):
+    return f'CN={name},OU=Staff,{BASE_DN}'
+
+
+@pytest.fixture
+def connection():
+    """
+    Connexion simulée dont modify refuse, comme l'AD, tout lot contenant un membre
+    inexistant (le serveur simulé de ldap3 ne contrôle pas l'intégrité référentielle).
+    """
+    server = Server('mock-dc')
+    conn = Connection(server, user=ADMIN_DN, password=ADMIN_PASSWORD, client_strategy=MOCK_SYNC)
+    conn.strategy.add_entry(ADMIN_DN, {'cn': 'svc', 'userPassword': ADMIN_PASSWORD})
+    conn.bind()
+    conn.strategy.add_entry(GROUP_DN, {'cn': 'Staff', 'objectClass': 'group', 'member': [user_dn('u0')]})
+    for i in range(6):
+        conn.strategy.add_entry(user_dn(f'u{i}'), {'cn': f'u{i}', 'memberOf': [GROUP_DN] if i == 0 else []})
+
+    modify = conn.modify
+    conn.modify_calls = 0
+
+    def checked_modify(dn, changes):
+        conn.modify_calls += 1
+        values = [value for _, values in changes.get('member', []) for value in values]
+        if any('missing' in value.lower() for value in values):
+            conn.result = {'result': RESULT_NO_SUCH_OBJECT, 'description': 'noSuchObject'}
+            return False
+        return modify(dn, changes)
+
+    conn.modify = checked_modify
+    return conn
+
+
+def members(conn):
+    conn.search(GROUP_DN, '(objectClass=*)', attributes=['member'])
+    return {value.lower() for value in conn.entries[0].member.values}
+
+
+def test_single_modify_per_group(connection):
+    writer = GroupMembershipWriter(BASE_DN)
+    for i in range(1, 6):
+        writer.add(GROUP_DN, user_dn(f'u{i}'))
+    writer.remove(GROUP_DN, user_dn('u0'))
+
+    outcome = writer.flush(connection)[GROUP_DN]
+
+    assert outcome['status'] == 'ok'
+    assert connection.modify_calls == 1
+    assert members(connection) == {user_dn(f'u{i}').lower() for i in range(1, 6)}
+    assert writer.pending_groups() == 0
+
+
+def test_unknown_members_are_isolated(connection):
+    writer = GroupMembershipWriter(BASE_DN)
+    wanted = [user_dn('u1'), user_dn('missing1'), user_dn('u2'), user_dn('u3'), user_dn('missing2')]
+    for dn in wanted:
+        writer.add(GROUP_DN, dn)
+
+    outcome = writer.flush(connection)[GROUP_DN]
+
+    assert outcome['status'] == 'partial'
+    assert sorted(outcome['failed']) == sorted([user_dn('missing1'), user_dn('missing2')])
+    assert set(outcome['errors']) == set(outcome['failed'])
+    assert sorted(outcome['added']) == sorted([user_dn('u1'), user_dn('u2'), user_dn('u3')])
+    assert members(connection) == {user_dn(name).lower() for name in ('u0', 'u1', 'u2', 'u3')}
+
+
+def test_missing_group_fails_without_split(connection):
+    writer = GroupMembershipWriter(BASE_DN)
+    missing_group = f'CN=Nope,OU=Groups,{BASE_DN}'
+    writer.add(missing_group, user_dn('u1'))
+    writer.add(missing_group, user_dn('u2'))
+
+    outcome = writer.flush(connection)[missing_group]
+
+    assert outcome['status'] == 'error'
+    assert sorted(outcome['failed']) == sorted([user_dn('u1'), user_dn('u2')])
+    assert connection.modify_calls == 1
@@ -0,0 +1,112 @@
+# tests/test_ldap_pool.py
+
+import threading
+
+import pytest
+from ldap3 import MOCK_SYNC
+from ldap3.core.exceptions import LDAPBindError
+
+from conftest import ADMIN_DN, ADMIN_PASSWORD
+from ldap_pool import LdapConnectionPool, LdapPoolTimeout
+
+
+def make_pool(server, **kwargs):
+    kwargs.setdefault('size', 2)
+    return LdapConnectionPool(server, ADMIN_DN, ADMIN_PASSWORD, client_strategy=MOCK_SYNC, **kwargs)
+
+
+def test_connection_is_reused(ldap_server):
+    server, _ = ldap_server
+    pool = make_pool(server)
+    for _ in range(5):
+        with pool.connection() as connection:
+            assert connection.bound
+    assert pool.stats()['connects'] == 1
+    assert pool.stats()['idle'] == 1
+
+
+def test_closed_connection_is_reopened_on_acquire(ldap_server):
+    server, _ = ldap_server
+    pool = make_pool(server)
+    with pool.connection() as connection:
+        pass
+    connection.unbind()
+    with pool.connection() as reopened:
+        assert reopened is not connection
+        assert reopened.bound
+    assert pool.stats()['connects'] == 2
+
+
+def test_discarded_connection_is_not_reused(ldap_server):
+    server, _ = ldap_server
+    pool = make_pool(server)
+    connection = pool.acquire()
+    pool.release(connection, discard=True)
+    assert connection.closed
+    assert pool.stats()['idle'] == 0
+
+
+def test_bind_failure_raises_and_frees_the_slot(ldap_server):
+    server, _ = ldap_server
+    pool = LdapConnectionPool(server, ADMIN_DN, 'wrong', size=1, client_strategy=MOCK_SYNC)
+    with pytest.raises(LDAPBindError):
+        pool.acquire()
+    assert pool.stats()['in_use'] == 0
+
+
+def test_acquire_times_out_when_exhausted(ldap_server):
+    server, _ = ldap_server
+    pool = make_pool(server, size=1, acquire_timeout=0.1)
+    held = pool.acquire()
+    with pytest.raises(LdapPoolTimeout):
+        pool.acquire()
+    pool.release(held)
+    pool.release(pool.acquire())
+
+
+def test_concurrent_borrowers_never_exceed_size(ldap_server):
+    server, _ = ldap_server
+    pool = make_pool(server, size=3, acquire_timeout=5)
+    lock = threading.Lock()
+    borrowed = [0, 0]  # en cours, maximum observé
+
+    def borrow():
+        for _ in range(20):
+            with pool.connection():
+                with lock:
+                    borrowed[0] += 1
+                    borrowed[1] = max(borrowed[1], borrowed[0])
+                with lock:
+                    borrowed[0] -= 1
+
+    threads = [threading.Thread(target=borrow) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert borrowed[1] <= 3
+    assert pool.stats()['connects'] <= 3
+    assert pool.stats()['in_use'] == 0
+
+
+def test_verify_credentials_keeps_the_channel_and_restores_the_service_identity(ldap_server):
+    server, seed = ldap_server
+    user_dn = 'CN=Jean Dupont,DC=example,DC=com'
+    seed.strategy.add_entry(user_dn, {'cn': 'Jean Dupont', 'userPassword': 'right'})
+    pool = make_pool(server, size=1, require_bound=False)
+
+    results = [pool.verify_credentials(user_dn, password) for password in ('bad', 'bad', 'right', 'bad', 'right')]
+
+    assert results == [False, False, True, False, True]
+    # Un mauvais mot de passe ne coûte pas une nouvelle connexion
+    assert pool.stats()['connects'] == 1
+    connection = pool.acquire()
+    assert connection.user == ADMIN_DN
+    pool.release(connection)
+
+
+def test_verify_credentials_rejects_empty_password(ldap_server):
+    server, _ = ldap_server
+    pool = make_pool(server, size=1, require_bound=False)
+    assert pool.verify_credentials('CN=x,DC=example,DC=com', '') is False
+    assert pool.stats()['connects'] == 0
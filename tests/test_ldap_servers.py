@@ -0,0 +1,170 @@
+# tests/test_ldap_servers.py
+
+import socket
+import time
+
+import pytest
+from ldap3 import Server, ServerPool, Connection
+from ldap3.core.exceptions import LDAPException, LDAPSocketOpenError
+
+from ldap_servers import DomainControllerPool, parse_server_list
+
+
+class StubProbe:
+    """
+    Sonde de remplacement : délai injecté par contrôleur (secondes) ou exception à lever.
+    Les délais peuvent être modifiés entre deux sondes pour simuler une dégradation.
+    """
+
+    def __init__(self, delays):
+        self.delays = dict(delays)
+        self.calls = 0
+
+    def __call__(self, server):
+        self.calls += 1
+        delay = self.delays[server.host]
+        if isinstance(delay, Exception):
+            raise delay
+        started = time.monotonic()
+        time.sleep(delay)
+        return time.monotonic() - started
+
+
+def make_pool(delays, **kwargs):
+    probe = StubProbe(delays)
+    pool = DomainControllerPool([(host, 389) for host in delays], 'svc@example.com', 'pw',
+                                use_ssl=False, probe=probe, **kwargs)
+    return pool, probe
+
+
+def hosts(servers):
+    return [server.host for server in servers]
+
+
+def test_parse_server_list():
+    assert parse_server_list('dc1.example.com, dc2.example.com:3269,,', 636) == [
+        ('dc1.example.com', 636), ('dc2.example.com', 3269)]
+    assert parse_server_list(None, 636) == []
+
+
+def test_servers_are_ordered_by_probed_latency():
+    pool, _ = make_pool({'dc-lent': 0.03, 'dc-rapide': 0.001, 'dc-moyen': 0.01})
+    # Avant toute mesure : ordre de configuration
+    assert hosts(pool.ordered_servers()) == ['dc-lent', 'dc-rapide', 'dc-moyen']
+    pool.probe_all()
+    assert hosts(pool.ordered_servers()) == ['dc-rapide', 'dc-moyen', 'dc-lent']
+    server_pool = pool.server_pool()
+    assert isinstance(server_pool, ServerPool)
+    assert hosts(server_pool.servers) == ['dc-rapide', 'dc-moyen', 'dc-lent']
+
+
+def test_latency_is_smoothed_over_probes():
+    pool, probe = make_pool({'dc1': 0.001, 'dc2': 0.02}, alpha=0.5)
+    pool.probe_all()
+    probe.delays['dc1'] = 0.04
+    pool.probe_all()
+    # Moyenne de 1 ms et 40 ms à 0,5 : environ 20 ms, encore proche de dc2
+    latency = {entry['host']: entry['latency_ms'] for entry in pool.stats()}
+    assert 15 <= latency['dc1'] <= 35
+    pool.probe_all()
+    assert hosts(pool.ordered_servers()) == ['dc2', 'dc1']
+
+
+def test_failed_probe_moves_the_server_last_until_it_answers_again():
+    pool, probe = make_pool({'dc1': 0.001, 'dc2': 0.01})
+    probe.delays['dc1'] = OSError('connexion refusée')
+    pool.probe_all()
+    assert hosts(pool.ordered_servers()) == ['dc2', 'dc1']
+    stats = {entry['host']: entry for entry in pool.stats()}
+    assert stats['dc1']['up'] is False
+    assert stats['dc1']['failures'] == 1
+    assert 'connexion refusée' in stats['dc1']['last_error']
+
+    probe.delays['dc1'] = 0.001
+    pool.probe_all()
+    assert hosts(pool.ordered_servers()) == ['dc1', 'dc2']
+    assert all(entry['up'] for entry in pool.stats())
+
+
+def test_mark_failed_and_observe_readmit_without_probe():
+    pool, probe = make_pool({'dc-unique': 0.001})
+    (server,) = pool.servers
+    pool.mark_failed(server, LDAPSocketOpenError('timeout'))
+    assert pool.stats()[0]['up'] is False
+    # Un seul contrôleur : toujours proposé (pas de ServerPool), puis réadmis au premier succès
+    assert pool.server_pool() is server
+    pool.observe(server, 0.005)
+    assert pool.stats()[0]['up'] is True
+    assert probe.calls == 0
+
+
+def test_foreign_servers_are_ignored():
+    pool, _ = make_pool({'dc1': 0.001, 'dc2': 0.001})
+    stranger = Server('ailleurs')
+    pool.mark_failed(stranger)
+    pool.observe(stranger, 1.0)
+    assert all(entry['up'] and entry['failures'] == 0 for entry in pool.stats())
+
+
+def test_background_probe_reorders_servers():
+    pool, probe = make_pool({'dc1': 0.02, 'dc2': 0.001}, probe_interval=0.05)
+    pool.start()
+    try:
+        deadline = time.monotonic() + 2
+        while probe.calls < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert hosts(pool.ordered_servers()) == ['dc2', 'dc1']
+        probe.delays['dc2'] = RuntimeError('sonde en échec')
+        calls = probe.calls
+        while probe.calls < calls + 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert hosts(pool.ordered_servers()) == ['dc1', 'dc2']
+    finally:
+        pool.stop()
+
+
+def test_start_is_a_no_op_with_a_single_server():
+    pool, probe = make_pool({'dc-unique': 0.001}, probe_interval=0.01)
+    pool.start()
+    time.sleep(0.05)
+    assert probe.calls == 0
+
+
+@pytest.fixture
+def listening_port():
+    """Port local qui accepte les connexions TCP (contrôleur joignable)."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(8)
+        yield sock.getsockname()[1]
+
+
+@pytest.fixture
+def closed_port():
+    """Port local sur lequel rien n'écoute (contrôleur injoignable, connexion refusée)."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_server_pool_fails_over_to_the_next_controller(listening_port, closed_port):
+    pool = DomainControllerPool([('127.0.0.1', closed_port), ('127.0.0.1', listening_port)],
+                                'svc@example.com', 'pw', use_ssl=False, connect_timeout=1,
+                                probe=StubProbe({'127.0.0.1': 0.001}))
+    connection = Connection(pool.server_pool())
+    try:
+        connection.open()
+        assert connection.server.port == listening_port
+    finally:
+        connection.unbind()
+
+
+def test_server_pool_raises_when_every_controller_is_down(closed_port):
+    pool = DomainControllerPool([('127.0.0.1', closed_port), ('localhost', closed_port)],
+                                'svc@example.com', 'pw', use_ssl=False, connect_timeout=1,
+                                probe=StubProbe({'127.0.0.1': 0.001, 'localhost': 0.001}))
+    started = time.monotonic()
+    with pytest.raises(LDAPException):
+        Connection(pool.server_pool()).open()
+    # Un seul tour du ServerPool, sans l'attente par défaut de ldap3 entre deux tours
+    assert time.monotonic() - started < 5
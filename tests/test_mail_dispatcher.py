@@ -0,0 +1,99 @@
+# tests/test_mail_dispatcher.py
+
+import socket
+
+import pytest
+from aiosmtpd.controller import Controller
+from flask import Flask
+from flask_mail import Mail, Message
+
+from mail_utils import MailDispatcher
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((session.peer, envelope.rcpt_tos))
+        return '250 OK'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+
+@pytest.fixture
+def app(smtp_server):
+    controller, _ = smtp_server
+    app = Flask('tests')
+    app.config.update(
+        MAIL_SERVER='127.0.0.1',
+        MAIL_PORT=controller.port,
+        MAIL_USE_TLS=False,
+        MAIL_DEFAULT_SENDER='noreply@example.com',
+    )
+    return app
+
+
+def message(number):
+    return Message(f"Message {number}", recipients=['rh@example.com'], body="Test")
+
+
+def test_messages_share_one_smtp_session(app, smtp_server):
+    _, handler = smtp_server
+    dispatcher = MailDispatcher(Mail(app), idle_timeout=30)
+    with app.app_context():
+        for number in range(5):
+            dispatcher.send(message(number))
+    dispatcher.close()
+    assert len(handler.messages) == 5
+    assert len({peer for peer, _ in handler.messages}) == 1
+    assert dispatcher.sessions_opened == 1
+
+
+def test_lost_session_is_reopened_and_message_resent(app, smtp_server):
+    _, handler = smtp_server
+    dispatcher = MailDispatcher(Mail(app), idle_timeout=30)
+    with app.app_context():
+        dispatcher.send(message(1))
+        dispatcher._connection.host.close()  # coupure de la session côté client
+        dispatcher.send(message(2))
+    dispatcher.close()
+    assert len(handler.messages) == 2
+    assert dispatcher.sessions_opened == 2
+
+
+def test_idle_session_is_closed(app, smtp_server):
+    dispatcher = MailDispatcher(Mail(app), idle_timeout=0.1)
+    with app.app_context():
+        dispatcher.send(message(1))
+    dispatcher._timer.join(1)
+    assert dispatcher._connection is None
+    with app.app_context():
+        dispatcher.send(message(2))
+    dispatcher.close()
+    assert dispatcher.sessions_opened == 2
+
+
+def test_send_batch_reports_each_message(app, smtp_server):
+    _, handler = smtp_server
+    dispatcher = MailDispatcher(Mail(app), idle_timeout=30)
+    with app.app_context():
+        batch = [message(1), Message("Sans destinataire", body="x"), message(3)]
+        errors = dispatcher.send_batch(batch)
+    dispatcher.close()
+    assert errors[0] is None and errors[2] is None
+    assert errors[1] is not None
+    assert len(handler.messages) == 2
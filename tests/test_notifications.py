@@ -0,0 +1,127 @@
+# tests/test_notifications.py
+
+import collections
+import sqlite3
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from notifications import NotificationQueue
+
+
+@pytest.fixture
+def spool_path(tmp_path):
+    return str(tmp_path / 'spool.sqlite3')
+
+
+def make_queue(spool_path, **kwargs):
+    kwargs.setdefault('workers', 1)
+    kwargs.setdefault('retry_base_delay', 0)
+    kwargs.setdefault('poll_interval', 0.05)
+    return NotificationQueue(Flask('tests'), spool_path, **kwargs)
+
+
+def rows(spool_path):
+    with sqlite3.connect(spool_path) as db:
+        return db.execute("SELECT status, payload, attempts, last_error FROM notification_jobs").fetchall()
+
+
+def test_job_is_retried_then_deleted_once_sent(spool_path):
+    queue = make_queue(spool_path, max_attempts=5)
+    calls = []
+
+    def flaky(recipient):
+        calls.append(recipient)
+        if len(calls) < 3:
+            raise ConnectionError("SMTP indisponible")
+
+    queue.register('user_created', flaky)
+    queue.submit('user_created', recipient='rh@example.com')
+    assert queue.join(timeout=5)
+    queue.stop()
+    assert calls == ['rh@example.com'] * 3
+    assert rows(spool_path) == []
+    assert queue.retried == 2 and queue.sent == 1
+
+
+def test_abandoned_job_is_scrubbed_then_purged(spool_path):
+    queue = make_queue(spool_path, max_attempts=2, failed_retention=0.2)
+
+    def failing(**payload):
+        raise RuntimeError("refusé")
+
+    queue.register('user_created', failing)
+    queue.submit('user_created', password='Mot2Passe!')
+    assert queue.join(timeout=5)
+    queue.stop()
+    [(status, payload, attempts, error)] = rows(spool_path)
+    assert (status, payload, attempts) == ('failed', '{}', 2)
+    assert 'refusé' in error
+
+    time.sleep(0.25)
+    assert queue.purge() == 1
+    assert rows(spool_path) == []
+
+
+def test_jobs_survive_a_restart(spool_path):
+    # Processus arrêté avant le traitement (aucun thread de traitement)
+    first = make_queue(spool_path, workers=0)
+    first.submit('user_deleted', user='jdupont')
+    first.stop()
+    assert [row[0] for row in rows(spool_path)] == ['pending']
+
+    sent = []
+    second = make_queue(spool_path)
+    second.register('user_deleted', lambda user: sent.append(user))
+    second.start()
+    assert second.join(timeout=5)
+    second.stop()
+    assert sent == ['jdupont']
+
+
+def test_expired_lease_is_taken_over(spool_path):
+    queue = make_queue(spool_path)
+    handled = []
+    queue.register('user_modified', lambda name: handled.append(name))
+    with sqlite3.connect(spool_path) as db:
+        # Notification réservée par un processus disparu, bail expiré
+        db.execute(
+            "INSERT INTO notification_jobs (kind, payload, status, next_attempt, lease_owner, lease_until, created) "
+            "VALUES ('user_modified', '{\"name\": \"jdupont\"}', 'running', 0, 'mort', ?, ?)",
+            (time.time() - 1, time.time())
+        )
+        # Bail encore valide : ne doit pas être repris
+        db.execute(
+            "INSERT INTO notification_jobs (kind, payload, status, next_attempt, lease_owner, lease_until, created) "
+            "VALUES ('user_modified', '{\"name\": \"mdupond\"}', 'running', 0, 'vivant', ?, ?)",
+            (time.time() + 60, time.time())
+        )
+    queue.start()
+    deadline = time.monotonic() + 5
+    while not handled and time.monotonic() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.2)
+    queue.stop()
+    assert handled == ['jdupont']
+
+
+def test_each_job_is_processed_once_across_processes(spool_path):
+    counts = collections.Counter()
+    lock = threading.Lock()
+
+    def handler(number):
+        with lock:
+            counts[number] += 1
+
+    queues = [make_queue(spool_path, workers=2) for _ in range(3)]
+    for queue in queues:
+        queue.register('user_created', handler)
+    for number in range(60):
+        queues[number % 3].submit('user_created', number=number)
+    assert queues[0].join(timeout=10)
+    for queue in queues:
+        queue.stop()
+    assert sorted(counts) == list(range(60))
+    assert set(counts.values()) == {1}
@@ -0,0 +1,120 @@
+# tests/test_rate_limit.py
+
+import sqlite3
+import threading
+import time
+
+from login_guard import LoginThrottle
+from rate_limit import TokenBucket, SlidingWindowLimiter, MemoryWindowStore, SqliteWindowStore
+
+
+def test_token_bucket_allows_the_burst_then_paces():
+    bucket = TokenBucket(rate=20, capacity=5)
+    started = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - started < 0.05
+    for _ in range(4):
+        bucket.acquire()
+    # 4 jetons au-delà de la rafale à 20 par seconde : environ 0,2 s
+    assert 0.15 <= time.monotonic() - started < 0.5
+
+
+def test_token_bucket_is_shared_between_threads():
+    bucket = TokenBucket(rate=50, capacity=1)
+    count = 20
+    started = time.monotonic()
+    threads = [threading.Thread(target=bucket.acquire) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Un jeton initial puis 19 à 50 par seconde, quel que soit le nombre de threads
+    assert time.monotonic() - started >= (count - 1) / 50 * 0.9
+
+
+def test_token_bucket_timeout_and_unlimited_rate():
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.acquire(timeout=0.01)
+    assert not bucket.acquire(timeout=0.01)
+    assert TokenBucket(rate=0).acquire(timeout=0)
+
+
+def test_sliding_window_limit_and_retry_after():
+    limiter = SlidingWindowLimiter(limit=3, window=60, store=MemoryWindowStore())
+    for _ in range(3):
+        assert limiter.retry_after('jdupont') == 0
+        limiter.hit('jdupont')
+    assert 59 <= limiter.retry_after('jdupont') <= 60
+    assert limiter.retry_after('autre') == 0
+    limiter.reset('jdupont')
+    assert limiter.retry_after('jdupont') == 0
+
+
+def test_sqlite_store_purges_keys_seen_once(tmp_path):
+    path = str(tmp_path / 'attempts.sqlite3')
+    store = SqliteWindowStore(path, purge_every=50)
+    limiter = SlidingWindowLimiter(limit=5, window=0.2, store=store)
+    for i in range(100):
+        limiter.hit(f'spray-{i}')
+    time.sleep(0.25)
+    for i in range(50):
+        limiter.hit(f'other-{i}')
+    with sqlite3.connect(path) as db:
+        remaining = db.execute("SELECT COUNT(*) FROM attempts WHERE key LIKE 'spray-%'").fetchone()[0]
+    assert remaining == 0
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'attempts.sqlite3')
+    first = SlidingWindowLimiter(limit=2, window=60, store=SqliteWindowStore(path))
+    second = SlidingWindowLimiter(limit=2, window=60, store=SqliteWindowStore(path))
+    first.hit('10.0.0.1')
+    second.hit('10.0.0.1')
+    assert first.retry_after('10.0.0.1') > 0
+
+
+def test_try_hit_never_admits_more_than_the_limit(tmp_path):
+    for store in (MemoryWindowStore(), SqliteWindowStore(str(tmp_path / 'attempts.sqlite3'))):
+        limiter = SlidingWindowLimiter(limit=5, window=60, store=store)
+        admitted = []
+        barrier = threading.Barrier(20)
+
+        def attempt():
+            barrier.wait()
+            delay, ts = limiter.try_hit('jdupont')
+            if not delay:
+                admitted.append(ts)
+
+        threads = [threading.Thread(target=attempt) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(admitted) == 5
+        # Les tentatives refusées ne sont pas comptées ; une tentative annulée libère sa place
+        assert store.count('jdupont', time.time(), 60)[0] == 5
+        limiter.refund('jdupont', admitted[0])
+        assert limiter.try_hit('jdupont')[0] == 0
+        assert limiter.try_hit('jdupont')[0] > 0
+
+
+def test_login_throttle_counts_only_failures_per_ip():
+    throttle = LoginThrottle(per_user=5, per_ip=3, window=60)
+    for number in range(10):
+        delay, ticket = throttle.acquire(f'user{number}@example.com', '10.0.0.1')
+        assert delay == 0
+        throttle.succeeded(f'user{number}@example.com', '10.0.0.1', ticket)
+    for number in range(3):
+        assert throttle.acquire(f'intrus{number}@example.com', '10.0.0.1')[0] == 0
+    delay, ticket = throttle.acquire('user0@example.com', '10.0.0.1')
+    assert delay > 0 and ticket is None
+    assert throttle.rejected == 1
+
+
+def test_login_throttle_rejection_on_ip_does_not_count_against_the_user():
+    throttle = LoginThrottle(per_user=2, per_ip=1, window=60)
+    assert throttle.acquire('jdupont@example.com', '10.0.0.1')[0] == 0
+    assert throttle.acquire('jdupont@example.com', '10.0.0.1')[0] > 0
+    assert throttle.acquire('jdupont@example.com', '10.0.0.2')[0] == 0
+    assert throttle.acquire('jdupont@example.com', '10.0.0.3')[0] > 0
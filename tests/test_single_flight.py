@@ -0,0 +1,96 @@
+# tests/test_single_flight.py
+
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight, SingleFlightTimeout, FlightAbandoned
+
+
+def run_concurrently(count, target):
+    results = [None] * count
+    errors = [None] * count
+
+    def call(index):
+        try:
+            results[index] = target()
+        except Exception as e:
+            errors[index] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flights = SingleFlight(timeout=5)
+    executions = []
+    release = threading.Event()
+
+    def slow_search():
+        executions.append(1)
+        release.wait(2)
+        return ['Jean Dupont']
+
+    def call():
+        return flights.do(('search_user', 'dup'), slow_search)
+
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    results, errors = run_concurrently(10, call)
+
+    assert errors == [None] * 10
+    assert results == [['Jean Dupont']] * 10
+    assert len(executions) == 1
+    assert flights.stats()['coalesced'] == 9
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_nothing_is_kept_after_completion():
+    flights = SingleFlight()
+    calls = []
+    for _ in range(3):
+        flights.do('key', lambda: calls.append(1))
+    assert len(calls) == 3
+
+
+def test_error_is_shared_with_waiters():
+    flights = SingleFlight(timeout=5)
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.2)
+        raise ValueError("annuaire indisponible")
+
+    def call():
+        return flights.do('key', failing)
+
+    _, errors = run_concurrently(4, call)
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert flights.stats()['executed'] == 1
+
+
+def test_waiter_times_out():
+    flights = SingleFlight(timeout=0.1)
+    flight, leader = flights.begin('key')
+    assert leader
+    _, follower = flights.begin('key')
+    assert not follower
+    with pytest.raises(SingleFlightTimeout):
+        flights.wait(flight)
+    assert flights.stats()['timeouts'] == 1
+    flights.complete('key', flight, 'ok')
+    assert flights.wait(flight) == 'ok'
+
+
+def test_interrupted_leader_is_reported_as_abandoned():
+    flights = SingleFlight(timeout=1)
+    flight, _ = flights.begin('key')
+    flights.fail('key', flight, GeneratorExit())
+    with pytest.raises(FlightAbandoned):
+        flights.wait(flight)
@@ -0,0 +1,109 @@
+# tests/test_sweeper.py
+
+import datetime
+import json
+
+import pytest
+from ldap3 import Server, Connection, MOCK_SYNC
+
+import delete_expired_users as sweeper
+from conftest import ADMIN_DN, ADMIN_PASSWORD, BASE_DN
+from ldap_pool import LdapConnectionPool
+
+EXPIRED_ACCOUNTS = 2000
+FUTURE_ACCOUNTS = 50
+
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    """
+    Annuaire simulé peuplé de comptes désactivés échus, à venir et actifs. Le schéma AD
+    hors ligne de ldap3 ne connaît pas extensionAttribute1 (attribut Exchange) : le
+    serveur simulé est donc créé sans schéma.
+    """
+    server = Server('mock-dc')
+    seed = Connection(server, user=ADMIN_DN, password=ADMIN_PASSWORD, client_strategy=MOCK_SYNC)
+    seed.strategy.add_entry(ADMIN_DN, {'cn': 'svc', 'userPassword': ADMIN_PASSWORD, 'objectClass': ['top', 'user']})
+    seed.bind()
+    now = datetime.datetime.now()
+    for i in range(EXPIRED_ACCOUNTS):
+        due = (now - datetime.timedelta(days=1 + i % 90, minutes=i)).strftime(sweeper.DATE_FORMAT)
+        seed.strategy.add_entry(f'CN=Expire {i},OU=Staff,{BASE_DN}', {
+            'cn': f'Expire {i}', 'objectClass': ['top', 'user'],
+            'userAccountControl': '514', 'extensionAttribute1': due,
+        })
+    for i in range(FUTURE_ACCOUNTS):
+        due = (now + datetime.timedelta(days=1 + i)).strftime(sweeper.DATE_FORMAT)
+        seed.strategy.add_entry(f'CN=Futur {i},OU=Staff,{BASE_DN}', {
+            'cn': f'Futur {i}', 'objectClass': ['top', 'user'],
+            'userAccountControl': '514', 'extensionAttribute1': due,
+        })
+    seed.strategy.add_entry(f'CN=Actif,OU=Staff,{BASE_DN}', {
+        'cn': 'Actif', 'objectClass': ['top', 'user'], 'userAccountControl': '512',
+        'extensionAttribute1': (now - datetime.timedelta(days=3)).strftime(sweeper.DATE_FORMAT),
+    })
+
+    sent = []
+    monkeypatch.setattr(sweeper, 'BASE_DN', BASE_DN)
+    monkeypatch.setattr(sweeper, 'LOG_FILE', str(tmp_path / 'suppression.log'))
+    monkeypatch.setattr(sweeper, 'SWEEPER_STATE_FILE', str(tmp_path / 'state.json'))
+    monkeypatch.setattr(sweeper, 'SWEEPER_RATE', 0)
+    monkeypatch.setattr(sweeper, 'SWEEPER_DIGEST', True)
+    monkeypatch.setattr(sweeper, 'send_digest_email', lambda mail, recipient, events: sent.append(events))
+
+    pool = LdapConnectionPool(server, ADMIN_DN, ADMIN_PASSWORD, size=4, client_strategy=MOCK_SYNC)
+    yield pool, seed, sent
+    pool.close()
+
+
+def remaining(seed, search_filter):
+    seed.search(BASE_DN, search_filter, attributes=['cn'])
+    return len(seed.entries)
+
+
+def test_sweep_deletes_every_expired_account(directory):
+    pool, seed, sent = directory
+
+    summary = sweeper.run_sweep(pool, workers=4)
+
+    assert summary['deleted'] == EXPIRED_ACCOUNTS
+    assert summary['failed'] == 0
+    assert summary['full_scan'] is True
+    assert remaining(seed, '(cn=Expire*)') == 0
+    assert remaining(seed, '(cn=Futur*)') == FUTURE_ACCOUNTS
+    assert remaining(seed, '(cn=Actif)') == 1
+    assert len(sent) == 1 and len(sent[0]) == EXPIRED_ACCOUNTS
+    # Les connexions sont réutilisées par les threads de suppression
+    assert pool.stats()['connects'] <= 4
+    with open(sweeper.SWEEPER_STATE_FILE, encoding='utf-8') as fp:
+        state = json.load(fp)
+    assert state['failed'] == [] and state['last_run'] == state['last_full_scan']
+
+
+def test_second_run_only_reads_new_due_dates(directory):
+    pool, _, _ = directory
+    sweeper.run_sweep(pool, workers=4)
+
+    summary = sweeper.run_sweep(pool, workers=4)
+
+    assert summary['deleted'] == 0
+    assert summary['full_scan'] is False
+
+
+def test_dry_run_deletes_nothing(directory):
+    pool, seed, sent = directory
+
+    summary = sweeper.run_sweep(pool, dry_run=True, workers=4)
+
+    assert summary['deleted'] == 0
+    assert summary['skipped'] == EXPIRED_ACCOUNTS
+    assert remaining(seed, '(cn=Expire*)') == EXPIRED_ACCOUNTS
+    assert sent == []
+
+
+def test_next_due_date_is_the_closest_future_one(directory):
+    pool, _, _ = directory
+    today = datetime.datetime.now()
+    with pool.connection() as connection:
+        next_due = sweeper.find_next_due_date(connection, today)
+    assert today < next_due <= today + datetime.timedelta(days=1, minutes=1)
@@ -0,0 +1,159 @@
+# token_cache.py
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+
+def token_digest(token):
+    """Empreinte SHA-256 du jeton : le jeton lui-même n'est jamais conservé."""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class VerifiedTokenCache:
+    """
+    Cache des jetons JWT dont la signature et l'expiration ont déjà été vérifiées.
+
+    Les entrées sont indexées par l'empreinte du jeton, conservent les revendications
+    décodées jusqu'à leur `exp` et sont évincées dans l'ordre LRU au-delà de `max_entries`.
+    Seuls les jetons valides sont mis en cache : un jeton invalide est revérifié à chaque fois.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # empreinte -> (exp, revendications)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, digest):
+        """Revendications du jeton s'il est en cache et non expiré, sinon None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            item = self._entries.get(digest)
+            if item is None:
+                self.misses += 1
+                return None
+            if item[0] <= time.time():
+                del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return item[1]
+
+    def put(self, digest, claims):
+        """Enregistre un jeton vérifié ; ignoré s'il ne porte pas de date d'expiration."""
+        if not self.enabled or 'exp' not in claims:
+            return
+        with self._lock:
+            self._entries[digest] = (float(claims['exp']), claims)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, digest):
+        with self._lock:
+            self._entries.pop(digest, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class TokenDenylist:
+    """
+    Liste des jetons révoqués (par /logout) jusqu'à leur expiration.
+
+    La vérification est une simple recherche dans un dictionnaire en mémoire. Si `path`
+    est fourni, les révocations sont aussi écrites dans une base SQLite partagée par tous
+    les processus (workers mod_wsgi) : chaque processus y relit les nouvelles révocations
+    au plus toutes les `sync_interval` secondes.
+    """
+
+    def __init__(self, path=None, sync_interval=2):
+        self.path = path
+        self.sync_interval = sync_interval
+        self._revoked = {}  # empreinte -> exp
+        self._last_id = 0
+        self._last_sync = 0
+        self._lock = threading.Lock()
+        if path:
+            self._init_store()
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=10))
+
+    def _init_store(self):
+        if not os.path.exists(self.path):
+            os.close(os.open(self.path, os.O_CREAT | os.O_WRONLY, 0o600))
+        with self._connect() as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS revoked_tokens ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, digest TEXT NOT NULL, exp REAL NOT NULL)"
+            )
+            db.execute("DELETE FROM revoked_tokens WHERE exp <= ?", (time.time(),))
+
+    def _sync(self, now):
+        """Relit les révocations faites par les autres processus (verrou tenu)."""
+        self._last_sync = now
+        try:
+            with self._connect() as db:
+                rows = db.execute(
+                    "SELECT id, digest, exp FROM revoked_tokens WHERE id > ? ORDER BY id", (self._last_id,)
+                ).fetchall()
+        except sqlite3.Error:
+            logger.exception("Lecture de la liste des jetons révoqués impossible")
+            return
+        for row_id, digest, exp in rows:
+            self._revoked[digest] = exp
+            self._last_id = row_id
+
+    def revoke(self, digest, exp):
+        """Révoque un jeton jusqu'à `exp` (horodatage UNIX)."""
+        now = time.time()
+        with self._lock:
+            # Les déconnexions sont rares : on en profite pour oublier les jetons expirés
+            self._revoked = {key: value for key, value in self._revoked.items() if value > now}
+            self._revoked[digest] = float(exp)
+        if self.path:
+            with self._connect() as db, db:
+                db.execute("INSERT INTO revoked_tokens (digest, exp) VALUES (?, ?)", (digest, float(exp)))
+
+    def is_revoked(self, digest):
+        now = time.time()
+        with self._lock:
+            if self.path and now - self._last_sync >= self.sync_interval:
+                self._sync(now)
+            exp = self._revoked.get(digest)
+            if exp is None:
+                return False
+            if exp <= now:
+                del self._revoked[digest]
+                return False
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {"revoked": len(self._revoked), "shared": bool(self.path)}
@@ -0,0 +1,179 @@
+# user_provisioning.py
+
+import csv
+import io
+import json
+import logging
+import random
+
+from ldap3 import BASE
+from ldap3.utils.conv import escape_filter_chars
+
+logger = logging.getLogger(__name__)
+
+# Code LDAP renvoyé par l'AD quand le sAMAccountName (ou le DN) existe déjà
+RESULT_ENTRY_ALREADY_EXISTS = 68
+
+LOGIN_BATCH_SIZE = 20
+
+NEW_USER_FIELDS = ['fullName', 'firstName', 'lastName', 'new_ou', 'newDescription', 'newOffice',
+                   'newPhoneNumber', 'loginName', 'domain', 'managerDn']
+
+
+def parse_new_user(data):
+    """
+    Valide et normalise la description d'un nouveau collaborateur (corps de /create_user
+    ou ligne d'un lot). `memberOf` peut être une liste de DN, une liste de {'dn': ...}
+    ou une chaîne de DN séparés par des points-virgules (CSV).
+    Lève ValueError si un champ obligatoire manque.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Chaque collaborateur doit être décrit par un objet JSON.")
+    user = {field: str(data.get(field) or '').strip() for field in NEW_USER_FIELDS}
+    if not user['fullName'] or not user['firstName'] or not user['lastName'] or not user['new_ou']:
+        raise ValueError("Les champs fullName, firstName, lastName et new_ou sont obligatoires.")
+    member_of = data.get('memberOf') or []
+    if isinstance(member_of, str):
+        member_of = member_of.split(';')
+    user['memberOf'] = [(g["dn"] if isinstance(g, dict) else g).strip() for g in member_of]
+    return user
+
+
+def parse_user_batch(content, batch_format):
+    """
+    Lit un lot de nouveaux collaborateurs au format 'json' (liste d'objets, ou objet
+    {"users": [...]}) ou 'csv' (en-têtes identiques aux champs de /create_user).
+    """
+    if batch_format == 'csv':
+        return list(csv.DictReader(io.StringIO(content)))
+    if batch_format == 'json':
+        rows = json.loads(content) if isinstance(content, str) else content
+        if isinstance(rows, dict):
+            rows = rows.get('users', [])
+        if not isinstance(rows, list):
+            raise ValueError("Le lot JSON doit être une liste de collaborateurs.")
+        return rows
+    raise ValueError(f"Format de lot inconnu : {batch_format}")
+
+
+def login_candidates(first_name, last_name, login_name=''):
+    """
+    Génère les identifiants candidats dans l'ordre de préférence historique :
+    login demandé (ou initiale + nom), puis 2, 3... lettres du prénom + nom,
+    puis prénom + nom suivis d'un chiffre, puis de deux chiffres (ordre aléatoire).
+    """
+    first = first_name.lower()
+    last = last_name.lower()
+    yield login_name or first[:1] + last
+    for i in range(2, len(first) + 1):
+        yield first[:i] + last
+    for width in (1, 2):
+        suffixes = [str(n).zfill(width) for n in range(10 ** width)]
+        random.shuffle(suffixes)
+        for suffix in suffixes:
+            yield first + last + suffix
+
+
+def allocate_login(ldap_connection, base_dn, candidates, taken=None):
+    """
+    Renvoie le premier identifiant libre parmi `candidates`.
+
+    Les candidats sont vérifiés par lots de LOGIN_BATCH_SIZE avec une seule recherche
+    `(|(sAMAccountName=a)(sAMAccountName=b)...)` par lot, au lieu d'une recherche par
+    candidat. `taken` (ensemble d'identifiants en minuscules) permet d'exclure en plus
+    des identifiants déjà réservés localement.
+    """
+    taken = taken or set()
+    seen = set()
+    batch = []
+    candidates = iter(candidates)
+    while True:
+        batch.clear()
+        for candidate in candidates:
+            key = candidate.lower()
+            if key in seen or key in taken:
+                continue
+            seen.add(key)
+            batch.append(candidate)
+            if len(batch) >= LOGIN_BATCH_SIZE:
+                break
+        if not batch:
+            raise ValueError("Aucun identifiant disponible pour ce collaborateur.")
+
+        search_filter = "(|" + "".join(f"(sAMAccountName={escape_filter_chars(c)})" for c in batch) + ")"
+        ldap_connection.search(base_dn, search_filter, attributes=['sAMAccountName'])
+        existing = {str(entry.sAMAccountName).lower() for entry in ldap_connection.entries}
+        for candidate in batch:
+            if candidate.lower() not in existing:
+                return candidate
+        logger.debug("Lot de %s identifiants déjà pris, lot suivant.", len(batch))
+
+
+def build_user_attributes(full_name, first_name, last_name, login_name, domain, password,
+                          description='', office='', phone_number='', manager_dn=''):
+    """Construit les attributs LDAP d'un nouveau compte utilisateur actif."""
+    attributes = {
+        "objectClass": ["top", "person", "organizationalPerson", "user"],
+        "cn": full_name,
+        "sn": last_name,
+        "givenName": first_name,
+        "displayName": full_name,
+        "userPrincipalName": login_name + domain,
+        "sAMAccountName": login_name,
+        "mail": login_name + domain,
+        "unicodePwd": f'"{password}"'.encode('utf-16-le'),
+        "userAccountControl": 512
+    }
+    if description:
+        attributes["description"] = description
+    if office:
+        attributes["physicalDeliveryOfficeName"] = office
+    if phone_number:
+        attributes["telephoneNumber"] = phone_number
+        attributes["homePhone"] = phone_number
+    if manager_dn:
+        attributes["manager"] = manager_dn
+    return attributes
+
+
+def dn_exists(ldap_connection, dn):
+    """Vrai si une entrée existe déjà sous ce DN (recherche de portée BASE)."""
+    ldap_connection.search(dn, '(objectClass=*)', search_scope=BASE, attributes=['1.1'])
+    return bool(ldap_connection.entries)
+
+
+def add_user_with_unique_login(ldap_connection, base_dn, new_dn, first_name, last_name,
+                               requested_login, build_attributes, taken=None, retries=3):
+    """
+    Choisit un identifiant libre et crée le compte sur la même connexion.
+
+    `build_attributes(login)` renvoie les attributs du compte pour l'identifiant retenu.
+    Si l'ajout échoue avec entryAlreadyExists alors qu'aucune entrée n'existe sous
+    `new_dn` (identifiant pris entre la vérification et l'ajout par une création
+    concurrente), l'identifiant est écarté et l'allocation est relancée, au plus `retries`
+    fois. Si c'est le DN qui existe déjà (même CN dans l'OU), changer d'identifiant ne
+    servirait à rien : l'échec est renvoyé tout de suite.
+    Renvoie (succès, identifiant) ; en cas d'échec, ldap_connection.result contient le détail.
+    """
+    taken = set() if taken is None else taken
+    login = None
+    for attempt in range(1, retries + 1):
+        login = allocate_login(
+            ldap_connection, base_dn,
+            login_candidates(first_name, last_name, requested_login),
+            taken
+        )
+        if ldap_connection.add(new_dn, attributes=build_attributes(login)):
+            taken.add(login.lower())
+            return True, login
+        if ldap_connection.result.get('result') != RESULT_ENTRY_ALREADY_EXISTS:
+            break
+        add_result = ldap_connection.result
+        if dn_exists(ldap_connection, new_dn):
+            logger.warning("Création de %s impossible : une entrée existe déjà sous ce DN.", new_dn)
+            ldap_connection.result = add_result
+            break
+        logger.warning("Identifiant %s pris pendant la création (tentative %s/%s).", login, attempt, retries)
+        taken.add(login.lower())
+    return False, login
+